@@ -0,0 +1,231 @@
+"""BatchAnnotation.
+
+Back annotation of many candidate placements (.pl) of one EAGLE board (.brd).
+
+The board is indexed and the element geometry (package extents and pin offsets) and the netlist are
+computed once. The candidates are then applied in parallel worker processes, which get that prepared
+state when they start instead of parsing the board again. Each candidate is written like
+bookshelf2eagle.py --patch: only the x, y and rot attributes of the placed elements change.
+
+For every candidate the half perimeter wire length (HPWL) and the Steiner tree estimate (RSMT, see
+wirelength.py) of the signals, with the pins at their rotated positions, and the total overlap area
+of the placed element bounding boxes are reported.
+
+The board for <DIR>/<NAME>.pl is written to <OUTPUT_DIR>/<NAME>.brd.
+
+Usage:
+  batch_annotation.py -h | --help
+  batch_annotation.py --brd <BRD> --output_dir <OUTPUT_DIR> [--clusters <CLUSTERS>] [--jobs <N>] [--summary <FILE>] <PL>...
+
+-h --help                      Show this message.
+-i --brd BRD                   The EAGLE .brd file.
+-o --output_dir OUTPUT_DIR     The directory for the updated boards.
+--clusters CLUSTERS            Cluster map written by eagle2bookshelf2012.py --cluster (see bookshelf2eagle.py).
+-j --jobs N                    Number of worker processes [default: 4].
+-s --summary FILE              Also write the summary as tab separated values.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+import mmap
+import multiprocessing
+import os
+import sys
+import time
+
+from spatial_index import BoardIndex
+
+
+_state = None # (board bytes, element tags, nets, cluster map) in the worker processes
+
+
+def prepare(brd_file):
+	"""Element tags (see bookshelf2eagle.element_tags) and nets [(signal, [(element, pad)])] of a board."""
+	from bookshelf2eagle import element_tags
+	from lazy_board import LazyBoard
+
+	board = LazyBoard.from_file(brd_file)
+	try:
+		tags = element_tags(board)
+		nets = [
+			(n.get('name'), [(c.get('element'), c.get('pad')) for c in n.findall('contactref')])
+			for n in board.signal_nodes()
+		]
+	finally:
+		board.close()
+	return tags, nets
+
+
+def pin_position(e, pin_name):
+	"""Board coordinates of a pin of a placed ElementEntry."""
+	(x, y) = e.variants().variant(e.rotation).pins[pin_name]
+	return (e.x_loc + x, e.y_loc + y)
+
+
+def wirelength(elements, nets):
+	"""(HPWL, RSMT estimate) summed over the nets."""
+	from wirelength import estimate
+
+	total_hpwl = 0.0
+	total_rsmt = 0.0
+	for name, pins in nets:
+		if len(pins) < 2:
+			continue
+		points = [pin_position(elements[element], pad) for element, pad in pins]
+		(h, rmst, rsmt) = estimate([p[0] for p in points], [p[1] for p in points])
+		total_hpwl += h
+		total_rsmt += rsmt
+	return total_hpwl, total_rsmt
+
+
+def overlap(elements):
+	"""(total overlap area, number of overlapping pairs) of the placed bounding boxes."""
+	index = BoardIndex.from_elements(elements)
+	area = 0.0
+	pairs = 0
+	for name in index.boxes:
+		a = index.boxes[name]
+		for other in index.query_rect(*a):
+			if other <= name:
+				continue
+			b = index.boxes[other]
+			w = min(a[2], b[2]) - max(a[0], b[0])
+			h = min(a[3], b[3]) - max(a[1], b[1])
+			if w > 0 and h > 0:
+				area += w * h
+				pairs += 1
+	return area, pairs
+
+
+def _init_worker(brd_file, tags, nets, cluster_map):
+	global _state
+	with open(brd_file, 'rb') as f:
+		buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	_state = (buffer, tags, nets, cluster_map)
+
+
+def annotate(candidate):
+	"""Apply one (pl file, out file) candidate to the prepared board. Returns its summary dict."""
+	from bookshelf2eagle import read_pl2, patch_board
+	from cluster import expand_placements
+
+	(buffer, tags, nets, cluster_map) = _state
+	(pl_file, out_file) = candidate
+	start = time.time()
+	try:
+		pl_info = read_pl2(pl_file)
+		if cluster_map is not None:
+			pl_info = expand_placements(pl_info, cluster_map)
+		elements = patch_board(buffer, tags, pl_info, out_file)
+		area, pairs = overlap(elements)
+		total_hpwl, total_rsmt = wirelength(elements, nets)
+		return {
+			'pl': pl_file,
+			'out': out_file,
+			'placed': sum(1 for name in elements if name in pl_info),
+			'hpwl': total_hpwl,
+			'rsmt': total_rsmt,
+			'overlap': area,
+			'overlapping_pairs': pairs,
+			'seconds': time.time() - start,
+			'error': None,
+		}
+	except Exception as e:
+		return {'pl': pl_file, 'out': out_file, 'error': repr(e)}
+
+
+def run_batch_annotation(brd_file, candidates, jobs=4, cluster_file=None):
+	"""Apply the (pl file, out file) candidates to brd_file. Returns the summaries in the order of candidates."""
+	from cluster import read_cluster_map
+
+	candidates = list(candidates)
+	tags, nets = prepare(brd_file)
+	cluster_map = read_cluster_map(cluster_file) if cluster_file is not None else None
+	state = (brd_file, tags, nets, cluster_map)
+
+	if jobs <= 1 or len(candidates) <= 1:
+		_init_worker(*state)
+		return [annotate(c) for c in candidates]
+	pool = multiprocessing.Pool(min(jobs, len(candidates)), initializer=_init_worker, initargs=state)
+	try:
+		return pool.map(annotate, candidates)
+	finally:
+		pool.close()
+		pool.join()
+
+
+SUMMARY_COLUMNS = ('pl', 'out', 'placed', 'hpwl', 'rsmt', 'overlap', 'overlapping_pairs', 'seconds', 'error')
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='batch_annotation v0.1')
+	output_dir = str(arguments['--output_dir'])
+	if not os.path.isdir(output_dir):
+		os.makedirs(output_dir)
+	candidates = [
+		(str(p), os.path.join(output_dir, os.path.splitext(os.path.basename(str(p)))[0] + '.brd'))
+		for p in arguments['<PL>']
+	]
+
+	start = time.time()
+	summaries = run_batch_annotation(
+		str(arguments['--brd']),
+		candidates,
+		jobs=int(arguments['--jobs']),
+		cluster_file=arguments['--clusters'],
+	)
+
+	print('hpwl'.rjust(14) + ' ' + 'rsmt'.rjust(14) + ' ' + 'overlap'.rjust(14) + ' ' + 'pairs'.rjust(6) + '  ' + 'placement')
+	for s in summaries:
+		if s['error'] is not None:
+			print('failed: ' + s['pl'] + ': ' + s['error'])
+			continue
+		print(('%.4f' % s['hpwl']).rjust(14) + ' ' + ('%.4f' % s['rsmt']).rjust(14) + ' ' + ('%.4f' % s['overlap']).rjust(14) + ' ' + str(s['overlapping_pairs']).rjust(6) + '  ' + s['pl'])
+	good = [s for s in summaries if s['error'] is None]
+	if good:
+		best = min(good, key=lambda s: (s['overlap'], s['rsmt']))
+		print('best: ' + best['pl'] + ' -> ' + best['out'])
+	print(str(len(summaries)) + ' placements in ' + str(round(time.time() - start, 3)) + ' s, ' + str(len(summaries) - len(good)) + ' errors')
+
+	if arguments['--summary']:
+		with open(str(arguments['--summary']), 'w') as f:
+			f.write('\t'.join(SUMMARY_COLUMNS) + '\n')
+			for s in summaries:
+				f.write('\t'.join('' if s.get(c) is None else str(s.get(c)) for c in SUMMARY_COLUMNS) + '\n')
+
+	sys.exit(1 if len(good) < len(summaries) else 0)
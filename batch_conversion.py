@@ -0,0 +1,217 @@
+"""BatchConversion.
+
+Pipelined conversion of many EAGLE boards (.brd) to bookshelf.
+
+Three stages overlap: a parser thread loads the next board (eagle2bookshelf2012.load_board), the
+main thread converts the current one (conversion_outputs) and a pool of writer threads writes the
+files of the previous ones. The stages are connected by bounded queues, so at most --queue parsed
+boards and --queue pending files are held in memory. On network mounted project directories this
+hides most of the write latency.
+
+The outputs of board <DIR>/<NAME>.brd are written to <OUTPUT_DIR>/<NAME>.*.
+
+Usage:
+  batch_conversion.py -h | --help
+  batch_conversion.py --output_dir <OUTPUT_DIR> --userid <USERID> [--weights [--class_weights <W>]] [--cluster] [--fanout_threshold <N>] [--fanout_mode <MODE>] [--binary] [--lazy] [--writers <N>] [--queue <N>] <BRD>...
+
+-h --help                      Show this message.
+-o --output_dir OUTPUT_DIR     The directory for the new files.
+--userid USERID                Your name and contact.
+--weights                      Derive net weights (see eagle2bookshelf2012.py).
+--class_weights W              Comma separated CLASS=WEIGHT net class weights (see eagle2bookshelf2012.py).
+--cluster                      Cluster small components (see eagle2bookshelf2012.py).
+--fanout_threshold N           Handle nets with more than N pins (see eagle2bookshelf2012.py).
+--fanout_mode MODE             One of filter, star or weight [default: weight].
+--binary                       Also write <NAME>.bsb.
+--lazy                         Only parse the library packages the elements use.
+-w --writers N                 Number of writer threads [default: 4].
+-q --queue N                   Length of the parsed board and pending file queues [default: 2].
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import sys
+import threading
+import time
+
+try:
+	import queue
+except ImportError: # python 2
+	import Queue as queue
+
+
+_DONE = object()
+
+
+class WriterPool(object):
+	"""Threads writing files from a bounded queue. errors is a list of (owner, exception)."""
+	def __init__(self, writers=4, queue_size=2):
+		super(WriterPool, self).__init__()
+		self.files = queue.Queue(maxsize=queue_size)
+		self.errors = []
+		self.written = 0
+		self.lock = threading.Lock()
+		self.threads = [threading.Thread(target=self._run) for i in range(writers)]
+		for t in self.threads:
+			t.daemon = True
+			t.start()
+
+	def _run(self):
+		from eagle2bookshelf2012 import write_outputs
+
+		while True:
+			item = self.files.get()
+			if item is _DONE:
+				return
+			(fname, contents, owner) = item
+			try:
+				write_outputs([(fname, contents)])
+				with self.lock:
+					self.written += 1
+			except Exception as e:
+				with self.lock:
+					self.errors.append((owner, e))
+
+	def put(self, fname, contents, owner=None):
+		"""Queue a file, blocking while the queue is full."""
+		self.files.put((fname, contents, owner))
+
+	def close(self):
+		"""Wait for all queued files to be written."""
+		for t in self.threads:
+			self.files.put(_DONE)
+		for t in self.threads:
+			t.join()
+
+
+def _put(items, item, stop):
+	"""Put item on the bounded queue items unless stop is set first. Returns False if stopped."""
+	while not stop.is_set():
+		try:
+			items.put(item, timeout=0.1)
+			return True
+		except queue.Full:
+			pass
+	return False
+
+
+def _parse_boards(jobs, lazy, parsed, stop):
+	"""Parser thread: load the boards in order into the parsed queue, until stop is set."""
+	from eagle2bookshelf2012 import load_board
+
+	for brd_file, project_name in jobs:
+		if stop.is_set():
+			return
+		try:
+			item = (brd_file, project_name, load_board(brd_file, lazy=lazy), None)
+		except Exception as e:
+			item = (brd_file, project_name, None, e)
+		if not _put(parsed, item, stop):
+			return
+	_put(parsed, _DONE, stop)
+
+
+def run_batch(jobs, user_id, lazy=False, writers=4, queue_size=2, **options):
+	"""Convert the (brd file, project name) pairs in jobs. options are passed to conversion_outputs.
+
+	Returns a list of (brd file, error or None) in the order of jobs.
+	"""
+	from eagle2bookshelf2012 import conversion_outputs
+
+	parsed = queue.Queue(maxsize=queue_size)
+	stop = threading.Event()
+	parser = threading.Thread(target=_parse_boards, args=(list(jobs), lazy, parsed, stop))
+	parser.daemon = True
+	parser.start()
+	pool = WriterPool(writers=writers, queue_size=queue_size)
+
+	results = []
+	try:
+		while True:
+			item = parsed.get()
+			if item is _DONE:
+				break
+			brd_file, project_name, board, error = item
+			if error is None:
+				try:
+					for fname, contents in conversion_outputs(board, user_id=user_id, project_name=project_name, **options):
+						pool.put(fname, contents, owner=len(results))
+				except Exception as e:
+					error = e
+			results.append((brd_file, error))
+	finally:
+		stop.set() # the parser may be waiting on the full queue if we leave early
+		pool.close()
+		parser.join()
+
+	write_errors = {}
+	for owner, error in pool.errors:
+		write_errors.setdefault(owner, error)
+	return [(brd_file, error or write_errors.get(i)) for i, (brd_file, error) in enumerate(results)]
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+	from net_weights import parse_class_weights
+
+	arguments = docopt(__doc__, version='batch_conversion v0.1')
+	output_dir = str(arguments['--output_dir'])
+	if not os.path.isdir(output_dir):
+		os.makedirs(output_dir)
+	jobs = [
+		(str(b), os.path.join(output_dir, os.path.splitext(os.path.basename(str(b)))[0]))
+		for b in arguments['<BRD>']
+	]
+
+	start = time.time()
+	results = run_batch(
+		jobs,
+		user_id=str(arguments['--userid']),
+		lazy=arguments['--lazy'],
+		writers=int(arguments['--writers']),
+		queue_size=int(arguments['--queue']),
+		weights=arguments['--weights'],
+		class_weights=parse_class_weights(str(arguments['--class_weights'])) if arguments['--class_weights'] else None,
+		cluster=arguments['--cluster'],
+		fanout_threshold=int(arguments['--fanout_threshold']) if arguments['--fanout_threshold'] else None,
+		fanout_mode=str(arguments['--fanout_mode']),
+		binary=arguments['--binary'],
+	)
+	errors = [(name, error) for name, error in results if error is not None]
+	for name, error in errors:
+		print('failed: ' + name + ': ' + repr(error))
+	print(str(len(jobs)) + ' boards in ' + str(round(time.time() - start, 3)) + ' s, ' + str(len(errors)) + ' errors')
+	sys.exit(1 if errors else 0)
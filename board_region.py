@@ -0,0 +1,314 @@
+"""BoardRegion.
+
+Placement region of an EAGLE board (.brd): placement rows (.scl) from the board outline and fixed
+blockage nodes from the keepout and restrict shapes.
+
+The outline is every wire (arcs included) and polygon on the Dimension layer (20) of the <plain>
+section. It does not have to be one ordered loop: the inside is found with the even-odd rule on
+horizontal scanlines, so cutouts become holes. Arcs are split into straight segments of at most
+ARC_STEP_DEGREES. The segments are kept as parallel coordinate lists and every scanline is
+intersected with all of them in one pass.
+
+Rows are row_height high and start at the lowest point of the outline. A row gets one subrow per
+stretch of the outline that is inside over the whole row height, snapped inwards to the site grid.
+
+Rectangles, circles, wires and polygons on the keepout and restrict layers become blockage nodes.
+Polygons are cut into horizontal slabs at their vertices and each slab is covered by a rectangle,
+which is exact for rectilinear keepouts and conservative for the others.
+
+Usage:
+  board_region.py -h | --help
+  board_region.py --brd <BRD> --output_prfx <STEM_NAME> --userid <USERID> [--row_height <H>] [--site_width <W>]
+
+-h --help                      Show this message.
+-i --brd BRD                   The EAGLE .brd file.
+-o --output_prfx STEM_NAME     Writes <STEM_NAME>.scl. Includes directory.
+--userid USERID                Your name and contact.
+--row_height H                 Row height in board units [default: 1.27].
+--site_width W                 Site width in board units [default: 0.127].
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+import math
+
+
+DIMENSION_LAYER = '20'
+KEEPOUT_LAYERS = {'39': 'tKeepout', '40': 'bKeepout', '41': 'tRestrict', '42': 'bRestrict', '43': 'vRestrict'}
+ARC_STEP_DEGREES = 10.0
+DEFAULT_ROW_HEIGHT = 1.27
+DEFAULT_SITE_WIDTH = 0.127
+EPSILON = 1e-9
+
+
+class Segments(object):
+	"""Straight segments as parallel coordinate lists."""
+	def __init__(self):
+		super(Segments, self).__init__()
+		self.x1 = []
+		self.y1 = []
+		self.x2 = []
+		self.y2 = []
+
+	def __len__(self):
+		return len(self.x1)
+
+	def add_path(self, points, closed=False):
+		if closed:
+			points = list(points) + [points[0]]
+		self.x1.extend(p[0] for p in points[:-1])
+		self.y1.extend(p[1] for p in points[:-1])
+		self.x2.extend(p[0] for p in points[1:])
+		self.y2.extend(p[1] for p in points[1:])
+
+	def bbox(self):
+		"""((x_min, x_max), (y_min, y_max))"""
+		xs = self.x1 + self.x2
+		ys = self.y1 + self.y2
+		return ((min(xs), max(xs)), (min(ys), max(ys)))
+
+	def vertex_ys(self):
+		return sorted(set(self.y1 + self.y2))
+
+	def slab(self, y_lo, y_hi):
+		"""The inside of the horizontal slab y_lo..y_hi, which must not contain a vertex (even-odd rule).
+
+		Returns a list of ((left x at y_lo, left x at y_hi), (right x at y_lo, right x at y_hi)), one per
+		inside stretch from left to right.
+		"""
+		y = (y_lo + y_hi) / 2.0
+		edges = sorted(
+			(x1 + (y - y1) * (x2 - x1) / (y2 - y1), x1 + (y_lo - y1) * (x2 - x1) / (y2 - y1), x1 + (y_hi - y1) * (x2 - x1) / (y2 - y1))
+			for x1, y1, x2, y2 in zip(self.x1, self.y1, self.x2, self.y2)
+			if (y1 <= y < y2) or (y2 <= y < y1)
+		)
+		edges = [e[1:] for e in edges]
+		return list(zip(edges[0::2], edges[1::2]))
+
+
+def arc_points(x1, y1, x2, y2, curve):
+	"""Points of an EAGLE arc from (x1, y1) to (x2, y2) turning curve degrees (counter clockwise if positive)."""
+	theta = math.radians(curve)
+	dx = x2 - x1
+	dy = y2 - y1
+	chord = math.hypot(dx, dy)
+	if chord == 0 or theta == 0:
+		return [(x1, y1), (x2, y2)]
+	d = (chord / 2.0) / math.tan(theta / 2.0) # signed distance of the center from the chord, to the left
+	cx = (x1 + x2) / 2.0 - dy / chord * d
+	cy = (y1 + y2) / 2.0 + dx / chord * d
+	r = math.hypot(x1 - cx, y1 - cy)
+	a0 = math.atan2(y1 - cy, x1 - cx)
+	steps = max(2, int(math.ceil(abs(curve) / ARC_STEP_DEGREES)))
+	points = [(cx + r * math.cos(a0 + theta * i / steps), cy + r * math.sin(a0 + theta * i / steps)) for i in range(steps)]
+	return points + [(x2, y2)]
+
+
+def _float(node, key, default=0.0):
+	value = node.get(key)
+	return default if value is None else float(value)
+
+
+def wire_points(node):
+	x1, y1, x2, y2 = (_float(node, k) for k in ('x1', 'y1', 'x2', 'y2'))
+	if _float(node, 'curve'):
+		return arc_points(x1, y1, x2, y2, _float(node, 'curve'))
+	return [(x1, y1), (x2, y2)]
+
+
+def polygon_points(node):
+	return [(_float(v, 'x'), _float(v, 'y')) for v in node.findall('vertex')]
+
+
+def outline_segments(plain_nodes):
+	"""Segments of the board outline (Dimension layer wires and polygons)."""
+	segments = Segments()
+	for node in plain_nodes:
+		if node.get('layer') != DIMENSION_LAYER:
+			continue
+		if node.tag == 'wire':
+			segments.add_path(wire_points(node))
+		elif node.tag == 'polygon':
+			segments.add_path(polygon_points(node), closed=True)
+		elif node.tag == 'circle':
+			x, y, r = _float(node, 'x'), _float(node, 'y'), _float(node, 'radius')
+			segments.add_path(arc_points(x + r, y, x - r, y, 180) + arc_points(x - r, y, x + r, y, 180)[1:])
+	return segments
+
+
+def intersect_intervals(a, b):
+	result = []
+	i = j = 0
+	while i < len(a) and j < len(b):
+		lo = max(a[i][0], b[j][0])
+		hi = min(a[i][1], b[j][1])
+		if lo < hi:
+			result.append((lo, hi))
+		if a[i][1] < b[j][1]:
+			i += 1
+		else:
+			j += 1
+	return result
+
+
+def band_inside(segments, y_lo, y_hi, vertex_ys):
+	"""x intervals inside the outline for every y in [y_lo, y_hi]."""
+	ys = [y_lo] + [y for y in vertex_ys if y_lo < y < y_hi] + [y_hi]
+	intervals = None
+	for lo, hi in zip(ys, ys[1:]):
+		# edges are straight, so the narrowest point of each stretch is at the bottom or the top of the slab
+		inner = [(max(left), min(right)) for left, right in segments.slab(lo, hi)]
+		intervals = inner if intervals is None else intersect_intervals(intervals, inner)
+	return intervals
+
+
+def placement_rows(segments, row_height=DEFAULT_ROW_HEIGHT, site_width=DEFAULT_SITE_WIDTH):
+	"""bookshelf_bin.Row list covering the inside of the outline."""
+	from bookshelf_bin import Row
+
+	if not len(segments):
+		return []
+	((x_min, x_max), (y_min, y_max)) = segments.bbox()
+	vertex_ys = segments.vertex_ys()
+	rows = []
+	for i in range(int(math.floor((y_max - y_min) / row_height + EPSILON))):
+		y = round(y_min + i * row_height, 9)
+		for lo, hi in band_inside(segments, y, y + row_height, vertex_ys):
+			first = int(math.ceil((lo - x_min) / site_width - EPSILON))
+			last = int(math.floor((hi - x_min) / site_width + EPSILON))
+			if last > first:
+				rows.append(Row(coordinate=y, height=row_height, subrow_origin=round(x_min + first * site_width, 9), num_sites=last - first, site_width=site_width))
+	return rows
+
+
+def slab_rectangles(points):
+	"""Rectangles ((x_min, x_max), (y_min, y_max)) covering a polygon, one per horizontal slab between its vertices."""
+	segments = Segments()
+	segments.add_path(points, closed=True)
+	ys = segments.vertex_ys()
+	rectangles = []
+	for y_lo, y_hi in zip(ys, ys[1:]):
+		# edges are straight, so the widest point of each stretch is at the bottom or the top of the slab
+		for left, right in segments.slab(y_lo, y_hi):
+			rectangles.append(((min(left), max(right)), (y_lo, y_hi)))
+	return rectangles
+
+
+def keepout_rectangles(plain_nodes):
+	"""(layer name, ((x_min, x_max), (y_min, y_max))) of the keepout and restrict shapes."""
+	blockages = []
+	for node in plain_nodes:
+		layer = KEEPOUT_LAYERS.get(node.get('layer'))
+		if layer is None:
+			continue
+		if node.tag == 'rectangle':
+			x1, y1, x2, y2 = (_float(node, k) for k in ('x1', 'y1', 'x2', 'y2'))
+			if node.get('rot') in ('R90', 'R270'): # rotated about the center
+				cx, cy, hw, hh = (x1 + x2) / 2.0, (y1 + y2) / 2.0, abs(y2 - y1) / 2.0, abs(x2 - x1) / 2.0
+				x1, x2, y1, y2 = cx - hw, cx + hw, cy - hh, cy + hh
+			blockages.append((layer, ((min(x1, x2), max(x1, x2)), (min(y1, y2), max(y1, y2)))))
+		elif node.tag == 'circle':
+			r = _float(node, 'radius') + _float(node, 'width') / 2.0
+			x, y = _float(node, 'x'), _float(node, 'y')
+			blockages.append((layer, ((x - r, x + r), (y - r, y + r))))
+		elif node.tag == 'wire':
+			points = wire_points(node)
+			w = _float(node, 'width') / 2.0
+			xs = [p[0] for p in points]
+			ys = [p[1] for p in points]
+			blockages.append((layer, ((min(xs) - w, max(xs) + w), (min(ys) - w, max(ys) + w))))
+		elif node.tag == 'polygon':
+			w = _float(node, 'width') / 2.0
+			for ((x_lo, x_hi), (y_lo, y_hi)) in slab_rectangles(polygon_points(node)):
+				blockages.append((layer, ((x_lo - w, x_hi + w), (y_lo - w, y_hi + w))))
+	return blockages
+
+
+def blockage_elements(blockages):
+	"""Fixed ElementEntry nodes for the keepout rectangles, named BLOCKAGE_<layer>_<i>."""
+	from eagle2bookshelf2012 import ElementEntry
+
+	elements = {}
+	for i, (layer, ((x_min, x_max), (y_min, y_max))) in enumerate(blockages):
+		e = ElementEntry('BLOCKAGE_' + layer + '_' + str(i))
+		e.x_loc = x_min
+		e.y_loc = y_min
+		e.expand_bb(0.0, x_max - x_min, 0.0, y_max - y_min)
+		e.locked = True
+		e.side = {'t': 'top', 'b': 'bottom'}.get(layer[0], 'both') # vRestrict blocks both sides
+		elements[e.name] = e
+	return elements
+
+
+def scl_file_str(rows, user_id):
+	"""Contents of the .scl file."""
+	from eagle2bookshelf2012 import file_header
+
+	scl_str = file_header('scl', user_id)
+	scl_str += 'NumRows : ' + str(len(rows)) + '\n'
+	scl_str += '\n'
+	for row in rows:
+		scl_str += 'CoreRow Horizontal\n'
+		scl_str += '  Coordinate    :   ' + str(row.coordinate) + '\n'
+		scl_str += '  Height        :   ' + str(row.height) + '\n'
+		scl_str += '  Sitewidth     :   ' + str(row.site_width) + '\n'
+		scl_str += '  Sitespacing   :   ' + str(row.site_spacing) + '\n'
+		scl_str += '  Siteorient    :   ' + str(row.site_orient) + '\n'
+		scl_str += '  Sitesymmetry  :   ' + str(row.site_symmetry) + '\n'
+		scl_str += '  SubrowOrigin  :   ' + str(row.subrow_origin) + '  NumSites  :  ' + str(row.num_sites) + '\n'
+		scl_str += 'End\n'
+	return scl_str
+
+
+def load_region(board, row_height=DEFAULT_ROW_HEIGHT, site_width=DEFAULT_SITE_WIDTH):
+	"""(rows, blockage elements) of a lazy_board.LazyBoard."""
+	plain = board.plain_nodes()
+	segments = outline_segments(plain)
+	rows = placement_rows(segments, row_height=row_height, site_width=site_width)
+	blockages = blockage_elements(keepout_rectangles(plain))
+	print('region: ' + str(len(segments)) + ' outline segments, ' + str(len(rows)) + ' rows, ' + str(len(blockages)) + ' blockages')
+	return rows, blockages
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+	from eagle2bookshelf2012 import write_outputs
+	from lazy_board import LazyBoard
+
+	arguments = docopt(__doc__, version='board_region v0.1')
+	board = LazyBoard.from_file(str(arguments['--brd']))
+	rows, blockages = load_region(board, row_height=float(arguments['--row_height']), site_width=float(arguments['--site_width']))
+	write_outputs([(str(arguments['--output_prfx']) + '.scl', scl_file_str(rows, str(arguments['--userid'])))])
@@ -6,14 +6,21 @@ This program was written by Devon Merrill (devon@ucsd.edu).
 
 Usage:
   bookshelf2eagle.py -h | --help
-  bookshelf2eagle.py --brd <BRD> --pl <PL> --out <OUT_NAME>
+  bookshelf2eagle.py --brd <BRD> (--pl <PL>)... --out <OUT_NAME> [--clusters <CLUSTERS>] [--patch]
 
 -h --help                      Show this message.
 -i --brd BRD                   The EAGLE .brd file.
--p --pl PL                     The bookshelf placement file with the updated placements.
+-p --pl PL                     The bookshelf placement file with the updated placements (.pl, or a binary .bsb).
+                               Can be given more than once, e.g. for the top and bottom problems of two_sided.py.
+                               Flipped orientations (FN, FW, FS, FE) put the element on the bottom side (MR0 ...).
 -o --out OUT_NAME              Name for updated EAGLE file that will be created.
+--clusters CLUSTERS            Cluster map written by eagle2bookshelf2012.py --cluster. Placed clusters are expanded to their elements.
+--patch                        Only rewrite the x, y and rot attributes of the placed elements and copy the rest of
+                               the board byte for byte, without loading it into Swoop. Much faster on routed boards.
 """
 
+from __future__ import print_function
+
 LICENCE = """
 BSD 3-Clause License
 
@@ -46,35 +53,59 @@ OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-from __future__ import print_function
-
+import copy
 import datetime
+import re
 
-import Swoop
-from docopt import docopt
+from eagle2bookshelf2012 import load_elements, is_mirrored
+from cluster import read_cluster_map, expand_placements
 
-from eagle2bookshelf2012 import ElementEntry, de_bounding_box
+
+ROT2DEG = {'N':0,'S':180,'E':270,'W':90,'NW':45,'SW':(90+45),'SE':(180+45),'NE':(270+45)}
+ELEMENT_START_TAG = re.compile(br'<element\b(?:[^>"]|"[^"]*")*>')
 
 
 class Component(object):
-	"""Little holder for components info"""
-	def __init__(self, x, y, rotdeg, locked):
+	"""Little holder for components info. Mirrored components are on the bottom side (EAGLE MR...)."""
+	def __init__(self, x, y, rotdeg, locked, mirrored=False):
 		super(Component, self).__init__()
 		self.x = x
 		self.y = y
 		self.rotdeg = rotdeg
-		self.rot = "R" + str(rotdeg)
-		if self.rotdeg == 0:
+		self.mirrored = mirrored
+		self.rot = ("M" if mirrored else "") + "R" + str(rotdeg)
+		if self.rotdeg == 0 and not mirrored:
 			self.rot = None
 		self.locked = locked
 
 
+def make_component(x, y, r, locked):
+	"""Component from a .pl orientation: N, W, ..., flipped FN, FW, ... or EAGLE style R90, MR90."""
+	mirrored = r[0] in 'FM'
+	if mirrored:
+		r = r[1:]
+	if r.startswith('R'): # EAGLE style rotation
+		return Component(x=x, y=y, rotdeg=r.strip().strip('R'), locked=locked, mirrored=mirrored)
+	else: # NSEW style rotation
+		return Component(x=x, y=y, rotdeg=ROT2DEG[r], locked=locked, mirrored=mirrored)
+
+
+def new_rotation(c, rotation):
+	"""The rotation to give an element at rotation for placement c, None to keep its rotation."""
+	if c.rot is None and is_mirrored(rotation):
+		return 'R0' # placed on the top side again
+	return c.rot
+
+
 def read_pl2(fname):
 	"""
 	This is a modification of Chester Holtz code
 	Read & parse .pl (placement) file
 	:param fname: .pl filename
 	"""
+	if fname.endswith('.bsb'):
+		return read_pl_bin(fname)
+
 	with open(fname,'r') as f:
 		lines = f.read().splitlines()
 
@@ -97,13 +128,32 @@ def read_pl2(fname):
 					if '/FIXED' in l[5]:
 						locked = True
 
-				rot2deg = {'N':0,'S':180,'E':270,'W':90,'NW':45,'SW':(90+45),'SE':(180+45),'NE':(270+45)}
+				components[pname] = make_component(newx, newy, r, locked)
+
+	return components
+
+
+def read_placements(pl_file):
+	"""read_pl2() of one placement file, or of a list of them merged (e.g. the top and bottom problems of two_sided.py)."""
+	if isinstance(pl_file, (list, tuple)):
+		components = {}
+		for fname in pl_file:
+			components.update(read_pl2(fname))
+		return components
+	return read_pl2(pl_file)
 
-				if r.startswith('R'): # EAGLE style rotation
-					components[pname] = Component(x=newx, y=newy, rotdeg=r.strip().strip('R'), locked=locked)
-				else: # NSEW style rotation
-					components[pname] = Component(x=newx, y=newy, rotdeg=rot2deg[r], locked=locked)
 
+def read_pl_bin(fname):
+	"""Read the placement out of a binary bookshelf container (see bookshelf_bin.py)"""
+	import bookshelf_bin
+
+	data = bookshelf_bin.load(fname)
+	assert data.has_placement, fname + ' has no placement'
+
+	components = {}
+	for i, pname in enumerate(data.node_names):
+		r = bookshelf_bin.ORIENTATIONS[data.pl_orient[i]]
+		components[pname] = make_component(data.pl_x[i], data.pl_y[i], r, bool(data.pl_fixed[i]))
 	return components
 
 
@@ -111,12 +161,27 @@ def update_placements(
 	brd_file,
 	pl_file,
 	out_file,
+	index=None,
+	cluster_file=None,
+	patch=False,
 ):
+	"""Move the elements of brd_file to the placements in pl_file (or a list of placement files) and write out_file.
+
+	If index (a spatial_index.BoardIndex) is given it is kept up to date as elements move.
+	If cluster_file is given the clusters in the placement are expanded to their member elements.
+	If patch is set the board is not loaded into Swoop, see patch_placements.
+	"""
+	if patch:
+		return patch_placements(brd_file, pl_file, out_file, index=index, cluster_file=cluster_file)
+
+	import Swoop
 
 	brd = Swoop.EagleFile.from_file(brd_file)
 
 	# Get the info from the pl file
-	pl_info = read_pl2(pl_file)
+	pl_info = read_placements(pl_file)
+	if cluster_file is not None:
+		pl_info = expand_placements(pl_info, read_cluster_map(cluster_file))
 
 
 	# set the rotations for all the components from the pl file
@@ -124,66 +189,12 @@ def update_placements(
 		get_elements()
 	):
 		if n.get_name() in pl_info:
-			c = pl_info[n.get_name()]
-			if c.rot is not None:
-				n.set_rot(c.rot)
+			rot = new_rotation(pl_info[n.get_name()], n.get_rot())
+			if rot is not None:
+				n.set_rot(rot)
 
 	# get the elements (components/blocks/nodes) and geometery from brd file
-	elements = {}
-	for n in (Swoop.From(brd).
-		get_elements()
-	):
-		name = n.get_name()			
-		library = n.get_library()
-		package = n.get_package()
-		e = ElementEntry(name, library=library, package=package)
-		e.x_loc = n.get_x()
-		e.y_loc = n.get_y()
-		e.rotation = n.get_rot()
-		e.locked = n.get_locked()
-		elements[name] = e
-
-	print('total: ' + str(len(elements)) + ' elements (components/blocks/nodes)')
-
-	# get the bounding box for the elements (from lib?)
-	for n, e in elements.iteritems():
-		eagle_package = Swoop.From(brd).get_library(e.library).get_package(e.package)
-		pads = eagle_package.get_pads()
-		smds = eagle_package.get_smds()
-
-		for pin in pads+smds:
-			e.add_pin(pin)
-
-		drawing = eagle_package.get_drawing_elements()
-
-		for de in drawing + pads + smds:
-			allowed_types = [
-				Swoop.Wire,
-				Swoop.Rectangle,
-				Swoop.Hole,
-				Swoop.Circle,
-				Swoop.Polygon,
-				Swoop.Smd,
-				Swoop.Pad,
-			]
-			allowed_layers = set(
-				(None,1,16,17,18,29,30,31,32,33,34,35,36,151,39,40,41,42,44,45)
-			)
-
-			allowed = [isinstance(de, t) for t in allowed_types]
-			if not any(allowed):
-				continue
-
-			((x_min, x_max), (y_min, y_max)) = de_bounding_box(de)
-			
-			e.expand_bb(
-				x_min,
-				x_max,
-				y_min,
-				y_max,
-			)
-
-	components = read_pl2(pl_file)
+	elements = load_elements(brd)
 
 	for n in (Swoop.From(brd).
 		get_elements()
@@ -202,41 +213,158 @@ def update_placements(
 
 		e = elements[brd_name]
 
-		# ll_x = e.x_loc # default to origin
-		# ll_y = e.y_loc # default to origin
-
-		if (e.rotation is None) or (e.rotation == 'R0'): # N
-			n.set_x( pl_info[brd_name].x - e.x_min )
-			# ll_x = e.x_loc + (e.x_min)
-			n.set_y( pl_info[brd_name].y - e.y_min )
-			# ll_y = e.y_loc + (e.y_min)
-			# print e.name, 'loc:', (e.x_loc, e.y_loc),'ll:', (ll_x, ll_y), 'x:', (e.x_min, e.x_max), 'y:', (e.y_min, e.y_max)
-		elif e.rotation == 'R90':
-			n.set_x( pl_info[brd_name].x + e.y_max )
-			# ll_x = e.x_loc - (e.y_max)
-			n.set_y( pl_info[brd_name].y - e.x_min )
-			# ll_y = e.y_loc + (e.x_min)
-			# print e.name, 'loc:', (e.x_loc, e.y_loc),'ll:', (ll_x, ll_y), 'x:', (e.x_min, e.x_max), 'y:', (e.y_min, e.y_max)
-		elif e.rotation == 'R180':
-			n.set_x( pl_info[brd_name].x + e.x_max )
-			# ll_x = e.x_loc - (e.x_max)
-			n.set_y( pl_info[brd_name].y + e.y_max )
-			# ll_y = e.y_loc - (e.y_max)
-			# print e.name, 'loc:', (e.x_loc, e.y_loc),'ll:', (ll_x, ll_y), 'x:', (e.x_min, e.x_max), 'y:', (e.y_min, e.y_max)
-		elif e.rotation == 'R270':
-			n.set_x( pl_info[brd_name].x - e.y_min )
-			# ll_x = e.x_loc + (e.y_min)
-			n.set_y( pl_info[brd_name].y + e.x_max )
-			# ll_y = e.y_loc - (e.x_max)
+		origin = placed_origin(e, e.rotation, pl_info[brd_name].x, pl_info[brd_name].y)
+		if origin is not None:
+			n.set_x(origin[0])
+			n.set_y(origin[1])
+
+		if index is not None:
+			e.x_loc = n.get_x()
+			e.y_loc = n.get_y()
+			index.update_element(e)
 
 	brd.write(out_file, check_sanity=False, dtd_validate=False) # should really pass sanity check and dtd
 
 
+def placed_origin(e, rotation, x, y):
+	"""The origin of element e that puts the lower left corner of its bounding box at (x, y), the inverse of lower_left."""
+	offset = e.lower_left_offset(rotation)
+	if offset is None:
+		return None # other rotations are not handled, the element stays where it is
+	return (x - offset[0], y - offset[1])
 
-if __name__ == '__main__':
-	arguments = docopt(__doc__, version='bookshelf2eagle v0.2')
+
+def format_number(value):
+	"""A coordinate the way EAGLE writes it: 12.7, 3, -0.635."""
+	text = repr(round(float(value), 6))
+	if text.endswith('.0'):
+		text = text[:-2]
+	return '0' if text == '-0' else text
+
+
+def set_attributes(tag, values):
+	"""Replace (or add) attributes of an XML start tag (bytes). Everything else is kept as is."""
+	for name in ('x', 'y', 'rot'):
+		if name not in values:
+			continue
+		value = name.encode('ascii') + b'="' + values[name].encode('ascii') + b'"'
+		pattern = re.compile(br'(?<=\s)' + name.encode('ascii') + br'\s*=\s*"[^"]*"')
+		if pattern.search(tag):
+			tag = pattern.sub(lambda m: value, tag, count=1)
+		else:
+			# new attributes go after y, next to the coordinates they belong with
+			y = re.compile(br'(?<=\s)y\s*=\s*"[^"]*"').search(tag)
+			at = y.end() if y else len(tag) - (2 if tag.endswith(b'/>') else 1)
+			tag = tag[:at] + b' ' + value + tag[at:]
+	return tag
+
+
+def element_tags(board, names=None):
+	"""(start, end, ElementEntry) of the <element> start tags of a lazy_board.LazyBoard, in file order.
+
+	The entries have the package geometry and the position of the board. If names is given only those
+	elements (and their packages) are loaded.
+	"""
+	from eagle2bookshelf2012 import ElementEntry
+	from lazy_board import _attributes
+
+	tags = []
+	(start, end) = board.sections.get('elements', (0, 0))
+	for m in ELEMENT_START_TAG.finditer(board.buffer, start, end):
+		a = _attributes(m.group(0))
+		name = a.get('name')
+		if names is not None and name not in names:
+			continue
+		e = ElementEntry(name, library=a.get('library'), package=a.get('package'))
+		pins, ((x_min, x_max), (y_min, y_max)) = board.package_geometry(e.library, e.package, a.get('library_urn'))
+		e.pins = dict(pins)
+		e.expand_bb(x_min, x_max, y_min, y_max)
+		e.footprint = board.footprint(e.library, e.package, a.get('library_urn'))
+		e.rotation = a.get('rot')
+		e.x_loc = float(a.get('x', 0.0))
+		e.y_loc = float(a.get('y', 0.0))
+		e.locked = a.get('locked') == 'yes'
+		tags.append((m.start(), m.end(), e))
+	return tags
+
+
+def patch_board(buffer, tags, pl_info, out_file, index=None):
+	"""Write the board in buffer to out_file with the tags (see element_tags) of the elements in pl_info moved.
+
+	Returns a dict name -> ElementEntry of all the tags as placed. The entries in tags are not changed.
+	"""
+	placed = {}
+	with open(out_file, 'wb') as out:
+		position = 0
+		for (start, end, original) in tags:
+			e = copy.copy(original)
+			placed[e.name] = e
+			if e.name not in pl_info: # skip if not in pl file
+				continue
+			c = pl_info[e.name]
+
+			values = {}
+			rot = new_rotation(c, e.rotation)
+			if rot is not None and not (rot == 'R0' and e.rotation is None):
+				e.rotation = rot
+				values['rot'] = rot
+			origin = placed_origin(e, e.rotation, c.x, c.y)
+			if origin is not None:
+				(e.x_loc, e.y_loc) = origin
+				values['x'] = format_number(e.x_loc)
+				values['y'] = format_number(e.y_loc)
+
+			out.write(buffer[position:start])
+			out.write(set_attributes(buffer[start:end], values))
+			position = end
+
+			if index is not None:
+				index.update_element(e)
+		out.write(buffer[position:])
+	return placed
+
+
+def patch_placements(
+	brd_file,
+	pl_file,
+	out_file,
+	index=None,
+	cluster_file=None,
+):
+	"""update_placements without Swoop: only the x, y and rot attributes of the <element> start tags
+	of the placed elements are rewritten, everything else is copied byte for byte.
+
+	The board is indexed with lazy_board.LazyBoard and only the packages of the placed elements are parsed.
+	"""
+	from lazy_board import LazyBoard
+
+	pl_info = read_placements(pl_file)
+	if cluster_file is not None:
+		pl_info = expand_placements(pl_info, read_cluster_map(cluster_file))
+
+	board = LazyBoard.from_file(brd_file)
+	try:
+		tags = element_tags(board, names=pl_info)
+		patch_board(board.buffer, tags, pl_info, out_file, index=index)
+	finally:
+		board.close()
+
+	print('patched ' + str(len(tags)) + ' elements')
+
+
+def main(argv=None):
+	from docopt import docopt
+
+	arguments = docopt(__doc__, argv=argv, version='bookshelf2eagle v0.2')
 	update_placements(
 		brd_file=str(arguments['--brd']),
-		pl_file=str(arguments['--pl']),
-		out_file=str(arguments['--out'])
+		pl_file=[str(p) for p in arguments['--pl']] if len(arguments['--pl']) > 1 else str(arguments['--pl'][0]),
+		out_file=str(arguments['--out']),
+		cluster_file=arguments['--clusters'],
+		patch=arguments['--patch'],
 	)
+
+
+if __name__ == '__main__':
+	import conversion_daemon
+	conversion_daemon.run_cli('bookshelf2eagle', main)
@@ -0,0 +1,388 @@
+"""BookshelfBin.
+
+Compact binary container holding the same data as a bookshelf .nodes/.nets/.wts/.pl file set.
+
+Layout (all little endian):
+  header       '<4sHHI'       magic 'BKSH', major version, minor version, number of chunks
+  chunk table  '<4scxxxQQ'    per chunk: tag, array typecode, item count, byte offset
+  chunks       raw typed arrays, each starting on an 8 byte boundary
+
+Chunks:
+  META  i   num nodes, num nets, num pins, has placement
+  STRO  i   string table offsets (num nodes + num nets + 1), node names first then net names
+  STRB  B   string table bytes (utf-8)
+  NODW  d   node widths            NODH  d   node heights         NODT  b   node is terminal
+  NETS  i   first pin of each net (num nets + 1)                  WGHT  d   net weights
+  PINN  i   node index of each pin PIND  b   pin direction (ord of I, O or B)
+  PINX  d   pin x offset           PINY  d   pin y offset
+  PLX   d   node x                 PLY   d   node y
+  PLO   b   orientation index into ORIENTATIONS                   PLF   b   node is fixed
+
+Readers skip chunks they do not know and refuse files with a different major version.
+Loaded arrays are zero-copy views of a memory map where the Python version allows it.
+Text conversion writes floats with repr() so text -> binary -> text is lossless.
+
+Usage:
+  bookshelf_bin.py -h | --help
+  bookshelf_bin.py pack <STEM_NAME> <BIN>
+  bookshelf_bin.py unpack <BIN> <STEM_NAME> [--userid <USERID>]
+
+-h --help                      Show this message.
+--userid USERID                Your name and contact [default: No user ID set].
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+
+
+MAGIC = b'BKSH'
+VERSION_MAJOR = 1
+VERSION_MINOR = 0
+HEADER = struct.Struct('<4sHHI')
+CHUNK_ENTRY = struct.Struct('<4scxxxQQ')
+ALIGN = 8
+
+ORIENTATIONS = ('N', 'W', 'S', 'E', 'FN', 'FW', 'FS', 'FE')
+ORIENTATION_INDEX = dict((o, i) for i, o in enumerate(ORIENTATIONS))
+
+# itemsize the file format uses for each typecode
+ITEM_SIZES = {'d': 8, 'i': 4, 'b': 1, 'B': 1}
+
+
+class Row(object):
+	"""One placement row of a .scl file."""
+	def __init__(self, coordinate=0.0, height=0.0, subrow_origin=0.0, num_sites=0, site_width=1.0):
+		super(Row, self).__init__()
+		self.coordinate = coordinate
+		self.height = height
+		self.site_width = site_width
+		self.site_spacing = site_width
+		self.site_orient = 1
+		self.site_symmetry = 1
+		self.subrow_origin = subrow_origin
+		self.num_sites = num_sites
+
+
+class BookshelfData(object):
+	"""Array backed bookshelf problem: nodes, nets with pins, net weights and an optional placement."""
+	def __init__(self):
+		super(BookshelfData, self).__init__()
+		self.node_names = []
+		self.node_width = array('d')
+		self.node_height = array('d')
+		self.node_terminal = array('b')
+
+		self.net_names = []
+		self.net_start = array('i', [0]) # pins of net i are net_start[i] .. net_start[i+1]-1
+		self.net_weight = array('d')
+		self.pin_node = array('i')
+		self.pin_dir = array('b')
+		self.pin_x = array('d')
+		self.pin_y = array('d')
+
+		self.has_placement = False
+		self.pl_x = array('d')
+		self.pl_y = array('d')
+		self.pl_orient = array('b')
+		self.pl_fixed = array('b')
+
+		self.rows = [] # Row, from a .scl file (not stored in the binary container)
+
+		self._node_index = None
+
+	def node_index(self, name):
+		if self._node_index is None:
+			self._node_index = dict((n, i) for i, n in enumerate(self.node_names))
+		return self._node_index[name]
+
+	def add_node(self, name, width, height, terminal=False):
+		self.node_names.append(name)
+		self.node_width.append(float(width))
+		self.node_height.append(float(height))
+		self.node_terminal.append(1 if terminal else 0)
+		if self._node_index is not None:
+			self._node_index[name] = len(self.node_names) - 1
+		if self.has_placement:
+			self.pl_x.append(0.0)
+			self.pl_y.append(0.0)
+			self.pl_orient.append(0)
+			self.pl_fixed.append(1 if terminal else 0)
+
+	def add_net(self, name, pins, weight=1.0):
+		"""pins is a list of (node name, direction, x offset, y offset)."""
+		self.net_names.append(name)
+		for (node, direction, x, y) in pins:
+			self.pin_node.append(self.node_index(node))
+			self.pin_dir.append(ord(direction[0]))
+			self.pin_x.append(float(x))
+			self.pin_y.append(float(y))
+		self.net_start.append(len(self.pin_node))
+		self.net_weight.append(float(weight))
+
+	def set_placement(self, name, x, y, orientation='N', fixed=False):
+		if not self.has_placement:
+			self.has_placement = True
+			n = len(self.node_names)
+			self.pl_x = array('d', [0.0] * n)
+			self.pl_y = array('d', [0.0] * n)
+			self.pl_orient = array('b', [0] * n)
+			self.pl_fixed = array('b', list(self.node_terminal))
+		i = self.node_index(name)
+		self.pl_x[i] = float(x)
+		self.pl_y[i] = float(y)
+		self.pl_orient[i] = ORIENTATION_INDEX[orientation]
+		self.pl_fixed[i] = 1 if fixed else 0
+
+	def num_pins(self):
+		return len(self.pin_node)
+
+	def net_pins(self, i):
+		"""Pins of net i as a list of (node index, direction, x offset, y offset)."""
+		return [
+			(self.pin_node[j], chr(self.pin_dir[j]), self.pin_x[j], self.pin_y[j])
+			for j in range(self.net_start[i], self.net_start[i + 1])
+		]
+
+	@staticmethod
+	def from_board(elements, signals, terminals=()):
+		"""Build from the ElementEntry / Signal dicts used by eagle2bookshelf2012."""
+		data = BookshelfData()
+		for n, e in elements.items():
+			data.add_node(n, e.x_max - e.x_min, e.y_max - e.y_min, terminal=(n in terminals))
+		for n, s in signals.items():
+			data.add_net(n, [(p.name, p.direction, p.x_offset, p.y_offset) for p in s.pins], weight=s.weight)
+		from eagle2bookshelf2012 import ROTATION_ORIENT, plain_rotation
+
+		for n, e in elements.items():
+			ll_x, ll_y = e.lower_left()
+			data.set_placement(n, ll_x, ll_y, ROTATION_ORIENT.get(plain_rotation(e.rotation), 'N'), fixed=(e.locked == True or n in terminals))
+		return data
+
+
+def _to_bytes(a):
+	if sys.byteorder != 'little' and a.itemsize > 1:
+		a = array(a.typecode, a)
+		a.byteswap()
+	if hasattr(a, 'tobytes'):
+		return a.tobytes()
+	return a.tostring()
+
+
+def _raw(a):
+	if isinstance(a, array):
+		return _to_bytes(a)
+	return bytes(a)
+
+
+def _from_buffer(typecode, buf, offset, count, copy):
+	"""Typed array view (or copy) of count items at offset of buf."""
+	length = count * ITEM_SIZES[typecode]
+	if not copy and sys.byteorder == 'little' and hasattr(memoryview, 'cast'):
+		return memoryview(buf)[offset:offset + length].cast(typecode)
+	a = array(typecode)
+	assert a.itemsize == ITEM_SIZES[typecode], 'unsupported platform array size for ' + typecode
+	chunk = bytes(buf[offset:offset + length])
+	if hasattr(a, 'frombytes'):
+		a.frombytes(chunk)
+	else:
+		a.fromstring(chunk)
+	if sys.byteorder != 'little' and a.itemsize > 1:
+		a.byteswap()
+	return a
+
+
+def save(data, fname):
+	"""Write data to the binary container fname."""
+	with open(fname, 'wb') as file:
+		file.write(to_bytes(data))
+
+
+def to_bytes(data):
+	"""The binary container of data."""
+	strings = [n.encode('utf-8') for n in data.node_names] + [n.encode('utf-8') for n in data.net_names]
+	offsets = array('i', [0])
+	for s in strings:
+		offsets.append(offsets[-1] + len(s))
+
+	meta = array('i', [len(data.node_names), len(data.net_names), data.num_pins(), 1 if data.has_placement else 0])
+	chunks = [
+		(b'META', 'i', meta),
+		(b'STRO', 'i', offsets),
+		(b'STRB', 'B', array('B', b''.join(strings))),
+		(b'NODW', 'd', data.node_width),
+		(b'NODH', 'd', data.node_height),
+		(b'NODT', 'b', data.node_terminal),
+		(b'NETS', 'i', data.net_start),
+		(b'WGHT', 'd', data.net_weight),
+		(b'PINN', 'i', data.pin_node),
+		(b'PIND', 'b', data.pin_dir),
+		(b'PINX', 'd', data.pin_x),
+		(b'PINY', 'd', data.pin_y),
+	]
+	if data.has_placement:
+		chunks += [
+			(b'PLX ', 'd', data.pl_x),
+			(b'PLY ', 'd', data.pl_y),
+			(b'PLO ', 'b', data.pl_orient),
+			(b'PLF ', 'b', data.pl_fixed),
+		]
+
+	offset = HEADER.size + CHUNK_ENTRY.size * len(chunks)
+	table = []
+	payload = []
+	for tag, typecode, values in chunks:
+		offset += (-offset) % ALIGN
+		raw = _to_bytes(array(typecode, values))
+		table.append(CHUNK_ENTRY.pack(tag, typecode.encode('ascii'), len(values), offset))
+		payload.append((offset, raw))
+		offset += len(raw)
+
+	parts = [HEADER.pack(MAGIC, VERSION_MAJOR, VERSION_MINOR, len(chunks))]
+	parts += table
+	position = HEADER.size + CHUNK_ENTRY.size * len(chunks)
+	for chunk_offset, raw in payload:
+		parts.append(b'\0' * (chunk_offset - position))
+		parts.append(raw)
+		position = chunk_offset + len(raw)
+	return b''.join(parts)
+
+
+def load(fname, copy=False):
+	"""Read a binary container. Unless copy is set the numeric arrays are views of a memory map (read only)."""
+	with open(fname, 'rb') as file:
+		if copy:
+			buf = file.read()
+		else:
+			buf = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+	magic, major, minor, count = HEADER.unpack_from(buf, 0)
+	assert magic == MAGIC, fname + ' is not a binary bookshelf file'
+	assert major == VERSION_MAJOR, fname + ' has unsupported version ' + str(major) + '.' + str(minor)
+
+	chunks = {}
+	for i in range(count):
+		tag, typecode, items, offset = CHUNK_ENTRY.unpack_from(buf, HEADER.size + i * CHUNK_ENTRY.size)
+		typecode = str(typecode.decode('ascii'))
+		if typecode not in ITEM_SIZES:
+			continue # newer chunk type, skip it
+		chunks[tag] = _from_buffer(typecode, buf, offset, items, copy)
+
+	num_nodes, num_nets, num_pins, has_placement = list(chunks[b'META'])[:4]
+	offsets = chunks[b'STRO']
+	string_bytes = _raw(chunks[b'STRB'])
+	strings = [string_bytes[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+	data = BookshelfData()
+	data.node_names = strings[:num_nodes]
+	data.net_names = strings[num_nodes:num_nodes + num_nets]
+	data.node_width = chunks[b'NODW']
+	data.node_height = chunks[b'NODH']
+	data.node_terminal = chunks[b'NODT']
+	data.net_start = chunks[b'NETS']
+	data.net_weight = chunks[b'WGHT']
+	data.pin_node = chunks[b'PINN']
+	data.pin_dir = chunks[b'PIND']
+	data.pin_x = chunks[b'PINX']
+	data.pin_y = chunks[b'PINY']
+	if has_placement:
+		data.has_placement = True
+		data.pl_x = chunks[b'PLX ']
+		data.pl_y = chunks[b'PLY ']
+		data.pl_orient = chunks[b'PLO ']
+		data.pl_fixed = chunks[b'PLF ']
+	return data
+
+
+def write_text(data, project_name, user_id):
+	"""Write data as .nodes, .nets, .wts (and .pl if it has a placement) text files."""
+	from eagle2bookshelf2012 import file_header
+
+	nodes_str = file_header('nodes', user_id)
+	nodes_str += 'NumNodes : ' + str(len(data.node_names)) + '\n'
+	nodes_str += 'NumTerminals : ' + str(sum(data.node_terminal)) + '\n'
+	nodes_str += '\n'
+	for i, n in enumerate(data.node_names):
+		nodes_str += n.rjust(20) + ' ' + repr(data.node_width[i]).rjust(20) + ' ' + repr(data.node_height[i]).rjust(20)
+		nodes_str += ' terminal\n' if data.node_terminal[i] else '\n'
+
+	nets_str = file_header('nets', user_id)
+	nets_str += 'NumNets : ' + str(len(data.net_names)) + '\n'
+	nets_str += 'NumPins : ' + str(data.num_pins()) + '\n'
+	nets_str += '\n'
+	for i, n in enumerate(data.net_names):
+		nets_str += 'NetDegree : ' + str(data.net_start[i + 1] - data.net_start[i]) + ' ' + n + '\n'
+		for (node, direction, x, y) in data.net_pins(i):
+			nets_str += data.node_names[node].rjust(15) + ' ' + direction.rjust(3) + ' : ' + repr(x).rjust(10) + ' ' + repr(y).rjust(10) + '\n'
+
+	weights_str = file_header('wts', user_id)
+	for i, n in enumerate(data.net_names):
+		weights_str += n + ' ' + repr(data.net_weight[i]) + '\n'
+
+	with open(project_name + '.nodes', 'w') as file:
+		file.write(nodes_str)
+
+	with open(project_name + '.nets', 'w') as file:
+		file.write(nets_str)
+
+	with open(project_name + '.wts', 'w') as file:
+		file.write(weights_str)
+
+	if data.has_placement:
+		pl_str = file_header('pl', user_id)
+		for i, n in enumerate(data.node_names):
+			pl_str += n.rjust(15) + ' ' + repr(data.pl_x[i]).rjust(10) + ' ' + repr(data.pl_y[i]).rjust(10) + ' : ' + ORIENTATIONS[data.pl_orient[i]]
+			pl_str += ' /FIXED\n'.rjust(12) if data.pl_fixed[i] else '\n'
+		with open(project_name + '.pl', 'w') as file:
+			file.write(pl_str)
+
+
+def read_text(project_name):
+	"""Read the .nodes, .nets, .wts and (if present) .pl files of project_name."""
+	from bookshelf_reader import read_design
+	return read_design(project_name)
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='bookshelf_bin v1.0')
+	if arguments['pack']:
+		save(read_text(str(arguments['<STEM_NAME>'])), str(arguments['<BIN>']))
+	else:
+		write_text(load(str(arguments['<BIN>'])), str(arguments['<STEM_NAME>']), str(arguments['--userid']))
@@ -0,0 +1,259 @@
+"""BookshelfReader.
+
+Streaming reader for UCLA bookshelf files (.nodes, .nets, .wts, .pl, .scl and .aux) into the
+array backed BookshelfData model of bookshelf_bin.py.
+
+Files are read in chunks of CHUNK_SIZE bytes. Every chunk is tokenized with one multiline regular
+expression call (one tuple per record) instead of splitting line by line in Python, so ISPD sized
+benchmarks load in bounded memory. progress(file name, bytes done, bytes total) is called after each chunk.
+
+Pin offsets written as percentages ('%12.5') are read as plain numbers.
+
+Usage:
+  bookshelf_reader.py -h | --help
+  bookshelf_reader.py <STEM_NAME_OR_AUX>
+
+-h --help                      Show this message.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import os
+import re
+from array import array
+
+from bookshelf_bin import BookshelfData, Row, ORIENTATION_INDEX
+
+
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# one match per record line, header and comment lines never match
+NODES_RECORD = re.compile(
+	r'^[ \t]*(?!#|UCLA|NumNodes|NumTerminals)(\S+)[ \t]+(\S+)[ \t]+(\S+)(?:[ \t]+(terminal\S*))?',
+	re.MULTILINE,
+)
+NETS_RECORD = re.compile(
+	r'^[ \t]*(?:NetDegree[ \t]*:[ \t]*(\d+)(?:[ \t]+(\S+))?|(?!#|UCLA|NumNets|NumPins)(\S+)[ \t]+(\S+)(?:[ \t]*:[ \t]*(\S+)[ \t]+(\S+))?)',
+	re.MULTILINE,
+)
+WTS_RECORD = re.compile(
+	r'^[ \t]*(?!#|UCLA)(\S+)[ \t]+(\S+)',
+	re.MULTILINE,
+)
+PL_RECORD = re.compile(
+	r'^[ \t]*(?!#|UCLA)(\S+)[ \t]+(\S+)[ \t]+(\S+)(?:[ \t]*:[ \t]*(\S+))?(?:[ \t]+(/FIXED\S*))?',
+	re.MULTILINE,
+)
+
+
+def iter_records(fname, pattern, chunk_size=CHUNK_SIZE, progress=None):
+	"""Yield lists of regex match tuples for fname, one list per chunk of complete lines."""
+	total = os.path.getsize(fname)
+	done = 0
+	leftover = ''
+	with open(fname, 'r') as f:
+		while True:
+			chunk = f.read(chunk_size)
+			if not chunk:
+				break
+			done += len(chunk)
+			text = leftover + chunk
+			cut = text.rfind('\n') + 1
+			leftover = text[cut:]
+			yield pattern.findall(text[:cut])
+			if progress is not None:
+				progress(fname, min(done, total), total)
+	if leftover:
+		yield pattern.findall(leftover)
+
+
+def _number(s):
+	return float(s.lstrip('%'))
+
+
+def read_nodes(fname, data=None, chunk_size=CHUNK_SIZE, progress=None):
+	if data is None:
+		data = BookshelfData()
+	for records in iter_records(fname, NODES_RECORD, chunk_size, progress):
+		data.node_names.extend([r[0] for r in records])
+		data.node_width.extend(array('d', [float(r[1]) for r in records]))
+		data.node_height.extend(array('d', [float(r[2]) for r in records]))
+		data.node_terminal.extend(array('b', [1 if r[3] else 0 for r in records]))
+	data._node_index = None
+	return data
+
+
+def read_nets(fname, data, chunk_size=CHUNK_SIZE, progress=None):
+	"""Read nets into data, which must already hold the nodes."""
+	index = dict((n, i) for i, n in enumerate(data.node_names))
+	open_net = False
+	for records in iter_records(fname, NETS_RECORD, chunk_size, progress):
+		for (degree, net_name, node, direction, x, y) in records:
+			if degree:
+				if open_net:
+					data.net_start.append(len(data.pin_node))
+				data.net_names.append(net_name or ('net' + str(len(data.net_names))))
+				data.net_weight.append(1.0)
+				open_net = True
+			else:
+				data.pin_node.append(index[node])
+				data.pin_dir.append(ord(direction[0]))
+				data.pin_x.append(_number(x) if x else 0.0)
+				data.pin_y.append(_number(y) if y else 0.0)
+	if open_net:
+		data.net_start.append(len(data.pin_node))
+	return data
+
+
+def read_wts(fname, data, chunk_size=CHUNK_SIZE, progress=None):
+	"""Read net weights into data, which must already hold the nets. Unknown names are ignored."""
+	index = dict((n, i) for i, n in enumerate(data.net_names))
+	for records in iter_records(fname, WTS_RECORD, chunk_size, progress):
+		for (name, weight) in records:
+			if name in index:
+				data.net_weight[index[name]] = float(weight)
+	return data
+
+
+def read_pl(fname, data, chunk_size=CHUNK_SIZE, progress=None):
+	"""Read a placement into data, which must already hold the nodes."""
+	n = len(data.node_names)
+	data.has_placement = True
+	data.pl_x = array('d', [0.0]) * n
+	data.pl_y = array('d', [0.0]) * n
+	data.pl_orient = array('b', [0]) * n
+	data.pl_fixed = array('b', data.node_terminal)
+	index = dict((name, i) for i, name in enumerate(data.node_names))
+	for records in iter_records(fname, PL_RECORD, chunk_size, progress):
+		for (name, x, y, orientation, fixed) in records:
+			i = index[name]
+			data.pl_x[i] = float(x)
+			data.pl_y[i] = float(y)
+			data.pl_orient[i] = ORIENTATION_INDEX[orientation or 'N']
+			data.pl_fixed[i] = 1 if fixed else 0
+	return data
+
+
+def read_scl(fname, data):
+	"""Read the placement rows of a .scl file into data.rows. Row files are small so this is not chunked."""
+	with open(fname, 'r') as f:
+		text = re.sub(r'#[^\n]*', '', f.read())
+	tokens = text.replace(':', ' ').split()
+
+	keys = {
+		'Coordinate': 'coordinate',
+		'Height': 'height',
+		'Sitewidth': 'site_width',
+		'Sitespacing': 'site_spacing',
+		'Siteorient': 'site_orient',
+		'Sitesymmetry': 'site_symmetry',
+		'SubrowOrigin': 'subrow_origin',
+		'NumSites': 'num_sites',
+	}
+	data.rows = []
+	row = None
+	i = 0
+	while i < len(tokens):
+		t = tokens[i]
+		if t == 'CoreRow':
+			row = Row()
+			data.rows.append(row)
+			i += 2 # CoreRow Horizontal
+			continue
+		if row is not None and t in keys:
+			value = tokens[i + 1]
+			for convert in (int, float):
+				try:
+					value = convert(value)
+					break
+				except ValueError:
+					pass
+			setattr(row, keys[t], value)
+			i += 2
+			continue
+		if t == 'End':
+			row = None
+		i += 1
+	return data
+
+
+def read_design(project_name, chunk_size=CHUNK_SIZE, progress=None):
+	"""Read <project_name>.nodes and .nets plus .wts, .pl and .scl when they exist."""
+	files = dict(
+		(suffix, project_name + '.' + suffix)
+		for suffix in ('nodes', 'nets', 'wts', 'pl', 'scl')
+		if os.path.exists(project_name + '.' + suffix)
+	)
+	return _read_files(files, chunk_size, progress)
+
+
+def read_aux(aux_file, chunk_size=CHUNK_SIZE, progress=None):
+	"""Read the files listed in an ISPD style .aux file (RowBasedPlacement : a.nodes a.nets ...)."""
+	with open(aux_file, 'r') as f:
+		names = f.read().split(':', 1)[1].split()
+	directory = os.path.dirname(aux_file)
+	files = dict((n.rsplit('.', 1)[1], os.path.join(directory, n)) for n in names)
+	return _read_files(files, chunk_size, progress)
+
+
+def _read_files(files, chunk_size, progress):
+	data = read_nodes(files['nodes'], chunk_size=chunk_size, progress=progress)
+	read_nets(files['nets'], data, chunk_size=chunk_size, progress=progress)
+	if 'wts' in files:
+		read_wts(files['wts'], data, chunk_size=chunk_size, progress=progress)
+	if 'pl' in files:
+		read_pl(files['pl'], data, chunk_size=chunk_size, progress=progress)
+	if 'scl' in files:
+		read_scl(files['scl'], data)
+	return data
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='bookshelf_reader v0.1')
+
+	def report(fname, done, total):
+		print('\r' + fname + ': ' + str(100 * done // max(total, 1)) + '%', end='')
+
+	source = str(arguments['<STEM_NAME_OR_AUX>'])
+	if source.endswith('.aux'):
+		data = read_aux(source, progress=report)
+	else:
+		data = read_design(source, progress=report)
+	print('')
+	print('nodes: ' + str(len(data.node_names)) + ' (' + str(sum(data.node_terminal)) + ' terminals)')
+	print('nets: ' + str(len(data.net_names)) + ', pins: ' + str(data.num_pins()))
+	print('rows: ' + str(len(data.rows)))
@@ -0,0 +1,263 @@
+"""Cluster.
+
+Coarsening of the bookshelf problem by clustering small, tightly connected components
+(decoupling caps, pull ups, termination resistors, ...) with the part they serve (their anchor).
+
+A small element joins the anchor it shares the most connectivity with, where every shared
+signal contributes weight / (degree - 1) and signals with more than max_net_degree pins are ignored.
+Members are packed in rows on top of the anchor. The cluster is written as a single node named
+after its anchor, so the anchor sits at the lower left corner of the cluster.
+
+The cluster map (.clusters) records, for every cluster, the offset and size of each member inside
+the unrotated cluster. bookshelf2eagle uses it to expand the placed clusters back into elements.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import copy
+import datetime
+
+
+SMALL_MAX_PINS = 3 # elements with at most this many pins may join a cluster
+MAX_MEMBERS = 8 # members per anchor
+MAX_NET_DEGREE = 64 # bigger signals do not count as connectivity
+MIN_SCORE = 0.1
+
+
+class Cluster(object):
+	"""An anchor plus the small elements packed on top of it."""
+	def __init__(self, name, width=0.0, height=0.0):
+		super(Cluster, self).__init__()
+		self.name = name
+		self.width = width
+		self.height = height
+		# (element name, x offset, y offset, width, height) of the unrotated element inside the unrotated cluster
+		# the first member is the anchor at (0, 0)
+		self.members = []
+
+
+def find_clusters(elements, signals, max_members=MAX_MEMBERS, max_net_degree=MAX_NET_DEGREE):
+	"""Return a dict anchor name -> sorted list of member names. Locked elements never cluster."""
+	pin_count = dict((n, len(e.pins)) for n, e in elements.items())
+
+	def small(n):
+		return pin_count[n] <= SMALL_MAX_PINS and not elements[n].locked
+
+	# connectivity between small elements and possible anchors
+	scores = {}
+	for s in signals.values():
+		names = set(p.name for p in s.pins)
+		degree = len(names)
+		if degree < 2 or degree > max_net_degree:
+			continue
+		w = float(s.weight) / (degree - 1)
+		anchors = [n for n in names if not small(n) and not elements[n].locked]
+		for n in names:
+			if not small(n):
+				continue
+			for a in anchors:
+				scores[(n, a)] = scores.get((n, a), 0.0) + w
+
+	best = {}
+	for (n, a), score in scores.items():
+		if score < MIN_SCORE:
+			continue
+		if n not in best or (score, a) > best[n]:
+			best[n] = (score, a)
+
+	clusters = {}
+	for n, (score, a) in sorted(best.items(), key=lambda x: (-x[1][0], x[0])):
+		members = clusters.setdefault(a, [])
+		if len(members) < max_members:
+			members.append(n)
+
+	for a in clusters:
+		clusters[a].sort()
+	return clusters
+
+
+def _size(e):
+	return (max(e.x_max - e.x_min, 0.0), max(e.y_max - e.y_min, 0.0))
+
+
+def coarsen_board(elements, signals, clusters):
+	"""Collapse every cluster into one node.
+
+	Returns (elements, signals, cluster map) for the reduced problem. The cluster map is a dict
+	cluster name -> Cluster. Signals that end up inside a single node are dropped.
+	"""
+	from eagle2bookshelf2012 import ElementEntry, Signal, PinAbsolute
+
+	cluster_map = {}
+	owner = {} # element name -> (cluster name, x, y of the element center relative to the cluster center)
+	new_elements = {}
+
+	for n, e in elements.items():
+		if n not in clusters:
+			continue
+		anchor_w, anchor_h = _size(e)
+		c = Cluster(n)
+		c.members.append((n, 0.0, 0.0, anchor_w, anchor_h))
+
+		# shelf packing of the members in rows above the anchor
+		row_limit = max([anchor_w] + [_size(elements[m])[0] for m in clusters[n]])
+		x = 0.0
+		y = anchor_h
+		row_height = 0.0
+		for m in clusters[n]:
+			w, h = _size(elements[m])
+			if x > 0.0 and x + w > row_limit:
+				x = 0.0
+				y += row_height
+				row_height = 0.0
+			c.members.append((m, x, y, w, h))
+			x += w
+			row_height = max(row_height, h)
+		c.width = row_limit
+		c.height = y + row_height
+		cluster_map[n] = c
+
+		for (m, dx, dy, w, h) in c.members:
+			owner[m] = (n, dx + w / 2.0 - c.width / 2.0, dy + h / 2.0 - c.height / 2.0)
+
+		# the cluster node keeps the anchor origin and rotation so the anchor stays at the lower left
+		node = ElementEntry(n, library=e.library, package=e.package)
+		node.x_loc = e.x_loc
+		node.y_loc = e.y_loc
+		node.rotation = e.rotation
+		node.locked = e.locked
+		node.x_min = e.x_min
+		node.y_min = e.y_min
+		node.x_max = e.x_min + c.width
+		node.y_max = e.y_min + c.height
+		new_elements[n] = node
+
+	for n, e in elements.items():
+		if n not in owner:
+			new_elements[n] = e
+
+	new_signals = {}
+	for n, s in signals.items():
+		new_s = Signal(n, weight=s.weight)
+		for p in s.pins:
+			if p.name in owner:
+				cluster_name, cx, cy = owner[p.name]
+				new_s.pins.append(PinAbsolute(cluster_name, cx + p.x_offset, cy + p.y_offset, p.direction))
+			else:
+				new_s.pins.append(p)
+		if len(set(p.name for p in new_s.pins)) < 2:
+			continue
+		new_signals[n] = new_s
+
+	print('clustered ' + str(len(elements)) + ' elements into ' + str(len(new_elements)) + ' nodes, ' + str(len(signals)) + ' nets into ' + str(len(new_signals)))
+
+	return new_elements, new_signals, cluster_map
+
+
+def cluster_map_str(cluster_map, user_id):
+	"""Contents of the .clusters file."""
+	cluster_str = ''
+	cluster_str += 'UCLA clusters 1.0\n'
+	cluster_str += '\n'
+	cluster_str += '# Created    : ' + str(datetime.datetime.now()) + '\n'
+	cluster_str += '# Created by : ' + user_id + '\n'
+	cluster_str += '\n'
+	cluster_str += 'NumClusters : ' + str(len(cluster_map)) + '\n'
+	cluster_str += '\n'
+
+	for n in sorted(cluster_map):
+		c = cluster_map[n]
+		cluster_str += 'Cluster : ' + c.name + ' ' + str(len(c.members)) + ' ' + str(c.width) + ' ' + str(c.height) + '\n'
+		for (m, dx, dy, w, h) in c.members:
+			cluster_str += m.rjust(15) + ' ' + str(dx).rjust(10) + ' ' + str(dy).rjust(10) + ' ' + str(w).rjust(10) + ' ' + str(h).rjust(10) + '\n'
+
+	return cluster_str
+
+
+def write_cluster_map(fname, cluster_map, user_id):
+	with open(fname, 'w') as file:
+		file.write(cluster_map_str(cluster_map, user_id))
+
+
+def read_cluster_map(fname):
+	with open(fname, 'r') as f:
+		lines = f.read().splitlines()
+
+	cluster_map = {}
+	c = None
+	for line in lines:
+		l = line.split()
+		if not l or l[0].startswith('#') or l[0] in ('UCLA', 'NumClusters'):
+			continue
+		if l[0] == 'Cluster':
+			c = Cluster(l[2], width=float(l[4]), height=float(l[5]))
+			cluster_map[c.name] = c
+		else:
+			c.members.append((l[0], float(l[1]), float(l[2]), float(l[3]), float(l[4])))
+	return cluster_map
+
+
+def member_lower_left(c, member, rotdeg, mirrored=False):
+	"""Lower left corner of a member relative to the lower left corner of the cluster placed at rotdeg (flipped if mirrored)."""
+	from eagle2bookshelf2012 import ORIENTATIONS
+
+	(m, dx, dy, w, h) = member
+	rotation = ('M' if mirrored else '') + 'R' + str(int(rotdeg) % 360)
+	if rotation not in ORIENTATIONS:
+		raise ValueError('cannot expand cluster ' + c.name + ' placed at ' + rotation)
+	(swap, sx, sy) = ORIENTATIONS[rotation]
+	if swap:
+		(xs, ys, width, height) = ((dy, dy + h), (dx, dx + w), c.height, c.width)
+	else:
+		(xs, ys, width, height) = ((dx, dx + w), (dy, dy + h), c.width, c.height)
+	# a sign flip mirrors the member box inside the cluster box
+	return (xs[0] if sx > 0 else width - xs[1], ys[0] if sy > 0 else height - ys[1])
+
+
+def expand_placements(components, cluster_map):
+	"""Replace placed clusters in a read_pl2() dict with placements of their members."""
+	expanded = {}
+	for n, comp in components.items():
+		if n not in cluster_map:
+			expanded[n] = comp
+			continue
+		c = cluster_map[n]
+		for member in c.members:
+			ll_x, ll_y = member_lower_left(c, member, comp.rotdeg, comp.mirrored)
+			placed = copy.copy(comp)
+			placed.x = comp.x + ll_x
+			placed.y = comp.y + ll_y
+			expanded[member[0]] = placed
+	return expanded
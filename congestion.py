@@ -0,0 +1,253 @@
+"""Congestion.
+
+RUDY (rectangular uniform wire density) routing congestion map of a placed bookshelf problem, to
+check a placement is routable before back-annotating it with bookshelf2eagle.py.
+
+The wiring of each net is spread uniformly over the bounding box of its pins: the demand density
+is weight * L / (w * h), with L the half perimeter w + h of the box (or the Steiner tree estimate of
+wirelength.py with --rsmt). Boxes thinner than a grid cell are widened to one cell, and moved inside
+the grid at the board edge so none of their demand is clipped. The demand of a grid cell is the
+density integrated over the cell, so the map does not depend on where the cell borders fall.
+
+A box covers whole cells in its middle and parts of the cells along its border, so it is split into
+at most 3 x 3 rectangles of cells with the same covered area each. Every rectangle is four updates of
+one 2D difference array, which makes a net cost the same whatever its size. Two prefix sums at the
+end turn the differences into the demand of each cell.
+
+The capacity of a cell is layers * cell area / pitch, the length of the tracks through it.
+Utilization is demand / capacity; overflow is the demand above capacity. The statistics report the
+peak and the average utilization of the worst 0.5, 1, 2 and 5 percent of the cells (ACE).
+
+The grid covers the rows of <STEM_NAME>.scl if there is one, else the placed nodes.
+
+Usage:
+  congestion.py -h | --help
+  congestion.py <STEM_NAME> [--pl <PL>] [--bins <N>] [--layers <N>] [--pitch <P>] [--rsmt] [--heatmap <FILE>] [--image <PGM>]
+
+-h --help                      Show this message.
+--pl PL                        The placement to evaluate instead of <STEM_NAME>.pl (.pl, or a binary .bsb).
+--bins N                       Grid cells along each side [default: 64].
+--layers N                     Routing layers [default: 2].
+--pitch P                      Track pitch in board units [default: 0.254].
+--rsmt                         Spread the RSMT estimate of each net instead of its half perimeter (see wirelength.py).
+--heatmap FILE                 Write the utilization of every cell, one grid row per line, top row first.
+--image PGM                    Write the utilization as a grey scale image, white is 100 % or more.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+ACE_PERCENTS = (0.5, 1.0, 2.0, 5.0)
+
+
+def _widen(lo, hi, grid_lo, grid_hi, size):
+	"""[lo, hi] widened to size around its center and moved inside [grid_lo, grid_hi], so no demand is clipped."""
+	lo = min(max((lo + hi - size) / 2.0, grid_lo), grid_hi - size)
+	return (lo, lo + size)
+
+
+class CongestionMap(object):
+	"""Wire demand on an nx by ny grid over ((x_min, x_max), (y_min, y_max))."""
+	def __init__(self, bbox, nx, ny):
+		super(CongestionMap, self).__init__()
+		((x_min, x_max), (y_min, y_max)) = bbox
+		# a degenerate extent (all nodes in a line or a point) gets the size of the other side, or 1 board unit
+		size = max(x_max - x_min, y_max - y_min, 0.0) or 1.0
+		if x_max - x_min <= 0.0:
+			(x_min, x_max) = ((x_min + x_max - size) / 2.0, (x_min + x_max + size) / 2.0)
+		if y_max - y_min <= 0.0:
+			(y_min, y_max) = ((y_min + y_max - size) / 2.0, (y_min + y_max + size) / 2.0)
+		((self.x_min, self.x_max), (self.y_min, self.y_max)) = ((x_min, x_max), (y_min, y_max))
+		self.nx = nx
+		self.ny = ny
+		self.cell_w = (self.x_max - self.x_min) / float(nx)
+		self.cell_h = (self.y_max - self.y_min) / float(ny)
+		self.diff = [0.0] * ((nx + 1) * (ny + 1)) # row j, column i at j * (nx + 1) + i
+
+	def _spans(self, lo, hi, origin, size, n):
+		"""(first cell, last cell, covered length per cell) of the interval [lo, hi] along one axis."""
+		first = min(n - 1, max(0, int((lo - origin) / size)))
+		last = min(n - 1, max(0, int((hi - origin) / size)))
+		if first == last:
+			return [(first, first, hi - lo)]
+		spans = [(first, first, origin + (first + 1) * size - lo)]
+		if last > first + 1:
+			spans.append((first + 1, last - 1, size))
+		spans.append((last, last, hi - (origin + last * size)))
+		return spans
+
+	def add_box(self, x1, x2, y1, y2, density):
+		"""Spread density (demand per unit area) over the box, clipped to the grid."""
+		x1 = max(x1, self.x_min)
+		x2 = min(x2, self.x_max)
+		y1 = max(y1, self.y_min)
+		y2 = min(y2, self.y_max)
+		if x2 <= x1 or y2 <= y1:
+			return
+		stride = self.nx + 1
+		diff = self.diff
+		x_spans = self._spans(x1, x2, self.x_min, self.cell_w, self.nx)
+		for (j1, j2, ly) in self._spans(y1, y2, self.y_min, self.cell_h, self.ny):
+			for (i1, i2, lx) in x_spans:
+				v = density * lx * ly
+				diff[j1 * stride + i1] += v
+				diff[j1 * stride + i2 + 1] -= v
+				diff[(j2 + 1) * stride + i1] -= v
+				diff[(j2 + 1) * stride + i2 + 1] += v
+
+	def add_net(self, xs, ys, weight=1.0, length=None):
+		"""Add a net with pins at xs, ys. length defaults to the half perimeter of the pins."""
+		if len(xs) < 2:
+			return
+		(x1, x2, y1, y2) = (min(xs), max(xs), min(ys), max(ys))
+		if length is None:
+			length = (x2 - x1) + (y2 - y1)
+		if x2 - x1 < self.cell_w:
+			(x1, x2) = _widen(x1, x2, self.x_min, self.x_max, self.cell_w)
+		if y2 - y1 < self.cell_h:
+			(y1, y2) = _widen(y1, y2, self.y_min, self.y_max, self.cell_h)
+		self.add_box(x1, x2, y1, y2, weight * length / ((x2 - x1) * (y2 - y1)))
+
+	def demand(self):
+		"""Demand of the cells as rows (bottom row first) of nx values."""
+		stride = self.nx + 1
+		rows = []
+		above = [0.0] * stride
+		for j in range(self.ny):
+			running = 0.0
+			row = []
+			for i in range(self.nx):
+				running += self.diff[j * stride + i]
+				above[i] += running
+				row.append(above[i])
+			rows.append(row)
+		return rows
+
+
+def placement_bbox(data):
+	"""((x_min, x_max), (y_min, y_max)) of the rows of data, or of its placed nodes if it has none."""
+	if data.rows:
+		return (
+			(min(r.subrow_origin for r in data.rows), max(r.subrow_origin + r.num_sites * r.site_spacing for r in data.rows)),
+			(min(r.coordinate for r in data.rows), max(r.coordinate + r.height for r in data.rows)),
+		)
+	from bookshelf_bin import ORIENTATIONS
+
+	turned = [o in ('W', 'E', 'FW', 'FE') for o in ORIENTATIONS]
+	x_max = y_max = -9e99
+	for i in range(len(data.node_names)):
+		(w, h) = (data.node_width[i], data.node_height[i])
+		if turned[data.pl_orient[i]]:
+			(w, h) = (h, w)
+		x_max = max(x_max, data.pl_x[i] + w)
+		y_max = max(y_max, data.pl_y[i] + h)
+	return ((min(data.pl_x), x_max), (min(data.pl_y), y_max))
+
+
+def congestion_map(data, bins=64, rsmt=False, jobs=1):
+	"""CongestionMap of a placed bookshelf_bin.BookshelfData."""
+	from wirelength import estimate_nets, net_points
+
+	nets = net_points(data)
+	lengths = [e[2] for e in estimate_nets(nets, jobs=jobs)] if rsmt else [None] * len(nets)
+	grid = CongestionMap(placement_bbox(data), bins, bins)
+	for (xs, ys), weight, length in zip(nets, data.net_weight, lengths):
+		grid.add_net(xs, ys, weight=weight, length=length)
+	return grid
+
+
+def utilization(demand, capacity):
+	return [[d / capacity for d in row] for row in demand]
+
+
+def overflow_stats(demand, capacity):
+	"""Peak and average utilization, ACE, total overflow and the overflowing cells of a demand map."""
+	cells = sorted((d for row in demand for d in row), reverse=True)
+	stats = {
+		'cells': len(cells),
+		'capacity': capacity,
+		'total_demand': sum(cells),
+		'max_utilization': cells[0] / capacity,
+		'average_utilization': sum(cells) / capacity / len(cells),
+		'total_overflow': sum(d - capacity for d in cells if d > capacity),
+		'overflow_cells': sum(1 for d in cells if d > capacity),
+	}
+	for percent in ACE_PERCENTS:
+		worst = cells[:max(1, int(len(cells) * percent / 100.0))]
+		stats['ace_' + str(percent)] = sum(worst) / capacity / len(worst)
+	return stats
+
+
+def heatmap_str(values):
+	"""One line per grid row, top row first."""
+	return ''.join(' '.join(repr(v) for v in row) + '\n' for row in reversed(values))
+
+
+def pgm_bytes(values, scale=1.0):
+	"""Binary grey scale (PGM) image of values, values of scale or more are white. Top row first."""
+	height = len(values)
+	width = len(values[0]) if values else 0
+	pixels = bytearray(min(255, int(255 * v / scale)) for row in reversed(values) for v in row)
+	return ('P5\n' + str(width) + ' ' + str(height) + '\n255\n').encode('ascii') + bytes(pixels)
+
+
+if __name__ == '__main__':
+	import time
+	from docopt import docopt
+	from wirelength import load_placed
+
+	arguments = docopt(__doc__, version='congestion v0.1')
+	project_name = str(arguments['<STEM_NAME>'])
+	data = load_placed(project_name, str(arguments['--pl']) if arguments['--pl'] else None)
+
+	start = time.time()
+	grid = congestion_map(data, bins=int(arguments['--bins']), rsmt=arguments['--rsmt'])
+	demand = grid.demand()
+	capacity = int(arguments['--layers']) * grid.cell_w * grid.cell_h / float(arguments['--pitch'])
+	stats = overflow_stats(demand, capacity)
+	seconds = time.time() - start
+
+	print('nets: ' + str(len(data.net_names)) + ', grid: ' + str(grid.nx) + ' x ' + str(grid.ny) + ' cells of ' + str(round(grid.cell_w, 4)) + ' x ' + str(round(grid.cell_h, 4)))
+	for key in ['max_utilization', 'average_utilization'] + ['ace_' + str(p) for p in ACE_PERCENTS]:
+		print(key + ': ' + str(round(stats[key], 4)))
+	print('overflow: ' + str(round(stats['total_overflow'], 4)) + ' in ' + str(stats['overflow_cells']) + ' of ' + str(stats['cells']) + ' cells')
+	print(str(round(seconds, 3)) + ' s')
+
+	if arguments['--heatmap']:
+		with open(str(arguments['--heatmap']), 'w') as f:
+			f.write(heatmap_str(utilization(demand, capacity)))
+	if arguments['--image']:
+		with open(str(arguments['--image']), 'wb') as f:
+			f.write(pgm_bytes(utilization(demand, capacity)))
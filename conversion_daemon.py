@@ -0,0 +1,249 @@
+"""ConversionDaemon.
+
+A resident process that runs eagle2bookshelf2012.py, bookshelf2eagle.py and xml2bookshelf.py jobs
+sent over a local Unix socket.
+
+Starting the converters for every small board mostly pays for importing Swoop, lxml and docopt.
+The daemon imports them once and keeps the lazy footprint cache (see lazy_board.py) warm between jobs.
+While a daemon is listening those scripts become thin clients: they send their command line and
+working directory to the daemon and print what the job printed. Without a daemon they run in process.
+Set EAGLE2BOOKSHELF_NO_DAEMON=1 to always run in process.
+
+Jobs run one at a time in the daemon, in the working directory of the client.
+The daemon does not reload the converters, restart it after updating them.
+
+Usage:
+  conversion_daemon.py -h | --help
+  conversion_daemon.py start [--socket <PATH>]
+  conversion_daemon.py stop [--socket <PATH>]
+  conversion_daemon.py status [--socket <PATH>]
+
+-h --help                      Show this message.
+-s --socket PATH               The Unix socket, $EAGLE2BOOKSHELF_SOCKET or <tmp>/eagle2bookshelf-<uid>.sock if not given.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import json
+import os
+import socket
+import sys
+import tempfile
+import traceback
+
+try:
+	import socketserver
+except ImportError: # python 2
+	import SocketServer as socketserver
+
+try:
+	from StringIO import StringIO # python 2, print writes str
+except ImportError:
+	from io import StringIO
+
+
+# tool name -> module with a main(argv) function
+TOOLS = {
+	'eagle2bookshelf2012': 'eagle2bookshelf2012',
+	'bookshelf2eagle': 'bookshelf2eagle',
+	'xml2bookshelf': 'xml2bookshelf',
+}
+NO_DAEMON_VARIABLE = 'EAGLE2BOOKSHELF_NO_DAEMON'
+SOCKET_VARIABLE = 'EAGLE2BOOKSHELF_SOCKET'
+
+
+def default_socket_path():
+	if os.environ.get(SOCKET_VARIABLE):
+		return os.environ[SOCKET_VARIABLE]
+	uid = os.getuid() if hasattr(os, 'getuid') else 0
+	return os.path.join(tempfile.gettempdir(), 'eagle2bookshelf-' + str(uid) + '.sock')
+
+
+def _send(sock, message):
+	sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+
+
+def _receive(sock):
+	data = b''
+	while not data.endswith(b'\n'):
+		chunk = sock.recv(65536)
+		if not chunk:
+			break
+		data += chunk
+	return json.loads(data.decode('utf-8')) if data else None
+
+
+def request(message, socket_path=None):
+	"""Send one request to the daemon and return its reply, or None if no daemon is listening."""
+	if not hasattr(socket, 'AF_UNIX'):
+		return None
+	sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		sock.connect(socket_path or default_socket_path())
+	except socket.error:
+		sock.close()
+		return None
+	try:
+		_send(sock, message)
+		sock.shutdown(socket.SHUT_WR)
+		return _receive(sock)
+	finally:
+		sock.close()
+
+
+def forward(tool, argv, socket_path=None):
+	"""Run a converter command line in the daemon. Returns the exit status, or None if no daemon is listening."""
+	if os.environ.get(NO_DAEMON_VARIABLE):
+		return None
+	reply = request({'job': 'run', 'tool': tool, 'argv': list(argv), 'cwd': os.getcwd()}, socket_path)
+	if reply is None:
+		return None
+	sys.stdout.write(reply['output'])
+	sys.stdout.flush()
+	return reply['status']
+
+
+def run_cli(tool, main):
+	"""The __main__ of the converters: a thin client if a daemon is listening, main() in process otherwise."""
+	status = forward(tool, sys.argv[1:])
+	if status is None:
+		main()
+	else:
+		sys.exit(status)
+
+
+def run_captured(function, args, kwargs, cwd):
+	"""Call function(*args, **kwargs) in cwd. Returns (exit status, everything it printed)."""
+	output = StringIO()
+	stdout = sys.stdout
+	previous_cwd = os.getcwd()
+	status = 0
+	try:
+		sys.stdout = output
+		os.chdir(cwd)
+		function(*args, **kwargs)
+	except SystemExit as e: # docopt exits for --help and usage errors
+		if isinstance(e.code, int) or e.code is None:
+			status = e.code or 0
+		else:
+			print(e.code)
+			status = 1
+	except Exception:
+		print(traceback.format_exc())
+		status = 1
+	finally:
+		sys.stdout = stdout
+		os.chdir(previous_cwd)
+	return status, output.getvalue()
+
+
+def run_job(tool, argv, cwd):
+	"""Run main(argv) of a converter in cwd. Returns (exit status, everything it printed)."""
+	def job():
+		import importlib
+		importlib.import_module(TOOLS[tool]).main(argv)
+
+	return run_captured(job, (), {}, cwd)
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+	def handle(self):
+		message = json.loads(self.rfile.readline().decode('utf-8'))
+		job = message.get('job')
+		if job == 'run' and message.get('tool') in TOOLS:
+			status, output = run_job(message['tool'], message['argv'], message['cwd'])
+			reply = {'status': status, 'output': output}
+		elif job == 'ping':
+			reply = {'status': 0, 'output': 'daemon ' + str(os.getpid()) + ', ' + str(self.server.jobs) + ' jobs run\n'}
+		elif job == 'stop':
+			self.server.stopping = True
+			reply = {'status': 0, 'output': 'daemon ' + str(os.getpid()) + ' stopping\n'}
+		else:
+			reply = {'status': 1, 'output': 'unknown job: ' + repr(message) + '\n'}
+		if job == 'run':
+			self.server.jobs += 1
+		self.wfile.write((json.dumps(reply) + '\n').encode('utf-8'))
+
+
+class ConversionServer(socketserver.UnixStreamServer):
+	"""Serves one job at a time. Converters are imported up front so jobs start warm."""
+	def __init__(self, socket_path):
+		if os.path.exists(socket_path):
+			if request({'job': 'ping'}, socket_path) is not None:
+				raise RuntimeError('a daemon is already listening on ' + socket_path)
+			os.remove(socket_path) # left over from a daemon that died
+		socketserver.UnixStreamServer.__init__(self, socket_path, JobHandler)
+		os.chmod(socket_path, 0o600)
+		self.socket_path = socket_path
+		self.jobs = 0
+		self.stopping = False
+
+		for module in sorted(set(TOOLS.values())) + ['Swoop', 'lxml.etree', 'docopt', 'lazy_board']:
+			try:
+				__import__(module)
+			except ImportError as e:
+				print('not preloaded: ' + module + ' (' + str(e) + ')')
+
+	def serve_until_stopped(self):
+		try:
+			while not self.stopping:
+				self.handle_request()
+		finally:
+			self.server_close()
+			if os.path.exists(self.socket_path):
+				os.remove(self.socket_path)
+
+
+def main(argv=None):
+	from docopt import docopt
+
+	arguments = docopt(__doc__, argv=argv, version='conversion_daemon v0.1')
+	socket_path = str(arguments['--socket'] or default_socket_path())
+
+	if arguments['start']:
+		server = ConversionServer(socket_path)
+		print('listening on ' + socket_path)
+		sys.stdout.flush()
+		server.serve_until_stopped()
+	else:
+		reply = request({'job': 'stop' if arguments['stop'] else 'ping'}, socket_path)
+		if reply is None:
+			print('no daemon listening on ' + socket_path)
+			sys.exit(1)
+		sys.stdout.write(reply['output'])
+
+
+if __name__ == '__main__':
+	main()
@@ -7,20 +7,45 @@ These files are sutible for academic IC placement programs.
 This program also outputs a placement file (.pl) from the initial placement in the Eagle file.
 
 This version DOES account for pin placement. But, this feature is unverified.
-This version does not account for net weights. All weights are set to '1'.
+Net weights are all set to '1' unless --weights is given (see net_weights.py).
 
 This program was written by Devon Merrill (devon@ucsd.edu).
 
 Usage:
   eagle2bookshelf2012.py -h | --help
-  eagle2bookshelf2012.py --brd <BRD> --output_prfx <STEM_NAME> --userid <USERID>
+  eagle2bookshelf2012.py --brd <BRD> --output_prfx <STEM_NAME> --userid <USERID> [--weights [--class_weights <W>]] [--cluster] [--fanout_threshold <N>] [--fanout_mode <MODE>] [--binary] [--terminals [--terminal_packages <PKGS>]] [--sides] [--lazy [--jobs <N>] [--region [--row_height <H>] [--site_width <W>]] | --memory_budget <MB>] [--cache <CACHE_DIR> [--link]]
 
 -h --help                      Show this message.
 -i --brd BRD                   The EAGLE .brd file to convert.
 -o --output_prfx STEM_NAME     The stem name for the new files (file names without suffex). Includes directory.
 --userid USERID                Your name and contact.
+--weights                      Derive net weights from net class, net name, degree and routed length.
+--class_weights W              Weights of net classes, comma separated CLASS=WEIGHT with the class number or name.
+--cluster                      Cluster small components with the part they connect to (see cluster.py).
+                               The cluster map is written to <STEM_NAME>.clusters for bookshelf2eagle.
+--fanout_threshold N           Nets with more than N pins are handled with --fanout_mode (see fanout.py).
+                               What was done to each net is written to <STEM_NAME>.fanout.
+--fanout_mode MODE             One of filter, star or weight [default: weight].
+--binary                       Also write the problem to the binary container <STEM_NAME>.bsb (see bookshelf_bin.py).
+--terminals                    Write locked elements (connectors, mounting holes) as fixed terminal nodes.
+                               Their pins stay on the nets, so board edge I/O becomes pins on terminals.
+--terminal_packages PKGS       Also make the elements of these packages terminals. Comma separated PACKAGE or LIBRARY:PACKAGE.
+--sides                        Also write the top side and bottom side problems to <STEM_NAME>.top.* and
+                               <STEM_NAME>.bottom.*, through hole parts are fixed terminals of both (see two_sided.py).
+--lazy                         Only parse the library packages the elements use (see lazy_board.py).
+-j --jobs N                    Compute the package geometry in N worker processes [default: 1].
+--region                       Write placement rows from the board outline to <STEM_NAME>.scl and the keepout and
+                               restrict shapes as fixed blockage nodes (see board_region.py).
+--row_height H                 Row height in board units [default: 1.27].
+--site_width W                 Site width in board units [default: 0.127].
+--memory_budget MB             Out of core conversion in about this many megabytes (see streaming_conversion.py).
+                               Not with --weights, --cluster, --fanout_threshold, --binary, --region or --sides.
+--cache CACHE_DIR              Reuse the outputs of an identical earlier conversion (see result_cache.py).
+--link                         Hard link cached outputs instead of copying them. Do not modify them in place.
 """
 
+from __future__ import print_function
+
 LICENCE = """
 BSD 3-Clause License
 
@@ -53,13 +78,12 @@ OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
-from __future__ import print_function
-
-
 import datetime
+import math
+import re
 
-import Swoop
-from docopt import docopt
+# Swoop and docopt are imported where they are used so that the lazy backend and the
+# conversion daemon client (see conversion_daemon.py) start without them.
 
 
 class PinPercentage(object):
@@ -163,6 +187,91 @@ class Signal(object):
 		# new_pin.y_offset = element.pins[pin_name][1]
 
 
+# EAGLE rotation -> bookshelf orientation. Mirrored (bottom side) elements are flipped about the y axis first.
+ROTATION_ORIENT = {
+	None: 'N', 'R0': 'N', 'R90': 'W', 'R180': 'S', 'R270': 'E',
+	'MR0': 'FN', 'MR90': 'FW', 'MR180': 'FS', 'MR270': 'FE',
+}
+
+
+def plain_rotation(rotation):
+	"""An EAGLE rotation without the spin flag (SR90 -> R90). None stays None."""
+	return None if rotation is None else rotation.replace('S', '')
+
+
+def is_mirrored(rotation):
+	"""True for the rotations of elements on the bottom side (MR0, MR90, ...)."""
+	return rotation is not None and 'M' in rotation
+
+
+# The eight orientations as (swap, x sign, y sign): (x, y) -> (sx * (y if swap else x), sy * (x if swap else y)).
+# Mirrored ones flip x -> -x before rotating, like EAGLE.
+ORIENTATIONS = {
+	'R0': (False, 1, 1), 'R90': (True, -1, 1), 'R180': (False, -1, -1), 'R270': (True, 1, -1),
+	'MR0': (False, -1, 1), 'MR90': (True, -1, -1), 'MR180': (False, 1, -1), 'MR270': (True, 1, 1),
+}
+ROTATION_RE = re.compile(r'^(M?)R(-?[0-9]+(?:\.[0-9]*)?)$')
+
+
+def _signed(interval, sign):
+	"""The interval (lo, hi) multiplied by sign (1 or -1)."""
+	return interval if sign > 0 else (-interval[1], -interval[0])
+
+
+class Variant(object):
+	"""A footprint in one orientation: extents, pin offsets and lower left corner, all relative to the origin."""
+	def __init__(self, bbox, pins):
+		super(Variant, self).__init__()
+		self.bbox = bbox # ((x_min, x_max), (y_min, y_max))
+		self.pins = pins # name -> (x, y)
+		self.lower_left = (bbox[0][0], bbox[1][0])
+		self.width = bbox[0][1] - bbox[0][0]
+		self.height = bbox[1][1] - bbox[1][0]
+
+
+class Footprint(object):
+	"""Variants of a footprint (pins name -> (x, y) and bbox ((x_min, x_max), (y_min, y_max))) by rotation.
+
+	The eight orientations are computed up front. Other angles (R45, MR30, ...) are computed on
+	request from the rotated corners of the bounding box and kept.
+	"""
+	def __init__(self, pins, bbox):
+		super(Footprint, self).__init__()
+		self.pins = pins
+		self.bbox = bbox
+		self.variants = {}
+		for rotation, (swap, sx, sy) in ORIENTATIONS.items():
+			(xs, ys) = (bbox[1], bbox[0]) if swap else bbox
+			self.variants[rotation] = Variant(
+				(_signed(xs, sx), _signed(ys, sy)),
+				dict((n, (sx * (y if swap else x), sy * (x if swap else y))) for n, (x, y) in pins.items()),
+			)
+		self.variants[None] = self.variants['R0']
+
+	def variant(self, rotation):
+		"""The Variant for an EAGLE rotation, None if it can't be parsed."""
+		if rotation in self.variants:
+			return self.variants[rotation]
+		match = ROTATION_RE.match(plain_rotation(rotation))
+		if match is None:
+			return None
+		(mirror, angle) = (match.group(1), float(match.group(2)) % 360.0)
+		if angle % 90.0 == 0.0:
+			v = self.variants[mirror + 'R' + str(int(angle))]
+		else:
+			(c, s) = (math.cos(math.radians(angle)), math.sin(math.radians(angle)))
+			sx = -1 if mirror else 1
+			def transform(x, y):
+				return (sx * x * c - y * s, sx * x * s + y * c)
+			corners = [transform(x, y) for x in self.bbox[0] for y in self.bbox[1]]
+			v = Variant(
+				((min(p[0] for p in corners), max(p[0] for p in corners)), (min(p[1] for p in corners), max(p[1] for p in corners))),
+				dict((n, transform(x, y)) for n, (x, y) in self.pins.items()),
+			)
+		self.variants[rotation] = v
+		return v
+
+
 class ElementEntry(object):
 	def __init__(self, name, library=None, package=None):
 		self.name = name
@@ -178,6 +287,10 @@ class ElementEntry(object):
 		self.y_max = -9e99
 		self.pins = {}
 		self.bounding_box_multiplier = 1.0
+		self.rotation = None
+		self.locked = False
+		self.side = None # 'top', 'bottom' or 'both' to override the side given by the rotation (see two_sided.py)
+		self.footprint = None # Footprint of the extents and pins, may be shared by the elements of a package
 
 	def __str__(self):
 		"""This is in '.blocks' format"""
@@ -203,6 +316,34 @@ class ElementEntry(object):
 		node_str += self.name.rjust(20) + ' ' + str(width).rjust(20) + ' ' + str(height).rjust(20)
 		return node_str
 
+	def variants(self):
+		"""The Footprint of this element, rebuilt if the extents changed since it was set."""
+		bbox = ((self.x_min, self.x_max), (self.y_min, self.y_max))
+		if self.footprint is None or self.footprint.bbox != bbox:
+			self.footprint = Footprint(self.pins, bbox)
+		return self.footprint
+
+	def lower_left_offset(self, rotation):
+		"""(dx, dy) from the origin to the lower left corner of the bounding box placed with rotation.
+
+		None for rotations that can't be parsed.
+		"""
+		v = self.variants().variant(rotation)
+		return None if v is None else v.lower_left
+
+	def lower_left(self):
+		"""Lower left corner of the placed bounding box in board coordinates"""
+		offset = self.lower_left_offset(self.rotation)
+		if offset is None: # this is wrong, but we can't read the rotation
+			return (self.x_loc, self.y_loc) # default to origin
+		return (self.x_loc + offset[0], self.y_loc + offset[1])
+
+	def placed_bbox(self):
+		"""Return ((x_min, x_max), (y_min, y_max)) of the element as placed on the board"""
+		v = self.variants().variant(self.rotation) or self.variants().variant('R0')
+		ll_x, ll_y = self.lower_left()
+		return ((ll_x, ll_x + v.width), (ll_y, ll_y + v.height))
+
 	def expand_bb(self, x_min, x_max, y_min, y_max):
 		self.x_min = min(x_min, self.x_min)
 		self.x_max = max(x_max, self.x_max)
@@ -210,6 +351,8 @@ class ElementEntry(object):
 		self.y_max = max(y_max, self.y_max)
 
 	def add_pin(self, pin):
+		import Swoop
+		self.footprint = None
 		if isinstance(pin, Swoop.Smd):
 			self.pins[pin.get_name()] = (pin.get_x(), pin.get_y())
 		elif isinstance(pin, Swoop.Pad):
@@ -221,6 +364,7 @@ class ElementEntry(object):
 
 def de_bounding_box(drawing_element):
 	"""Return a bounding box for the drawing element."""
+	import Swoop
 	x_min = 9e99
 	x_max = -9e99
 	y_min = 9e99
@@ -303,20 +447,16 @@ def de_bounding_box(drawing_element):
 
 
 
-def run_conversion(
-	user_id = 'No user ID set',
-	project_name = '.',
-	brd_file = 'unplaced.brd'
-):
-
-	brd = Swoop.EagleFile.from_file(brd_file)
+def load_elements(brd):
+	"""Return a dict of ElementEntry (with package geometry and pins) for every element in the board."""
+	import Swoop
 
 	# get the elements (components/blocks/nodes)
 	elements = {}
 	for n in (Swoop.From(brd).
 		get_elements()
 	):
-		name = n.get_name()			
+		name = n.get_name()
 		library = n.get_library()
 		package = n.get_package()
 		e = ElementEntry(name, library=library, package=package)
@@ -329,7 +469,7 @@ def run_conversion(
 	print('total: ' + str(len(elements)) + ' elements (components/blocks/nodes)')
 
 	# get the bounding box for the elements (from lib?)
-	for n, e in elements.iteritems():
+	for n, e in elements.items():
 		eagle_package = Swoop.From(brd).get_library(e.library).get_package(e.package)
 		pads = eagle_package.get_pads()
 		smds = eagle_package.get_smds()
@@ -356,13 +496,12 @@ def run_conversion(
 			# if hasattr(de, 'get_layer') and de.get_layer() not in allowed_layers:
 				# continue
 
-			
 			allowed = [isinstance(de, t) for t in allowed_types]
 			if not any(allowed):
 				continue
 
 			((x_min, x_max), (y_min, y_max)) = de_bounding_box(de)
-			
+
 			e.expand_bb(
 				x_min,
 				x_max,
@@ -370,34 +509,12 @@ def run_conversion(
 				y_max,
 			)
 
-			if e.name == 'K1':
-				print(de)
-				print((e.x_min, e.x_max), (e.y_min, e.y_max))
-
-			# if n == 'JP9':
-			# 	print de
-			# 	print((x_min, x_max), (y_min, y_max))
-			# 	print((e.x_min, e.x_max), (e.y_min, e.y_max))
-			# 	print
-
-
-	# header for nodes file
-	nodes_header = ''
+	return elements
 
-	nodes_header += 'UCLA nodes 1.0\n'
-	nodes_header += '\n'
-	nodes_header += '# Created    : ' + str(datetime.datetime.now()) + '\n'
-	nodes_header += '# Created by : ' + user_id + '\n'
-	nodes_header += '\n'
-	nodes_header += 'NumNodes : ' + str(len(elements)) + '\n'
-	nodes_header += 'NumTerminals : ' + '0' + '\n'
-	nodes_header += '\n'
 
-	nodes_str = ''
-	for n, e in elements.iteritems():
-		nodes_str += e.node_str() + '\n'
-		if n == 'K1':
-			print(e.node_str())
+def load_signals(brd, elements):
+	"""Return a dict of Signal for every signal in the board. Pins use absolute offsets."""
+	import Swoop
 
 	# get the nets (signals/wires)
 	signals = {}
@@ -411,136 +528,333 @@ def run_conversion(
 		for c_ref in c_refs:
 			assert c_ref.get_element() in elements
 			element = elements[c_ref.get_element()]
-			# if element.name == 'JP9':
-				# print element
-				# print element.package
-				# pin_names = sorted(element.pins.keys())#, key=lambda x: if isinstance(x, number): int(x) else: x)
-
-				# last_pin = (0,0)
-				# for pn in pin_names:
-					# print pn, element.pins[pn]
-					# print(last_pin[0] - element.pins[pn][0], last_pin[1] - element.pins[pn][1])
-					# last_pin = element.pins[pn]
-				# exit(-1)
 			pin_name = c_ref.get_pad()
 			signal.add_pin_absolute(element=element, pin_name=pin_name)
 
-
 	print('Total: ' + str(len(signals)) + ' nets')
 
-	nets_header = ''
-	nets_header += 'UCLA nets 1.0\n'
-	nets_header += '\n'
-	nets_header += '# Created    : ' + str(datetime.datetime.now()) + '\n'
-	nets_header += '# Created by : ' + user_id + '\n'
-	nets_header += '\n'
+	return signals
+
+
+def file_header(kind, user_id):
+	"""Header shared by all the bookshelf files. kind is one of 'nodes', 'nets', 'wts', 'pl'."""
+	header = ''
+	header += 'UCLA ' + kind + ' 1.0\n'
+	header += '\n'
+	header += '# Created    : ' + str(datetime.datetime.now()) + '\n'
+	header += '# Created by : ' + user_id + '\n'
+	header += '\n'
+	return header
+
+
+def nodes_file_str(elements, user_id, terminals=()):
+	"""Contents of the .nodes file. Elements named in terminals are written as (fixed) terminal nodes."""
+	# header for nodes file
+	nodes_header = file_header('nodes', user_id)
+	nodes_header += 'NumNodes : ' + str(len(elements)) + '\n'
+	nodes_header += 'NumTerminals : ' + str(len([n for n in elements if n in terminals])) + '\n'
+	nodes_header += '\n'
+
+	nodes_str = ''
+	for n, e in elements.items():
+		if n in terminals:
+			nodes_str += e.node_str() + ' terminal\n'
+		else:
+			nodes_str += e.node_str() + '\n'
+
+	return nodes_header + nodes_str
+
+
+def nets_file_str(signals, user_id):
+	"""Contents of the .nets file."""
+	nets_header = file_header('nets', user_id)
 	nets_header += 'NumNets : ' + str(len(signals)) + '\n'
-	nets_header += 'NumPins : ' + str(sum([len(s.pins) for n, s in signals.iteritems()])) + '\n'
+	nets_header += 'NumPins : ' + str(sum([len(s.pins) for n, s in signals.items()])) + '\n'
 	nets_header += '\n'
 
 	nets_str = ''
-	for n, s in signals.iteritems():
-		degree = len(s.pins)
-		nets_str += 'NetDegree : ' + str(degree) + '\n'
-		for p in s.pins:
-			nets_str += p.name.rjust(15) + ' ' + p.direction.rjust(3) + ' : ' + str(p.x_offset).rjust(10) + ' ' + str(p.y_offset).rjust(10) + '\n'
-		# nets_str += '\n'
-
-	weights_header = ''
-	weights_header += 'UCLA wts 1.0\n'
-	weights_header += '\n'
-	weights_header += '# Created    : ' + str(datetime.datetime.now()) + '\n'
-	weights_header += '# Created by : ' + user_id + '\n'
-	weights_header += '\n'
+	for n, s in signals.items():
+		nets_str += net_str(n, s)
+
+	return nets_header + nets_str
+
+
+def net_str(n, s):
+	"""The .nets record of one signal."""
+	degree = len(s.pins)
+	net_str = 'NetDegree : ' + str(degree) + ' ' + n + '\n'
+	for p in s.pins:
+		net_str += p.name.rjust(15) + ' ' + p.direction.rjust(3) + ' : ' + str(p.x_offset).rjust(10) + ' ' + str(p.y_offset).rjust(10) + '\n'
+	# net_str += '\n'
+	return net_str
+
+
+def wts_file_str(signals, user_id):
+	"""Contents of the .wts file."""
+	weights_header = file_header('wts', user_id)
 
 	weights_str = ''
+	for n, s in signals.items():
+		weights_str += n + ' ' + str(s.weight) + '\n'
 
-	for i, (n, s) in enumerate(signals.iteritems()):
-		name = n
-		weight = s.weight
-		weights_str += name + ' ' + str(weight) + '\n'
+	return weights_header + weights_str
 
 
-	pl_header = ''
-	pl_header += 'UCLA pl 1.0\n'
-	pl_header += '\n'
-	pl_header += '# Created    : ' + str(datetime.datetime.now()) + '\n'
-	pl_header += '# Created by : ' + user_id + '\n'
-	pl_header += '\n'
+def pl_file_str(elements, user_id, terminals=()):
+	"""Contents of the .pl file. The lower left corner of every element is written."""
+	pl_header = file_header('pl', user_id)
 
 	pl_str = ''
-	for n, e in elements.iteritems():
-
-		# if e.name == 'X4':
-			# pl_str += e.name.rjust(15) + ' ' + str(-(e.x_max - e.x_min)/2).rjust(10) + ' ' + str(-(e.y_max-e.y_min)/2).rjust(10)
-		# else:
-
-		ll_x = e.x_loc # default to origin
-		ll_y = e.y_loc # default to origin
-
-		if n == 'K1':
-			print(n, e.rotation)
-		if (e.rotation is None) or (e.rotation == 'R0'): # N
-			# ll_x = e.x_loc - abs(e.x_min)
-			# ll_y = e.y_loc - abs(e.y_min)
-
-			ll_x = e.x_loc + (e.x_min)
-			ll_y = e.y_loc + (e.y_min)
-			# print e.name, 'loc:', (e.x_loc, e.y_loc),'ll:', (ll_x, ll_y), 'x:', (e.x_min, e.x_max), 'y:', (e.y_min, e.y_max)
-		elif e.rotation == 'R90':
-			ll_x = e.x_loc - (e.y_max)
-			ll_y = e.y_loc + (e.x_min)
-			# print e.name, 'loc:', (e.x_loc, e.y_loc),'ll:', (ll_x, ll_y), 'x:', (e.x_min, e.x_max), 'y:', (e.y_min, e.y_max)
-		elif e.rotation == 'R180':
-			ll_x = e.x_loc - (e.x_max)
-			ll_y = e.y_loc - (e.y_max)
-			# print e.name, 'loc:', (e.x_loc, e.y_loc),'ll:', (ll_x, ll_y), 'x:', (e.x_min, e.x_max), 'y:', (e.y_min, e.y_max)
-		elif e.rotation == 'R270':
-			ll_x = e.x_loc + (e.y_min)
-			ll_y = e.y_loc - (e.x_max)
-			# print e.name, 'loc:', (e.x_loc, e.y_loc),'ll:', (ll_x, ll_y), 'x:', (e.x_min, e.x_max), 'y:', (e.y_min, e.y_max)
-		# else: # this is wrong, but we don't handle other rotations yet
-		# 	pass
-
-		# pl_str += e.name.rjust(15) + ' ' + str(e.x_loc).rjust(10) + ' ' + str(e.y_loc).rjust(10)
-		pl_str += e.name.rjust(15) + ' ' + str(ll_x).rjust(10) + ' ' + str(ll_y).rjust(10) # use ll
-		if e.name == 'K1':
-			print  (e.name.rjust(15) + ' ' + str(ll_x).rjust(10) + ' ' + str(ll_y).rjust(10))
-
-		if e.rotation is None:
-			pl_str += ' : N'
-		elif e.rotation == 'R90':
-			pl_str += ' : W' # really, EAGLE does left hand rotation for some reason
-		elif e.rotation == 'R180':
-			pl_str += ' : S'
-		elif e.rotation == 'R270':
-			pl_str += ' : E'
-		else:
-			pl_str += ' : N'
+	for n, e in elements.items():
+		pl_str += pl_line(e, fixed=n in terminals)
 
-		if e.locked == True:
-			pl_str += ' /FIXED\n'.rjust(12)
-		else:
-			pl_str += '\n'
+	return pl_header + pl_str
 
 
-	with open(project_name + '.nodes', 'w') as file:
-		file.write(nodes_header + nodes_str)
+def pl_line(e, fixed=False):
+	"""The .pl record of one element: its lower left corner and orientation."""
 
-	with open(project_name + '.nets', 'w') as file:
-		file.write(nets_header + nets_str)
+	# if e.name == 'X4':
+		# pl_str += e.name.rjust(15) + ' ' + str(-(e.x_max - e.x_min)/2).rjust(10) + ' ' + str(-(e.y_max-e.y_min)/2).rjust(10)
+	# else:
 
-	with open(project_name + '.wts', 'w') as file:
-		file.write(weights_header + weights_str)
+	ll_x, ll_y = e.lower_left()
 
-	with open(project_name + '.pl', 'w') as file:
-		file.write(pl_header + pl_str)
+	# pl_str += e.name.rjust(15) + ' ' + str(e.x_loc).rjust(10) + ' ' + str(e.y_loc).rjust(10)
+	pl_str = e.name.rjust(15) + ' ' + str(ll_x).rjust(10) + ' ' + str(ll_y).rjust(10) # use ll
 
+	# really, EAGLE does left hand rotation for some reason, R90 is W
+	pl_str += ' : ' + ROTATION_ORIENT.get(plain_rotation(e.rotation), 'N')
 
-if __name__ == '__main__':
-	arguments = docopt(__doc__, version='eagle2bookshelf v0.1')
-	run_conversion(
-		user_id=str(arguments['--userid']),
-		project_name=str(arguments['--output_prfx']),
-		brd_file=str(arguments['--brd'])
+	if e.locked == True or fixed:
+		pl_str += ' /FIXED\n'.rjust(12)
+	else:
+		pl_str += '\n'
+
+	return pl_str
+
+
+def is_terminal(e, terminal_packages=()):
+	"""True if element e is fixed: locked, or of one of terminal_packages (PACKAGE or LIBRARY:PACKAGE)."""
+	if e.locked == True:
+		return True
+	return e.package is not None and (e.package in terminal_packages or str(e.library) + ':' + e.package in terminal_packages)
+
+
+def fixed_terminals(elements, terminal_packages=()):
+	"""Names of the elements written as fixed terminal nodes."""
+	return set(n for n, e in elements.items() if is_terminal(e, terminal_packages))
+
+
+def bookshelf_outputs(project_name, elements, signals, user_id, terminals=()):
+	"""(file name, contents) of the .nodes, .nets, .wts and .pl files for project_name."""
+	return [
+		(project_name + '.nodes', nodes_file_str(elements, user_id, terminals=terminals)),
+		(project_name + '.nets', nets_file_str(signals, user_id)),
+		(project_name + '.wts', wts_file_str(signals, user_id)),
+		(project_name + '.pl', pl_file_str(elements, user_id, terminals=terminals)),
+	]
+
+
+def write_outputs(outputs):
+	"""Write (file name, contents) pairs. bytes contents are written in binary mode."""
+	for fname, contents in outputs:
+		binary = isinstance(contents, bytes) and not isinstance(contents, str) # python 2 text is bytes too
+		with open(fname, 'wb' if binary else 'w') as file:
+			file.write(contents)
+
+
+def write_bookshelf(project_name, elements, signals, user_id, terminals=()):
+	"""Write the .nodes, .nets, .wts and .pl files for project_name."""
+	write_outputs(bookshelf_outputs(project_name, elements, signals, user_id, terminals=terminals))
+
+
+def run_conversion(
+	user_id = 'No user ID set',
+	project_name = '.',
+	brd_file = 'unplaced.brd',
+	weights = False,
+	class_weights = None,
+	cluster = False,
+	fanout_threshold = None,
+	fanout_mode = 'weight',
+	binary = False,
+	lazy = False,
+	memory_budget = None,
+	jobs = 1,
+	terminals = False,
+	terminal_packages = (),
+	region = False,
+	row_height = 1.27,
+	site_width = 0.127,
+	sides = False,
+):
+
+	if memory_budget is not None:
+		assert not (weights or class_weights or cluster or binary or region or sides or fanout_threshold is not None), 'the out of core conversion only writes the plain bookshelf files'
+		from streaming_conversion import run_streaming_conversion
+		run_streaming_conversion(
+			user_id=user_id,
+			project_name=project_name,
+			brd_file=brd_file,
+			memory_budget=memory_budget,
+			terminals=terminals,
+			terminal_packages=terminal_packages,
+		)
+		return
+
+	write_outputs(conversion_outputs(
+		load_board(brd_file, lazy=lazy),
+		user_id=user_id,
+		project_name=project_name,
+		weights=weights,
+		class_weights=class_weights,
+		cluster=cluster,
+		fanout_threshold=fanout_threshold,
+		fanout_mode=fanout_mode,
+		binary=binary,
+		jobs=jobs,
+		terminals=terminals,
+		terminal_packages=terminal_packages,
+		region=region,
+		row_height=row_height,
+		site_width=site_width,
+		sides=sides,
+	))
+
+
+def load_board(brd_file, lazy=False):
+	"""Parse a board: a Swoop EagleFile, or a lazy_board.LazyBoard if lazy."""
+	if lazy:
+		import lazy_board
+		return lazy_board.LazyBoard.from_file(brd_file)
+	else:
+		import Swoop
+		return Swoop.EagleFile.from_file(brd_file)
+
+
+def conversion_outputs(
+	board,
+	user_id = 'No user ID set',
+	project_name = '.',
+	weights = False,
+	class_weights = None,
+	cluster = False,
+	fanout_threshold = None,
+	fanout_mode = 'weight',
+	binary = False,
+	jobs = 1,
+	terminals = False,
+	terminal_packages = (),
+	region = False,
+	row_height = 1.27,
+	site_width = 0.127,
+	sides = False,
+):
+	"""Convert a board from load_board(). Returns the (file name, contents) pairs to write.
+
+	class_weights maps a net class number or name to its weight (net_weights.WeightRules.class_weights).
+	"""
+	import lazy_board
+
+	lazy = isinstance(board, lazy_board.LazyBoard)
+	if lazy:
+		elements = lazy_board.load_elements(board, jobs=jobs)
+		signals = lazy_board.load_signals(board, elements)
+	else:
+		brd = board
+		elements = load_elements(brd)
+		signals = load_signals(brd, elements)
+
+	outputs = []
+
+	if weights:
+		from net_weights import WeightRules, compute_weights, load_net_info, load_class_names
+		rules = WeightRules()
+		rules.class_weights = dict(class_weights or {})
+		if lazy:
+			net_classes, routed_lengths = lazy_board.load_net_info(board)
+			class_names = lazy_board.load_class_names(board)
+		else:
+			net_classes, routed_lengths = load_net_info(brd)
+			class_names = load_class_names(brd) if class_weights else {}
+		compute_weights(signals, net_classes=net_classes, routed_lengths=routed_lengths, rules=rules, class_names=class_names)
+
+	if cluster:
+		from cluster import find_clusters, coarsen_board, cluster_map_str
+		elements, signals, cluster_map = coarsen_board(elements, signals, find_clusters(elements, signals))
+		outputs.append((project_name + '.clusters', cluster_map_str(cluster_map, user_id)))
+
+	if fanout_threshold is not None:
+		from fanout import handle_high_fanout, fanout_report_str
+		elements, signals, stats = handle_high_fanout(elements, signals, fanout_threshold, mode=fanout_mode)
+		outputs.append((project_name + '.fanout', fanout_report_str(stats, user_id)))
+
+	fixed = fixed_terminals(elements, terminal_packages) if terminals or terminal_packages else set()
+
+	if region:
+		assert lazy, 'the placement region is read with lazy_board, use --lazy'
+		from board_region import load_region, scl_file_str
+		rows, blockages = load_region(board, row_height=row_height, site_width=site_width)
+		elements = dict(elements)
+		elements.update(blockages)
+		fixed |= set(blockages)
+		outputs.append((project_name + '.scl', scl_file_str(rows, user_id)))
+
+	outputs += bookshelf_outputs(project_name, elements, signals, user_id, terminals=fixed)
+
+	if sides:
+		from two_sided import sides_outputs
+		outputs += sides_outputs(board, project_name, elements, signals, user_id, terminals=fixed)
+
+	if binary:
+		import bookshelf_bin
+		outputs.append((project_name + '.bsb', bookshelf_bin.to_bytes(bookshelf_bin.BookshelfData.from_board(elements, signals, terminals=fixed))))
+
+	return outputs
+
+
+def main(argv=None):
+	from docopt import docopt
+	from net_weights import parse_class_weights
+
+	arguments = docopt(__doc__, argv=argv, version='eagle2bookshelf v0.1')
+	options = dict(
+		weights=arguments['--weights'],
+		class_weights=parse_class_weights(str(arguments['--class_weights'])) if arguments['--class_weights'] else None,
+		cluster=arguments['--cluster'],
+		fanout_threshold=int(arguments['--fanout_threshold']) if arguments['--fanout_threshold'] else None,
+		fanout_mode=str(arguments['--fanout_mode']),
+		binary=arguments['--binary'],
+		lazy=arguments['--lazy'],
+		jobs=int(arguments['--jobs']),
+		memory_budget=int(float(arguments['--memory_budget']) * 1024 * 1024) if arguments['--memory_budget'] else None,
+		terminals=arguments['--terminals'],
+		terminal_packages=sorted(p.strip() for p in str(arguments['--terminal_packages'] or '').split(',') if p.strip()),
+		region=arguments['--region'],
+		row_height=float(arguments['--row_height']),
+		site_width=float(arguments['--site_width']),
+		sides=arguments['--sides'],
 	)
+	if arguments['--cache']:
+		from result_cache import ResultCache, cached_conversion
+		cached_conversion(
+			ResultCache(str(arguments['--cache'])),
+			user_id=str(arguments['--userid']),
+			project_name=str(arguments['--output_prfx']),
+			brd_file=str(arguments['--brd']),
+			link=arguments['--link'],
+			**options
+		)
+	else:
+		run_conversion(
+			user_id=str(arguments['--userid']),
+			project_name=str(arguments['--output_prfx']),
+			brd_file=str(arguments['--brd']),
+			**options
+		)
+
+
+if __name__ == '__main__':
+	import conversion_daemon
+	conversion_daemon.run_cli('eagle2bookshelf2012', main)
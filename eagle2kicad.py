@@ -1,6 +1,230 @@
-import pcbnew  
-from pcbnew import IO_MGR, LoadBoard, PCB_LAYER_ID_COUNT
-board = pcbnew.LoadBoard(filename, pcbnew.IO_MGR.EAGLE)
-board.Save(fname)
+"""Eagle2KiCad.
 
+This program converts an EAGLE board (.brd) to a KiCad board (.kicad_pcb, KiCad 5 format) without
+KiCad or the pcbnew module, so it runs headless (e.g. in a pool of batch workers).
 
+The board is read with lazy_board.LazyBoard, like eagle2bookshelf2012.py --lazy: the nets and the
+elements with their placement come from the <signals> and <elements> sections and a footprint is
+built from each used package (pads, smds and the package extents as the courtyard). The footprints
+are streamed to the output element by element as s-expressions.
+Routing, polygons, text and the board outline are not converted; the result is meant for placement
+flows.
+
+Usage:
+  eagle2kicad.py -h | --help
+  eagle2kicad.py --brd <BRD> --out <KICAD_PCB> [--jobs <N>]
+
+-h --help                      Show this message.
+-i --brd BRD                   The EAGLE .brd file to convert.
+-o --out KICAD_PCB             Name for the KiCad board that will be created.
+-j --jobs N                    Compute the footprint geometry in N worker processes [default: 1].
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+import math
+
+
+KICAD_VERSION = '20171130'
+LAYERS = (
+	(0, 'F.Cu', 'signal'), (31, 'B.Cu', 'signal'),
+	(32, 'B.Adhes', 'user'), (33, 'F.Adhes', 'user'), (34, 'B.Paste', 'user'), (35, 'F.Paste', 'user'),
+	(36, 'B.SilkS', 'user'), (37, 'F.SilkS', 'user'), (38, 'B.Mask', 'user'), (39, 'F.Mask', 'user'),
+	(40, 'Dwgs.User', 'user'), (41, 'Cmts.User', 'user'), (42, 'Eco1.User', 'user'), (43, 'Eco2.User', 'user'),
+	(44, 'Edge.Cuts', 'user'), (45, 'Margin', 'user'), (46, 'B.CrtYd', 'user'), (47, 'F.CrtYd', 'user'),
+	(48, 'B.Fab', 'user'), (49, 'F.Fab', 'user'),
+)
+EAGLE_BOTTOM_LAYER = '16'
+PAD_SHAPES = {'square': 'rect', 'round': 'circle', 'octagon': 'circle', 'long': 'oval', 'offset': 'oval'}
+DEFAULT_ANNULUS_RATIO = 1.5 # pad diameter / drill when the pad has no diameter (EAGLE sizes those from the design rules)
+COURTYARD_WIDTH = 0.05
+
+
+def quote(text):
+	"""A KiCad s-expression string."""
+	return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def number(value):
+	text = repr(round(float(value), 6))
+	if text.endswith('.0'):
+		text = text[:-2]
+	return '0' if text == '-0' else text
+
+
+def parse_rotation(rotation):
+	"""(mirrored, degrees) of an EAGLE rotation such as R90 or MR180."""
+	rotation = rotation or 'R0'
+	return ('M' in rotation, float(rotation.lstrip('MSR') or 0))
+
+
+def footprint_pads(package):
+	"""The pads of a parsed <package> as (name, x, y, kind, shape, (width, height), drill, degrees, bottom)."""
+	from lazy_board import _float
+
+	pads = []
+	for node in package:
+		mirrored, degrees = parse_rotation(node.get('rot'))
+		if node.tag == 'smd':
+			roundness = _float(node, 'roundness')
+			shape = 'rect' if not roundness else 'oval' if roundness >= 100 else 'roundrect'
+			size = (_float(node, 'dx'), _float(node, 'dy'))
+			pads.append((node.get('name'), _float(node, 'x'), _float(node, 'y'), 'smd', shape, size, None, degrees, node.get('layer') == EAGLE_BOTTOM_LAYER))
+		elif node.tag == 'pad':
+			drill = _float(node, 'drill')
+			diameter = _float(node, 'diameter') or drill * DEFAULT_ANNULUS_RATIO
+			shape = PAD_SHAPES.get(node.get('shape', 'round'), 'circle')
+			size = (2 * diameter, diameter) if shape == 'oval' else (diameter, diameter)
+			pads.append((node.get('name'), _float(node, 'x'), _float(node, 'y'), 'thru_hole', shape, size, drill, degrees, False))
+	return pads
+
+
+def header_str(nets):
+	"""Everything before the footprints. nets is the list of net names, net n + 1 is nets[n]."""
+	lines = ['(kicad_pcb (version ' + KICAD_VERSION + ') (host eagle2kicad 0.2)', '']
+	lines.append('  (general')
+	lines.append('    (thickness 1.6)')
+	lines.append('  )')
+	lines.append('')
+	lines.append('  (page A4)')
+	lines.append('  (layers')
+	for layer, name, kind in LAYERS:
+		lines.append('    (' + str(layer) + ' ' + name + ' ' + kind + ')')
+	lines.append('  )')
+	lines.append('')
+	lines.append('  (net 0 "")')
+	for i, name in enumerate(nets):
+		lines.append('  (net ' + str(i + 1) + ' ' + quote(name) + ')')
+	lines.append('')
+	return '\n'.join(lines) + '\n'
+
+
+def module_str(e, value, pads, net_of, tstamp=0):
+	"""A placed footprint. e is an ElementEntry, net_of maps a pad name to (net number, net name), tstamp must be unique on the board."""
+	mirrored, degrees = parse_rotation(e.rotation)
+	side = 'B' if mirrored else 'F'
+	sign = -1 if mirrored else 1 # EAGLE mirrors about the y axis
+
+	def local(x, y): # footprint coordinates, y points down in KiCad
+		return number(sign * x) + ' ' + number(-y)
+
+	angle = ' ' + number(degrees) if degrees else ''
+	lines = ['  (module ' + quote(e.library + ':' + e.package) + (' locked' if e.locked else '') + ' (layer ' + side + '.Cu) (tedit 0) (tstamp ' + '%08X' % tstamp + ')']
+	lines.append('    (at ' + number(e.x_loc) + ' ' + number(-e.y_loc) + angle + ')')
+	for kind, text, y in (('reference', e.name, e.y_max), ('value', value, e.y_min)):
+		lines.append('    (fp_text ' + kind + ' ' + quote(text) + ' (at ' + local(0, y) + angle + ') (layer ' + side + '.' + ('SilkS' if kind == 'reference' else 'Fab') + ')')
+		lines.append('      (effects (font (size 1 1) (thickness 0.15))' + (' (justify mirror)' if mirrored else '') + ')')
+		lines.append('    )')
+	if e.x_min <= e.x_max and e.y_min <= e.y_max:
+		corners = ((e.x_min, e.y_min), (e.x_max, e.y_min), (e.x_max, e.y_max), (e.x_min, e.y_max))
+		for (x1, y1), (x2, y2) in zip(corners, corners[1:] + corners[:1]):
+			lines.append('    (fp_line (start ' + local(x1, y1) + ') (end ' + local(x2, y2) + ') (layer ' + side + '.CrtYd) (width ' + number(COURTYARD_WIDTH) + '))')
+	for (name, x, y, kind, shape, (width, height), drill, pad_degrees, bottom) in pads:
+		pad_side = 'B' if bottom != mirrored else 'F'
+		if kind == 'smd':
+			layers = pad_side + '.Cu ' + pad_side + '.Paste ' + pad_side + '.Mask'
+		else:
+			layers = '*.Cu *.Mask'
+		orientation = degrees + sign * pad_degrees # KiCad 5 stores the pad orientation on the board
+		line = '    (pad ' + quote(name) + ' ' + kind + ' ' + shape
+		line += ' (at ' + local(x, y) + (' ' + number(orientation % 360) if orientation % 360 else '') + ')'
+		line += ' (size ' + number(width) + ' ' + number(height) + ')'
+		if drill:
+			line += ' (drill ' + number(drill) + ')'
+		line += ' (layers ' + layers + ')'
+		if shape == 'roundrect':
+			line += ' (roundrect_rratio 0.25)'
+		if name in net_of:
+			line += ' (net ' + str(net_of[name][0]) + ' ' + quote(net_of[name][1]) + ')'
+		lines.append(line + ')')
+	lines.append('  )')
+	return '\n'.join(lines) + '\n'
+
+
+def write_kicad_pcb(out, board, elements, nets):
+	"""Stream the board to the file object out. nets is the list of (signal name, [(element, pad)])."""
+	pad_nets = {} # (element, pad) -> (net number, net name)
+	for i, (name, pins) in enumerate(nets):
+		for pin in pins:
+			pad_nets[pin] = (i + 1, name)
+
+	out.write(header_str([name for name, pins in nets]))
+	footprints = {} # package key -> pads
+	for i, n in enumerate(board.element_nodes()):
+		key = (n.get('library'), n.get('library_urn') or '', n.get('package'))
+		if key not in footprints:
+			footprints[key] = footprint_pads(board.get_package(n.get('library'), n.get('package'), n.get('library_urn')))
+		e = elements[n.get('name')]
+		net_of = dict((p[0], pad_nets[(e.name, p[0])]) for p in footprints[key] if (e.name, p[0]) in pad_nets)
+		out.write(module_str(e, n.get('value') or '', footprints[key], net_of, i + 1))
+	out.write(')\n')
+
+
+def run_conversion(
+	brd_file = 'unplaced.brd',
+	out_file = 'unplaced.kicad_pcb',
+	jobs = 1,
+):
+	from lazy_board import LazyBoard, load_elements
+
+	board = LazyBoard.from_file(brd_file)
+	try:
+		elements = load_elements(board, jobs=jobs)
+		nets = [
+			(n.get('name'), [(c.get('element'), c.get('pad')) for c in n.findall('contactref')])
+			for n in board.signal_nodes()
+		]
+		with open(out_file, 'w') as out:
+			write_kicad_pcb(out, board, elements, nets)
+	finally:
+		board.close()
+
+	print('Total: ' + str(len(nets)) + ' nets')
+
+
+def main(argv=None):
+	from docopt import docopt
+
+	arguments = docopt(__doc__, argv=argv, version='eagle2kicad v0.2')
+	run_conversion(
+		brd_file=str(arguments['--brd']),
+		out_file=str(arguments['--out']),
+		jobs=int(arguments['--jobs']),
+	)
+
+
+if __name__ == '__main__':
+	main()
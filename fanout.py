@@ -0,0 +1,150 @@
+"""Fanout.
+
+Handling of high fanout signals (ground, supplies, resets, ...) before they are written as bookshelf nets.
+
+Signals with more than threshold pins are handled with one of these modes:
+  filter   the net is dropped from the problem.
+  star     a zero size virtual node is added at the centroid of the pins and the net is
+           replaced by one two pin net <NET>__<I> from every pin to the virtual node (<NET>__star).
+           A name that is already taken gets the first free _<N> suffix (<NET>__<I>_1, ...).
+  weight   the net is kept and its weight is multiplied by 1 / (degree - 1).
+Other signals are left alone. A per net report of what was done is returned (and written by eagle2bookshelf2012).
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import datetime
+
+
+FANOUT_MODES = ('filter', 'star', 'weight')
+STAR_SUFFIX = '__star'
+
+
+class FanoutStat(object):
+	"""What was done to one high fanout signal."""
+	def __init__(self, name, degree, mode, weight_before, weight_after, nets_after):
+		super(FanoutStat, self).__init__()
+		self.name = name
+		self.degree = degree
+		self.mode = mode
+		self.weight_before = weight_before
+		self.weight_after = weight_after
+		self.nets_after = nets_after
+
+	def __str__(self):
+		return self.name.rjust(20) + ' ' + str(self.degree).rjust(6) + ' ' + self.mode.rjust(8) + ' ' + str(self.weight_before).rjust(10) + ' ' + str(self.weight_after).rjust(10) + ' ' + str(self.nets_after).rjust(6)
+
+
+def unique_name(name, *taken):
+	"""name, or name with the first _<N> suffix that makes it not a key of any of the dicts in taken."""
+	candidate = name
+	i = 0
+	while any(candidate in t for t in taken):
+		i += 1
+		candidate = name + '_' + str(i)
+	return candidate
+
+
+def handle_high_fanout(elements, signals, threshold, mode='weight'):
+	"""Apply mode to every signal with more than threshold pins.
+
+	Returns (elements, signals, stats). The dicts passed in are not modified, star nodes are added to the returned elements.
+	"""
+	from eagle2bookshelf2012 import ElementEntry, Signal, PinAbsolute
+
+	assert mode in FANOUT_MODES, mode
+
+	new_elements = dict(elements)
+	new_signals = {}
+	stats = []
+	for n, s in signals.items():
+		degree = len(s.pins)
+		if degree <= threshold:
+			new_signals[n] = s
+			continue
+
+		if mode == 'filter':
+			stats.append(FanoutStat(n, degree, mode, s.weight, 0, 0))
+
+		elif mode == 'weight':
+			weighted = Signal(n, weight=round(float(s.weight) / (degree - 1), 6))
+			weighted.pins = s.pins
+			new_signals[n] = weighted
+			stats.append(FanoutStat(n, degree, mode, s.weight, weighted.weight, 1))
+
+		elif mode == 'star':
+			star_name = unique_name(n + STAR_SUFFIX, new_elements)
+			star = ElementEntry(star_name)
+			star.expand_bb(0.0, 0.0, 0.0, 0.0)
+
+			# put the star at the centroid of the placed elements on the net
+			x_sum = 0.0
+			y_sum = 0.0
+			for p in s.pins:
+				((x_min, x_max), (y_min, y_max)) = elements[p.name].placed_bbox()
+				x_sum += (x_min + x_max) / 2.0
+				y_sum += (y_min + y_max) / 2.0
+			star.x_loc = x_sum / degree
+			star.y_loc = y_sum / degree
+			new_elements[star_name] = star
+
+			for i, p in enumerate(s.pins):
+				arm = Signal(unique_name(n + '__' + str(i), signals, new_signals), weight=s.weight)
+				arm.pins = [p, PinAbsolute(star_name, 0.0, 0.0, 'B')]
+				new_signals[arm.name] = arm
+			stats.append(FanoutStat(n, degree, mode, s.weight, s.weight, degree))
+
+	stats.sort(key=lambda x: (-x.degree, x.name))
+	print(str(len(stats)) + ' nets over ' + str(threshold) + ' pins handled with mode ' + mode + ', ' + str(len(signals)) + ' nets became ' + str(len(new_signals)))
+
+	return new_elements, new_signals, stats
+
+
+def fanout_report_str(stats, user_id):
+	"""Contents of the .fanout report."""
+	report_str = ''
+	report_str += '# High fanout nets\n'
+	report_str += '# Created    : ' + str(datetime.datetime.now()) + '\n'
+	report_str += '# Created by : ' + user_id + '\n'
+	report_str += '#' + 'net'.rjust(19) + ' ' + 'degree'.rjust(6) + ' ' + 'mode'.rjust(8) + ' ' + 'weight'.rjust(10) + ' ' + 'new weight'.rjust(10) + ' ' + 'nets'.rjust(6) + '\n'
+	for stat in stats:
+		report_str += str(stat) + '\n'
+
+	return report_str
+
+
+def write_fanout_report(fname, stats, user_id):
+	with open(fname, 'w') as file:
+		file.write(fanout_report_str(stats, user_id))
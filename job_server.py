@@ -0,0 +1,326 @@
+"""JobServer.
+
+An asyncio service for many small conversion (.brd -> bookshelf) and back annotation (.pl -> .brd) jobs.
+Needs Python 3.
+
+Jobs are posted as JSON over HTTP on a Unix socket (or on localhost with --port) and run in a pool of worker
+processes, at most --workers at a time. The reply is streamed as JSON lines: a 'queued' event as soon
+as the job is accepted and a 'done' event with the exit status and everything the job printed.
+A job identical to one still queued or running (same kind, arguments and working directory) is not
+run twice; the second request waits for the first one's result. When more than --max_queue jobs are
+waiting new jobs are refused with 503.
+
+  POST /convert   run_conversion() keyword arguments, e.g. {"brd_file": "a.brd", "project_name": "out/a", "user_id": "me"}
+  POST /update    update_placements() keyword arguments, e.g. {"brd_file": "a.brd", "pl_file": "a.pl", "out_file": "b.brd"}
+  GET  /metrics   queue depth, running and finished jobs and latency percentiles per kind of job.
+A "cwd" member of the JSON body sets the working directory of the job (default: the server's).
+
+Jobs write files where the caller says, so only local clients are served: the Unix socket is only
+accessible by its owner, POST bodies must be sent as Content-Type: application/json (a web page can't
+send that cross origin without a preflight, which is refused) and requests with a Host or Origin
+header naming anything but localhost are refused with 403.
+
+Usage:
+  job_server.py -h | --help
+  job_server.py [--unix <PATH> | --port <PORT>] [--workers <N>] [--max_queue <N>]
+
+-h --help                      Show this message.
+-u --unix PATH                 The Unix socket, <tmp>/eagle2bookshelf-jobs-<uid>.sock if not given.
+-p --port PORT                 Listen on this TCP port on 127.0.0.1 instead of the Unix socket.
+-w --workers N                 Number of worker processes [default: 4].
+-q --max_queue N               Most jobs waiting for a worker before new ones are refused [default: 256].
+"""
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+# URL path -> (module, function) run in the worker processes
+JOBS = {
+	'/convert': ('eagle2bookshelf2012', 'run_conversion'),
+	'/update': ('bookshelf2eagle', 'update_placements'),
+}
+LATENCY_SAMPLES = 1000
+REASONS = {200: 'OK', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found', 415: 'Unsupported Media Type', 503: 'Service Unavailable'}
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+def default_socket_path():
+	uid = os.getuid() if hasattr(os, 'getuid') else 0
+	return os.path.join(tempfile.gettempdir(), 'eagle2bookshelf-jobs-' + str(uid) + '.sock')
+
+
+def host_name(value):
+	"""The host of a Host header (host[:port]) or an Origin (scheme://host[:port]), lower case."""
+	if '://' in value:
+		value = value.split('://', 1)[1]
+	value = value.split('/', 1)[0]
+	if value.startswith('['): # [::1]:8642
+		return value[1:].split(']', 1)[0].lower()
+	return value.rsplit(':', 1)[0].lower() if value.count(':') == 1 else value.lower()
+
+
+def is_local(headers):
+	"""True unless the Host or Origin header names another host than localhost."""
+	for name in ('host', 'origin'):
+		if name in headers and host_name(headers[name]) not in LOCAL_HOSTS:
+			return False
+	return True
+
+
+def run_job(path, kwargs, cwd):
+	"""Runs in a worker process. Returns (exit status, everything the job printed)."""
+	import importlib
+	from conversion_daemon import run_captured
+
+	module, function = JOBS[path]
+	return run_captured(getattr(importlib.import_module(module), function), (), kwargs, cwd)
+
+
+def percentile(samples, fraction):
+	if not samples:
+		return 0.0
+	ordered = sorted(samples)
+	return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Metrics(object):
+	"""Counters and recent latencies (seconds) of the jobs, per kind of job."""
+	def __init__(self):
+		super(Metrics, self).__init__()
+		self.queued = 0
+		self.running = 0
+		self.finished = collections.Counter()
+		self.failed = collections.Counter()
+		self.deduplicated = collections.Counter()
+		self.refused = collections.Counter()
+		self.wait = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+		self.total = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+
+	def as_dict(self):
+		kinds = {}
+		for path in sorted(JOBS):
+			kinds[path] = {
+				'finished': self.finished[path],
+				'failed': self.failed[path],
+				'deduplicated': self.deduplicated[path],
+				'refused': self.refused[path],
+				'wait_p50': percentile(self.wait[path], 0.5),
+				'wait_p95': percentile(self.wait[path], 0.95),
+				'latency_p50': percentile(self.total[path], 0.5),
+				'latency_p95': percentile(self.total[path], 0.95),
+				'latency_max': max(self.total[path]) if self.total[path] else 0.0,
+			}
+		return {'queue_depth': self.queued, 'running': self.running, 'jobs': kinds}
+
+
+class JobServer(object):
+	def __init__(self, workers=4, max_queue=256):
+		super(JobServer, self).__init__()
+		self.workers = workers
+		self.max_queue = max_queue
+		# the workers start lazily while clients are connected: forked ones would inherit the listening and
+		# client sockets and keep the connections open after writer.close(), so they are never forked from here
+		start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+		self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(start_method))
+		self.slots = None # asyncio.Semaphore, made in the running loop
+		self.in_flight = {} # job key -> asyncio future of (status, output)
+		self.metrics = Metrics()
+
+	async def submit(self, path, kwargs, cwd):
+		"""Run a job, or wait for the identical one in flight. Returns (status, output, deduplicated)."""
+		key = (path, json.dumps(kwargs, sort_keys=True), cwd)
+		if key in self.in_flight:
+			self.metrics.deduplicated[path] += 1
+			status, output = await asyncio.shield(self.in_flight[key])
+			return status, output, True
+
+		future = asyncio.get_running_loop().create_future()
+		self.in_flight[key] = future
+		start = time.time()
+		self.metrics.queued += 1
+		waiting = True
+		try:
+			async with self.slots:
+				self.metrics.queued -= 1
+				waiting = False
+				self.metrics.running += 1
+				self.metrics.wait[path].append(time.time() - start)
+				try:
+					status, output = await asyncio.get_running_loop().run_in_executor(self.pool, run_job, path, kwargs, cwd)
+				except Exception as e: # the worker process died
+					status, output = 1, repr(e) + '\n'
+				finally:
+					self.metrics.running -= 1
+
+			self.metrics.total[path].append(time.time() - start)
+			if status == 0:
+				self.metrics.finished[path] += 1
+			else:
+				self.metrics.failed[path] += 1
+			future.set_result((status, output))
+		finally:
+			if waiting: # cancelled before it got a worker
+				self.metrics.queued -= 1
+			del self.in_flight[key]
+			if not future.done(): # cancelled, do not leave the deduplicated requests waiting
+				future.set_result((1, 'job cancelled\n'))
+		return status, output, False
+
+	async def handle(self, reader, writer):
+		try:
+			method, path, headers, body = await read_request(reader)
+		except (ValueError, asyncio.IncompleteReadError):
+			await respond(writer, 400, {'error': 'malformed request'})
+			return
+
+		if not is_local(headers):
+			await respond(writer, 403, {'error': 'only local clients are served'})
+			return
+
+		if method == 'GET' and path == '/metrics':
+			await respond(writer, 200, self.metrics.as_dict())
+			return
+		if method != 'POST' or path not in JOBS:
+			await respond(writer, 404, {'error': 'unknown job ' + method + ' ' + path})
+			return
+		if headers.get('content-type', '').split(';')[0].strip().lower() != 'application/json':
+			await respond(writer, 415, {'error': 'jobs must be posted as Content-Type: application/json'})
+			return
+		try:
+			kwargs = json.loads(body.decode('utf-8') or '{}')
+			assert isinstance(kwargs, dict)
+		except (ValueError, AssertionError):
+			await respond(writer, 400, {'error': 'the body must be a JSON object'})
+			return
+		if self.metrics.queued >= self.max_queue:
+			self.metrics.refused[path] += 1
+			await respond(writer, 503, {'error': 'queue full', 'queue_depth': self.metrics.queued})
+			return
+
+		cwd = kwargs.pop('cwd', os.getcwd())
+		start = time.time()
+		await start_stream(writer)
+		await send_event(writer, {'event': 'queued', 'queue_depth': self.metrics.queued, 'running': self.metrics.running})
+		status, output, deduplicated = await self.submit(path, kwargs, cwd)
+		await send_event(writer, {
+			'event': 'done',
+			'status': status,
+			'output': output,
+			'deduplicated': deduplicated,
+			'seconds': round(time.time() - start, 6),
+		})
+		await end_stream(writer)
+
+	async def serve(self, port=None, unix_path=None):
+		"""Listen on the Unix socket unix_path (default_socket_path() if not given), or on a TCP port of 127.0.0.1."""
+		self.slots = asyncio.Semaphore(self.workers)
+		if port is None:
+			unix_path = unix_path or default_socket_path()
+			if os.path.exists(unix_path):
+				os.remove(unix_path) # left over from a server that died
+			server = await asyncio.start_unix_server(self.handle, path=unix_path)
+			os.chmod(unix_path, 0o600)
+			print('listening on ' + unix_path)
+		else:
+			server = await asyncio.start_server(self.handle, host='127.0.0.1', port=port)
+			print('listening on http://127.0.0.1:' + str(port))
+		async with server:
+			await server.serve_forever()
+
+
+async def read_request(reader):
+	"""(method, path, headers, body) of one HTTP/1.x request. The header names are lower case."""
+	request_line = (await reader.readline()).decode('latin-1').split()
+	if len(request_line) < 2:
+		raise ValueError(request_line)
+	headers = {}
+	while True:
+		line = (await reader.readline()).decode('latin-1').strip()
+		if not line:
+			break
+		name, _, value = line.partition(':')
+		headers[name.strip().lower()] = value.strip()
+	length = int(headers.get('content-length', 0))
+	body = await reader.readexactly(length) if length else b''
+	return request_line[0].upper(), request_line[1].split('?')[0], headers, body
+
+
+async def respond(writer, code, message):
+	body = (json.dumps(message) + '\n').encode('utf-8')
+	writer.write(
+		('HTTP/1.1 ' + str(code) + ' ' + REASONS[code] + '\r\n'
+		+ 'Content-Type: application/json\r\n'
+		+ 'Content-Length: ' + str(len(body)) + '\r\n'
+		+ 'Connection: close\r\n\r\n').encode('latin-1') + body
+	)
+	await writer.drain()
+	writer.close()
+
+
+async def start_stream(writer):
+	writer.write(
+		('HTTP/1.1 200 OK\r\n'
+		+ 'Content-Type: application/x-ndjson\r\n'
+		+ 'Transfer-Encoding: chunked\r\n'
+		+ 'Connection: close\r\n\r\n').encode('latin-1')
+	)
+	await writer.drain()
+
+
+async def send_event(writer, event):
+	data = (json.dumps(event) + '\n').encode('utf-8')
+	writer.write(('%x\r\n' % len(data)).encode('latin-1') + data + b'\r\n')
+	await writer.drain()
+
+
+async def end_stream(writer):
+	writer.write(b'0\r\n\r\n')
+	await writer.drain()
+	writer.close()
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='job_server v0.1')
+	server = JobServer(workers=int(arguments['--workers']), max_queue=int(arguments['--max_queue']))
+	asyncio.run(server.serve(port=int(arguments['--port']) if arguments['--port'] else None, unix_path=arguments['--unix']))
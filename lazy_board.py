@@ -0,0 +1,387 @@
+"""LazyBoard.
+
+Lazy loading of EAGLE board files (.brd) for the converters.
+
+Swoop.EagleFile.from_file builds an object for everything in the board, including every package of
+every embedded library, even when no element uses it. LazyBoard instead memory maps the file and
+indexes the byte offsets of each <library>/<package> subtree and of the <elements> and <signals>
+sections with one regular expression scan. Only those two sections are parsed up front; a package is
+parsed (with xml.etree) the first time an element refers to it. Loading time follows what the board
+uses, not the size of its libraries.
+
+Package geometry is also cached per process by the contents of the <package> subtree, so a long
+running process (see conversion_daemon.py) computes each footprint once across boards. With it the
+extents and pin offsets of the footprint in all eight orientations are kept
+(eagle2bookshelf2012.Footprint) and shared by the elements of the package.
+load_elements(board, jobs=N) computes the geometry of the distinct packages in N worker processes.
+Only the package bytes go to the workers and the results are merged in board order, so the outputs
+are the same as with jobs=1.
+
+load_elements, load_signals and load_net_info return the same objects as the Swoop based functions
+in eagle2bookshelf2012.py and net_weights.py.
+
+Usage:
+  lazy_board.py -h | --help
+  lazy_board.py <BRD>
+
+-h --help                      Show this message.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import hashlib
+import math
+import mmap
+import multiprocessing
+import re
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import unescape
+
+
+# the tags that delimit the parts of the board we index
+SECTION_TAG = re.compile(br'<(/?)(library|package|plain|classes|elements|signals)\b([^>]*?)(/?)>')
+ATTRIBUTE = re.compile(br'([\w:-]+)\s*=\s*"([^"]*)"')
+ENTITIES = {'&quot;': '"', '&apos;': "'"}
+
+FOOTPRINT_CACHE_SIZE = 4096
+_footprints = {} # sha1 of the <package> bytes -> package_geometry(), shared by all boards
+_variants = {} # sha1 of the <package> bytes -> eagle2bookshelf2012.Footprint
+
+
+def _attributes(raw):
+	return dict(
+		(k.decode('utf-8'), unescape(v.decode('utf-8'), ENTITIES))
+		for k, v in ATTRIBUTE.findall(raw)
+	)
+
+
+def _float(node, key, default=0.0):
+	value = node.get(key)
+	return default if value is None else float(value)
+
+
+class LazyBoard(object):
+	"""Byte offset index of an EAGLE board file. Packages are parsed on demand and cached."""
+	def __init__(self, fname):
+		super(LazyBoard, self).__init__()
+		self.fname = fname
+		with open(fname, 'rb') as f:
+			self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		self.packages = {} # (library, library urn, package) -> (start, end) byte offsets
+		self.sections = {} # 'plain' / 'classes' / 'elements' / 'signals' -> (start, end) byte offsets
+		self._parsed = {}
+		self._geometry = {}
+		self._digests = {}
+
+		library = None
+		starts = {}
+		for m in SECTION_TAG.finditer(self.buffer):
+			closing, tag, attributes, empty = m.groups()
+			tag = tag.decode('ascii')
+			if closing:
+				if tag == 'library':
+					library = None
+				elif tag == 'package':
+					if library is not None and 'package' in starts:
+						self.packages[library + (starts.pop('package'),)] = (starts.pop('package_start'), m.end())
+				elif tag in starts:
+					self.sections[tag] = (starts.pop(tag), m.end())
+			elif tag == 'library':
+				a = _attributes(attributes)
+				library = (a.get('name'), a.get('urn', ''))
+			elif tag == 'package':
+				if not empty:
+					starts['package'] = _attributes(attributes).get('name')
+					starts['package_start'] = m.start()
+			elif empty:
+				self.sections[tag] = (m.start(), m.end())
+			else:
+				starts[tag] = m.start()
+
+	@classmethod
+	def from_file(cls, fname):
+		return cls(fname)
+
+	def close(self):
+		self.buffer.close()
+
+	def _parse(self, start, end):
+		return ET.fromstring(self.buffer[start:end])
+
+	def section(self, name):
+		"""The parsed <plain>, <classes>, <elements> or <signals> section, an empty element if the board has none."""
+		if name not in self._parsed:
+			if name in self.sections:
+				self._parsed[name] = self._parse(*self.sections[name])
+			else:
+				self._parsed[name] = ET.Element(name)
+		return self._parsed[name]
+
+	def plain_nodes(self):
+		return list(self.section('plain'))
+
+	def element_nodes(self):
+		return self.section('elements').findall('element')
+
+	def signal_nodes(self):
+		return self.section('signals').findall('signal')
+
+	def get_package(self, library, package, library_urn=''):
+		"""The parsed <package> subtree."""
+		key = (library, library_urn or '', package)
+		if key not in self._parsed:
+			self._parsed[key] = self._parse(*self.packages[key])
+		return self._parsed[key]
+
+	def package_geometry(self, library, package, library_urn=''):
+		"""(pins, ((x_min, x_max), (y_min, y_max))) of a package, computed once per package."""
+		key = (library, library_urn or '', package)
+		if key not in self._geometry:
+			self.prefetch_geometry([key])
+		return self._geometry[key]
+
+	def footprint(self, library, package, library_urn=''):
+		"""The eagle2bookshelf2012.Footprint of a package, shared with every board holding the same package."""
+		from eagle2bookshelf2012 import Footprint
+
+		key = (library, library_urn or '', package)
+		pins, bbox = self.package_geometry(library, package, library_urn)
+		digest = self._digests[key]
+		if digest not in _variants:
+			_variants[digest] = Footprint(pins, bbox)
+		return _variants[digest]
+
+	def prefetch_geometry(self, keys, jobs=1):
+		"""Compute the geometry of the (library, library urn, package) keys, in jobs worker processes if jobs > 1."""
+		todo = {} # key -> digest of the packages not computed yet
+		geometry = {} # digest -> geometry
+		digests = [] # digests to compute, in order
+		packages = [] # their package bytes
+		for key in keys:
+			if key in self._geometry or key in todo:
+				continue
+			(start, end) = self.packages[key]
+			digest = hashlib.sha1(self.buffer[start:end]).digest()
+			todo[key] = digest
+			self._digests[key] = digest
+			if digest in _footprints:
+				geometry[digest] = _footprints[digest]
+			elif digest not in geometry:
+				geometry[digest] = None
+				digests.append(digest)
+				packages.append(self.buffer[start:end])
+
+		if jobs > 1 and len(packages) > 1:
+			pool = multiprocessing.Pool(min(jobs, len(packages)))
+			try:
+				results = pool.map(_geometry_from_bytes, packages, chunksize=max(1, len(packages) // (4 * jobs)))
+			finally:
+				pool.close()
+				pool.join()
+		else:
+			results = [_geometry_from_bytes(p) for p in packages]
+
+		if len(_footprints) + len(results) > FOOTPRINT_CACHE_SIZE:
+			_footprints.clear()
+			_variants.clear()
+		for digest, g in zip(digests, results):
+			geometry[digest] = g
+			_footprints[digest] = g
+		for key, digest in todo.items():
+			self._geometry[key] = geometry[digest]
+
+def drawing_bounding_box(node):
+	"""Return a bounding box for a drawing element of a parsed package, like eagle2bookshelf2012.de_bounding_box."""
+	x_min = 9e99
+	x_max = -9e99
+	y_min = 9e99
+	y_max = -9e99
+	tag = node.tag
+	if tag == 'wire':
+		if _float(node, 'curve'):
+			pass
+		else:
+			width = _float(node, 'width')
+			x_min = min(_float(node, 'x1'), _float(node, 'x2')) - width
+			x_max = max(_float(node, 'x1'), _float(node, 'x2')) + width
+			y_min = min(_float(node, 'y1'), _float(node, 'y2')) - width
+			y_max = max(_float(node, 'y1'), _float(node, 'y2')) + width
+	elif tag == 'rectangle':
+		x_min = min(_float(node, 'x1'), _float(node, 'x2'))
+		x_max = max(_float(node, 'x1'), _float(node, 'x2'))
+		y_min = min(_float(node, 'y1'), _float(node, 'y2'))
+		y_max = max(_float(node, 'y1'), _float(node, 'y2'))
+	elif tag == 'hole':
+		x_min = _float(node, 'x') - (_float(node, 'drill')/2.0)
+		x_max = _float(node, 'x') + (_float(node, 'drill')/2.0)
+		y_min = _float(node, 'y') - (_float(node, 'drill')/2.0)
+		y_max = _float(node, 'y') + (_float(node, 'drill')/2.0)
+	elif tag == 'circle':
+		x_min = _float(node, 'x') - (_float(node, 'radius')/2.0) - _float(node, 'width')
+		x_max = _float(node, 'x') + (_float(node, 'radius')/2.0) + _float(node, 'width')
+		y_min = _float(node, 'y') - (_float(node, 'radius')/2.0) - _float(node, 'width')
+		y_max = _float(node, 'y') + (_float(node, 'radius')/2.0) + _float(node, 'width')
+	elif tag == 'polygon':
+		vertices = node.findall('vertex')
+		x_min = min(_float(v, 'x') for v in vertices) - _float(node, 'width')
+		x_max = max(_float(v, 'x') for v in vertices) + _float(node, 'width')
+		y_min = min(_float(v, 'y') for v in vertices) - _float(node, 'width')
+		y_max = max(_float(v, 'y') for v in vertices) + _float(node, 'width')
+	elif tag == 'smd':
+		rotation = node.get('rot')
+		if not rotation or rotation == 'R180':
+			dx = _float(node, 'dx')
+			dy = _float(node, 'dy')
+		elif rotation in ('R90', 'R270'):
+			dx = _float(node, 'dy')
+			dy = _float(node, 'dx')
+		else:
+			return ((x_min, x_max), (y_min, y_max))
+		x_min = _float(node, 'x') - dx
+		x_max = _float(node, 'x') + dx
+		y_min = _float(node, 'y') - dy
+		y_max = _float(node, 'y') + dy
+	elif tag == 'pad':
+		# same shortcut as de_bounding_box, the pad shape and rotation are ignored
+		extra = max(_float(node, 'drill'), _float(node, 'diameter')) / 2.0
+		x_min = _float(node, 'x') - extra
+		x_max = _float(node, 'x') + extra
+		y_min = _float(node, 'y') - extra
+		y_max = _float(node, 'y') + extra
+
+	return ((x_min, x_max), (y_min, y_max))
+
+
+def package_geometry(package):
+	"""Pins (name -> (x, y)) and bounding box of a parsed <package>."""
+	pins = {}
+	x_min = 9e99
+	x_max = -9e99
+	y_min = 9e99
+	y_max = -9e99
+	for node in package:
+		if node.tag in ('pad', 'smd'):
+			pins[node.get('name')] = (_float(node, 'x'), _float(node, 'y'))
+		if node.tag not in ('wire', 'rectangle', 'hole', 'circle', 'polygon', 'smd', 'pad'):
+			continue
+		((de_x_min, de_x_max), (de_y_min, de_y_max)) = drawing_bounding_box(node)
+		x_min = min(de_x_min, x_min)
+		x_max = max(de_x_max, x_max)
+		y_min = min(de_y_min, y_min)
+		y_max = max(de_y_max, y_max)
+	return pins, ((x_min, x_max), (y_min, y_max))
+
+
+def _geometry_from_bytes(raw):
+	return package_geometry(ET.fromstring(raw))
+
+
+def load_elements(board, jobs=1):
+	"""Return a dict of ElementEntry for every element in the board, like eagle2bookshelf2012.load_elements."""
+	from eagle2bookshelf2012 import ElementEntry
+
+	board.prefetch_geometry(
+		[(n.get('library'), n.get('library_urn') or '', n.get('package')) for n in board.element_nodes()],
+		jobs=jobs,
+	)
+
+	elements = {}
+	for n in board.element_nodes():
+		name = n.get('name')
+		e = ElementEntry(name, library=n.get('library'), package=n.get('package'))
+		e.x_loc = _float(n, 'x')
+		e.y_loc = _float(n, 'y')
+		e.rotation = n.get('rot')
+		e.locked = n.get('locked') == 'yes'
+
+		pins, ((x_min, x_max), (y_min, y_max)) = board.package_geometry(e.library, e.package, n.get('library_urn'))
+		e.pins = dict(pins)
+		e.expand_bb(x_min, x_max, y_min, y_max)
+		e.footprint = board.footprint(e.library, e.package, n.get('library_urn'))
+		elements[name] = e
+
+	print('total: ' + str(len(elements)) + ' elements (components/blocks/nodes), ' + str(len(board._geometry)) + ' of ' + str(len(board.packages)) + ' packages loaded')
+
+	return elements
+
+
+def load_signals(board, elements):
+	"""Return a dict of Signal for every signal in the board, like eagle2bookshelf2012.load_signals."""
+	from eagle2bookshelf2012 import Signal
+
+	signals = {}
+	for n in board.signal_nodes():
+		name = n.get('name')
+		signal = Signal(name)
+		signals[name] = signal
+		for c_ref in n.findall('contactref'):
+			assert c_ref.get('element') in elements
+			element = elements[c_ref.get('element')]
+			signal.add_pin_absolute(element=element, pin_name=c_ref.get('pad'))
+
+	print('Total: ' + str(len(signals)) + ' nets')
+
+	return signals
+
+
+def load_net_info(board):
+	"""Net class and routed wire length of every signal, like net_weights.load_net_info."""
+	net_classes = {}
+	routed_lengths = {}
+	for n in board.signal_nodes():
+		name = n.get('name')
+		net_classes[name] = n.get('class')
+		length = 0.0
+		for w in n.findall('wire'):
+			length += math.hypot(_float(w, 'x2') - _float(w, 'x1'), _float(w, 'y2') - _float(w, 'y1'))
+		routed_lengths[name] = length
+	return net_classes, routed_lengths
+
+
+def load_class_names(board):
+	"""Net class number -> name, like net_weights.load_class_names."""
+	return dict((n.get('number'), n.get('name')) for n in board.section('classes').findall('class'))
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='lazy_board v0.1')
+
+	board = LazyBoard.from_file(str(arguments['<BRD>']))
+	used = set((n.get('library'), n.get('library_urn') or '', n.get('package')) for n in board.element_nodes())
+	print('packages: ' + str(len(board.packages)) + ', used by elements: ' + str(len(used)))
+	print('elements: ' + str(len(board.element_nodes())) + ', signals: ' + str(len(board.signal_nodes())))
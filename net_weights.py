@@ -0,0 +1,178 @@
+"""NetWeights.
+
+Net weights for the bookshelf .wts file.
+
+The weight of every signal is the product of
+  * the weight of its net class (WeightRules.class_weights, default 1, see parse_class_weights),
+  * a name based factor: clocks and differential pairs are heavier, supply nets lighter
+    (GND, VCC, 5V, +3.3V, 3V3, V1P8, ...),
+  * a degree factor (2 / degree) ** degree_exponent, so big nets do not dominate,
+  * optionally a routed length factor (routed length / median routed length) ** routed_length_exponent,
+    clamped to [1/max_routed_factor, max_routed_factor], from the wires already in the board.
+All of it is computed in one pass over the signals.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import math
+import re
+
+
+CLOCK_PATTERN = re.compile(r'(CLK|CLOCK|XTAL|OSC|SCK)', re.IGNORECASE)
+POWER_PATTERN = re.compile(r'^(A|D|P)?(GND|VCC|VDD|VSS|VEE|VBAT|VBUS|VIN|\+?\d+([.P]\d+)?V\d*|V\d+P\d+)', re.IGNORECASE)
+DIFF_PAIR_SUFFIXES = (('_P', '_N'), ('+', '-'), ('DP', 'DM'), ('DP', 'DN'))
+
+
+class WeightRules(object):
+	"""Knobs of the net weighting. The defaults are a reasonable start for mixed signal boards."""
+	def __init__(self):
+		super(WeightRules, self).__init__()
+		self.class_weights = {} # net class (number or name) -> weight
+		self.clock_weight = 2.0
+		self.diff_pair_weight = 2.0
+		self.power_weight = 0.25
+		self.degree_exponent = 0.5
+		self.routed_length_exponent = 0.5
+		self.max_routed_factor = 2.0
+
+
+def diff_pair_names(names):
+	"""Names of the signals that have a differential partner (FOO_P / FOO_N etc.)."""
+	names = set(names)
+	paired = set()
+	for n in names:
+		upper = n.upper()
+		for pos, neg in DIFF_PAIR_SUFFIXES:
+			if upper.endswith(pos):
+				stem = n[:len(n) - len(pos)]
+				for partner in (stem + neg, stem + neg.lower()):
+					if partner in names:
+						paired.add(n)
+						paired.add(partner)
+	return paired
+
+
+def parse_class_weights(text):
+	"""Parse CLASS=WEIGHT[,CLASS=WEIGHT...], CLASS is a net class number or name. Returns a dict."""
+	class_weights = {}
+	for item in text.split(','):
+		if not item.strip():
+			continue
+		net_class, sep, weight = item.partition('=')
+		if not sep or not net_class.strip():
+			raise ValueError('expected CLASS=WEIGHT, got ' + repr(item))
+		class_weights[net_class.strip()] = float(weight)
+	return class_weights
+
+
+def compute_weights(signals, net_classes=None, routed_lengths=None, rules=None, class_names=None):
+	"""Set the weight of every Signal in signals. Returns a dict name -> reason string for reporting.
+
+	class_names maps a net class number to its name, so rules.class_weights may use either.
+	"""
+	if rules is None:
+		rules = WeightRules()
+	if net_classes is None:
+		net_classes = {}
+	if class_names is None:
+		class_names = {}
+
+	median_routed = 0.0
+	if routed_lengths:
+		lengths = sorted(l for l in routed_lengths.values() if l > 0.0)
+		if lengths:
+			median_routed = lengths[len(lengths) // 2]
+
+	paired = diff_pair_names(signals)
+
+	reasons = {}
+	for n, s in signals.items():
+		net_class = net_classes.get(n)
+		net_class = None if net_class is None else str(net_class)
+		weight = rules.class_weights.get(net_class, rules.class_weights.get(class_names.get(net_class), 1.0))
+		reason = []
+		if weight != 1.0:
+			reason.append('class ' + str(weight))
+
+		if POWER_PATTERN.match(n):
+			weight *= rules.power_weight
+			reason.append('power')
+		elif n in paired:
+			weight *= rules.diff_pair_weight
+			reason.append('diff')
+		elif CLOCK_PATTERN.search(n):
+			weight *= rules.clock_weight
+			reason.append('clock')
+
+		degree = len(set(p.name for p in s.pins))
+		if degree > 2 and rules.degree_exponent:
+			weight *= (2.0 / degree) ** rules.degree_exponent
+			reason.append('degree ' + str(degree))
+
+		if median_routed > 0.0 and routed_lengths.get(n, 0.0) > 0.0:
+			factor = (routed_lengths[n] / median_routed) ** rules.routed_length_exponent
+			factor = min(max(factor, 1.0 / rules.max_routed_factor), rules.max_routed_factor)
+			weight *= factor
+			reason.append('routed ' + str(round(factor, 3)))
+
+		s.weight = round(weight, 4)
+		reasons[n] = ', '.join(reason)
+
+	return reasons
+
+
+def load_net_info(brd):
+	"""Net class and routed wire length (straight segments) of every signal in a Swoop board."""
+	import Swoop
+
+	net_classes = {}
+	routed_lengths = {}
+	for n in (Swoop.From(brd).
+		get_signals()
+	):
+		name = n.get_name()
+		net_classes[name] = n.get_class()
+		length = 0.0
+		for w in n.get_wires():
+			length += math.hypot(w.get_x2() - w.get_x1(), w.get_y2() - w.get_y1())
+		routed_lengths[name] = length
+	return net_classes, routed_lengths
+
+
+def load_class_names(brd):
+	"""Net class number -> name of a Swoop board."""
+	import Swoop
+
+	return dict((str(c.get_number()), c.get_name()) for c in Swoop.From(brd).get_classes())
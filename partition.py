@@ -0,0 +1,468 @@
+"""Partition.
+
+This program splits the netlist of an EAGLE board (.brd) into K parts and writes one set of
+bookshelf (DAC 2012 contest flavor) files per part, so each part can be placed on its own.
+
+The netlist is treated as a hypergraph (elements are vertices weighted by area, signals are nets)
+and partitioned with a multilevel scheme:
+  1. coarsen by heavy edge matching until the hypergraph is small,
+  2. find an initial bisection by greedy growing from several seeds,
+  3. project back level by level, refining with Fiduccia-Mattheyses (FM) passes.
+K-way partitions are built by recursive bisection.
+
+Each part <STEM_NAME>.part<I>.* holds the elements of the part plus every signal touching it.
+Elements of other parts that share a cut signal are written as fixed terminals at their current position.
+The element to part map is written to <STEM_NAME>.partition.
+
+Usage:
+  partition.py -h | --help
+  partition.py --brd <BRD> --output_prfx <STEM_NAME> --userid <USERID> --parts <K> [--imbalance <EPS>] [--seed <SEED>]
+
+-h --help                      Show this message.
+-i --brd BRD                   The EAGLE .brd file to partition.
+-o --output_prfx STEM_NAME     The stem name for the new files (file names without suffex). Includes directory.
+--userid USERID                Your name and contact.
+-k --parts K                   Number of parts.
+--imbalance EPS                Allowed area imbalance of each part as a fraction [default: 0.1].
+--seed SEED                    Random seed [default: 0].
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import heapq
+import math
+import random
+
+
+COARSEST_SIZE = 60 # stop coarsening below this many vertices
+MIN_COARSEN_RATIO = 0.9 # stop coarsening when a level removes less than 10% of the vertices
+MAX_RATED_NET = 50 # nets bigger than this are ignored when matching
+MAX_GAIN_UPDATE_NET = 200 # gains across nets bigger than this are not updated during a FM pass
+INITIAL_TRIES = 8
+FM_PASSES = 8
+
+
+class Hypergraph(object):
+	"""Vertices 0..n-1 with weights, nets are lists of vertex ids."""
+	def __init__(self, vertex_weights, nets, net_weights):
+		super(Hypergraph, self).__init__()
+		self.vertex_weights = vertex_weights
+		self.nets = nets
+		self.net_weights = net_weights
+		self.incident = [[] for v in vertex_weights]
+		for i, net in enumerate(nets):
+			for v in net:
+				self.incident[v].append(i)
+
+	def __len__(self):
+		return len(self.vertex_weights)
+
+	@staticmethod
+	def from_board(elements, signals):
+		"""Build the hypergraph of an element dict and signal dict. Returns (hypergraph, vertex names)."""
+		names = sorted(elements)
+		ids = dict((n, i) for i, n in enumerate(names))
+
+		vertex_weights = []
+		for n in names:
+			e = elements[n]
+			area = max(e.x_max - e.x_min, 0.0) * max(e.y_max - e.y_min, 0.0)
+			vertex_weights.append(area + 1e-6) # keep empty packages from being free
+
+		nets = []
+		net_weights = []
+		for n in sorted(signals):
+			s = signals[n]
+			net = sorted(set(ids[p.name] for p in s.pins))
+			if len(net) < 2:
+				continue
+			nets.append(net)
+			net_weights.append(float(s.weight))
+
+		return Hypergraph(vertex_weights, nets, net_weights), names
+
+	def induced(self, vertices):
+		"""Sub-hypergraph on vertices. Returns (hypergraph, list mapping new id -> old id)."""
+		new_id = dict((v, i) for i, v in enumerate(vertices))
+		nets = []
+		net_weights = []
+		for net, w in zip(self.nets, self.net_weights):
+			sub = [new_id[v] for v in net if v in new_id]
+			if len(sub) >= 2:
+				nets.append(sub)
+				net_weights.append(w)
+		return Hypergraph([self.vertex_weights[v] for v in vertices], nets, net_weights), list(vertices)
+
+	def cut(self, part):
+		"""Total weight of the nets spanning more than one part."""
+		total = 0.0
+		for net, w in zip(self.nets, self.net_weights):
+			p = part[net[0]]
+			for v in net:
+				if part[v] != p:
+					total += w
+					break
+		return total
+
+
+def coarsen(hg, rng, max_vertex_weight):
+	"""Heavy edge matching. Returns (coarse hypergraph, fine vertex -> coarse vertex)."""
+	n = len(hg)
+	order = list(range(n))
+	rng.shuffle(order)
+
+	cluster = [-1] * n
+	coarse_count = 0
+	for v in order:
+		if cluster[v] != -1:
+			continue
+
+		rating = {}
+		for e in hg.incident[v]:
+			size = len(hg.nets[e])
+			if size > MAX_RATED_NET:
+				continue
+			r = hg.net_weights[e] / (size - 1)
+			for u in hg.nets[e]:
+				if u != v and cluster[u] == -1:
+					rating[u] = rating.get(u, 0.0) + r
+
+		best = None
+		for u, r in rating.items():
+			if hg.vertex_weights[u] + hg.vertex_weights[v] > max_vertex_weight:
+				continue
+			if best is None or (r, -u) > (rating[best], -best):
+				best = u
+
+		cluster[v] = coarse_count
+		if best is not None:
+			cluster[best] = coarse_count
+		coarse_count += 1
+
+	vertex_weights = [0.0] * coarse_count
+	for v in range(n):
+		vertex_weights[cluster[v]] += hg.vertex_weights[v]
+
+	# identical coarse nets are merged and their weights summed
+	merged = {}
+	for net, w in zip(hg.nets, hg.net_weights):
+		coarse_net = tuple(sorted(set(cluster[v] for v in net)))
+		if len(coarse_net) < 2:
+			continue
+		merged[coarse_net] = merged.get(coarse_net, 0.0) + w
+
+	nets = sorted(merged)
+	return Hypergraph(vertex_weights, [list(net) for net in nets], [merged[net] for net in nets]), cluster
+
+
+def _gain(hg, part, counts, v):
+	"""Change in cut weight if v moves to the other side (positive is better)."""
+	side = part[v]
+	gain = 0.0
+	for e in hg.incident[v]:
+		if counts[e][side] == 1:
+			gain += hg.net_weights[e] # v is the last pin of the net on its side, the net becomes uncut
+		if counts[e][1 - side] == 0:
+			gain -= hg.net_weights[e] # the net is not cut yet, moving v cuts it
+	return gain
+
+
+def fm_refine(hg, part, max_weights, min_sizes=(1, 1), passes=FM_PASSES):
+	"""Fiduccia-Mattheyses refinement of a bisection in place.
+
+	Moves never overload a side and never leave a side with fewer than min_sizes vertices.
+	"""
+	n = len(hg)
+	for p in range(passes):
+		counts = [[0, 0] for e in hg.nets]
+		for e, net in enumerate(hg.nets):
+			for v in net:
+				counts[e][part[v]] += 1
+		weights = [0.0, 0.0]
+		sizes = [0, 0]
+		for v in range(n):
+			weights[part[v]] += hg.vertex_weights[v]
+			sizes[part[v]] += 1
+
+		def overload():
+			return max(weights[0] - max_weights[0], 0.0) + max(weights[1] - max_weights[1], 0.0)
+
+		gains = [_gain(hg, part, counts, v) for v in range(n)]
+		heaps = [[], []]
+		for v in range(n):
+			heaps[part[v]].append((-gains[v], v))
+		heapq.heapify(heaps[0])
+		heapq.heapify(heaps[1])
+
+		locked = [False] * n
+		moves = []
+		cut = 0.0
+		best = (overload(), cut, 0)
+		since_best = 0
+
+		while since_best < max(50, n // 10):
+			candidate = None
+			for side in (0, 1):
+				if sizes[side] <= min_sizes[side]:
+					continue # the side would get too few vertices for its parts
+				heap = heaps[side]
+				while heap:
+					g, v = heap[0]
+					if locked[v] or part[v] != side or -g != gains[v]:
+						heapq.heappop(heap) # stale entry
+						continue
+					if weights[1 - side] + hg.vertex_weights[v] > max_weights[1 - side] and weights[side] <= max_weights[side]:
+						heapq.heappop(heap) # would overload the other side
+						locked[v] = True
+						continue
+					break
+				if heap and (candidate is None or heap[0] < candidate):
+					candidate = heap[0]
+			if candidate is None:
+				break
+
+			v = candidate[1]
+			side = part[v]
+			locked[v] = True
+			part[v] = 1 - side
+			weights[side] -= hg.vertex_weights[v]
+			weights[1 - side] += hg.vertex_weights[v]
+			sizes[side] -= 1
+			sizes[1 - side] += 1
+			for e in hg.incident[v]:
+				was_cut = counts[e][0] > 0 and counts[e][1] > 0
+				counts[e][side] -= 1
+				counts[e][1 - side] += 1
+				is_cut = counts[e][0] > 0 and counts[e][1] > 0
+				if was_cut and not is_cut:
+					cut -= hg.net_weights[e]
+				elif is_cut and not was_cut:
+					cut += hg.net_weights[e]
+
+				if len(hg.nets[e]) > MAX_GAIN_UPDATE_NET:
+					continue
+				for u in hg.nets[e]:
+					if not locked[u]:
+						gains[u] = _gain(hg, part, counts, u)
+						heapq.heappush(heaps[part[u]], (-gains[u], u))
+			moves.append(v)
+
+			state = (overload(), cut, len(moves))
+			if state[:2] < best[:2]:
+				best = state
+				since_best = 0
+			else:
+				since_best += 1
+
+		# roll back to the best prefix of moves
+		for v in moves[best[2]:]:
+			part[v] = 1 - part[v]
+
+		if best[2] == 0:
+			break
+
+	return part
+
+
+def _grow(hg, rng, target_weight, min_sizes=(1, 1)):
+	"""Initial bisection: breadth first growth of side 0 from a random seed until it reaches target_weight.
+
+	Side 0 gets at least min_sizes[0] vertices and side 1 keeps at least min_sizes[1].
+	"""
+	n = len(hg)
+	part = [1] * n
+	weight = 0.0
+	size = 0
+	seen = [False] * n
+	start = rng.randrange(n)
+	queue = collections.deque([start])
+	seen[start] = True
+	while (weight < target_weight or size < min_sizes[0]) and n - size > min_sizes[1]:
+		if not queue:
+			rest = [v for v in range(n) if not seen[v]]
+			if not rest:
+				break
+			v = rng.choice(rest)
+			seen[v] = True
+			queue.append(v)
+		v = queue.popleft()
+		part[v] = 0
+		weight += hg.vertex_weights[v]
+		size += 1
+		for e in hg.incident[v]:
+			if len(hg.nets[e]) > MAX_RATED_NET:
+				continue
+			for u in hg.nets[e]:
+				if not seen[u]:
+					seen[u] = True
+					queue.append(u)
+	return part
+
+
+def bisect(hg, fraction, imbalance, rng, min_sizes=(1, 1)):
+	"""Multilevel bisection. Side 0 gets about fraction of the total vertex weight.
+
+	The vertex weight bound alone lets a side end up empty when one vertex outweighs its target,
+	so side i also keeps at least min_sizes[i] vertices.
+	"""
+	if len(hg) < min_sizes[0] + min_sizes[1]:
+		raise ValueError('cannot bisect ' + str(len(hg)) + ' vertices into sides of at least ' + str(min_sizes[0]) + ' and ' + str(min_sizes[1]))
+	total = sum(hg.vertex_weights)
+	targets = (total * fraction, total * (1.0 - fraction))
+	heaviest = max(hg.vertex_weights)
+	max_weights = [max(t * (1.0 + imbalance), t + heaviest) for t in targets]
+
+	# coarsen
+	levels = []
+	coarse = hg
+	while len(coarse) > COARSEST_SIZE:
+		next_coarse, cluster = coarsen(coarse, rng, max_vertex_weight=max(total / COARSEST_SIZE, heaviest))
+		if len(next_coarse) > MIN_COARSEN_RATIO * len(coarse) or len(next_coarse) < min_sizes[0] + min_sizes[1]:
+			break
+		levels.append((coarse, cluster))
+		coarse = next_coarse
+
+	# initial partition on the coarsest level, keep the best of several seeds
+	best = None
+	for i in range(INITIAL_TRIES):
+		part = fm_refine(coarse, _grow(coarse, rng, targets[0], min_sizes), max_weights, min_sizes)
+		weights = [0.0, 0.0]
+		for v, p in enumerate(part):
+			weights[p] += coarse.vertex_weights[v]
+		overload = max(weights[0] - max_weights[0], 0.0) + max(weights[1] - max_weights[1], 0.0)
+		score = (overload, coarse.cut(part))
+		if best is None or score < best[0]:
+			best = (score, part)
+	part = best[1]
+
+	# uncoarsen and refine
+	for fine, cluster in reversed(levels):
+		part = [part[cluster[v]] for v in range(len(fine))]
+		part = fm_refine(fine, part, max_weights, min_sizes)
+
+	return part
+
+
+def partition(hg, k, imbalance=0.1, seed=0):
+	"""K-way partition by recursive bisection. Returns a part id (0..k-1) for every vertex, no part is empty."""
+	if k < 1 or k > len(hg):
+		raise ValueError('cannot partition ' + str(len(hg)) + ' elements into ' + str(k) + ' non-empty parts')
+	rng = random.Random(seed)
+	part = [0] * len(hg)
+	levels = max(1, int(math.ceil(math.log(k, 2)))) if k > 1 else 1
+
+	def recurse(sub, vertices, k, first):
+		if k == 1 or len(sub) < 2:
+			for v in vertices:
+				part[v] = first
+			return
+		k0 = k // 2
+		sides = bisect(sub, float(k0) / k, imbalance / levels, rng, min_sizes=(k0, k - k0))
+		for side, sub_k, sub_first in ((0, k0, first), (1, k - k0, first + k0)):
+			members = [i for i, p in enumerate(sides) if p == side]
+			side_hg, old_ids = sub.induced(members)
+			recurse(side_hg, [vertices[i] for i in old_ids], sub_k, sub_first)
+
+	recurse(hg, list(range(len(hg))), k, 0)
+	return part
+
+
+def write_partitions(project_name, elements, signals, parts, user_id):
+	"""Write one bookshelf file set per part plus the .partition map. parts maps element name -> part id."""
+	from eagle2bookshelf2012 import write_bookshelf
+
+	with open(project_name + '.partition', 'w') as file:
+		for n in sorted(parts):
+			file.write(n.rjust(15) + ' ' + str(parts[n]).rjust(5) + '\n')
+
+	for p in sorted(set(parts.values())):
+		members = [n for n in sorted(elements) if parts[n] == p]
+		member_set = set(members)
+
+		sub_signals = {}
+		for n, s in signals.items():
+			if any(pin.name in member_set for pin in s.pins):
+				sub_signals[n] = s
+
+		terminals = set()
+		for s in sub_signals.values():
+			for pin in s.pins:
+				if pin.name not in member_set:
+					terminals.add(pin.name)
+
+		sub_elements = {}
+		for n in members + sorted(terminals):
+			sub_elements[n] = elements[n]
+
+		print('part ' + str(p) + ': ' + str(len(members)) + ' elements, ' + str(len(terminals)) + ' terminals, ' + str(len(sub_signals)) + ' nets')
+		write_bookshelf(project_name + '.part' + str(p), sub_elements, sub_signals, user_id, terminals=terminals)
+
+
+def run_partition(
+	user_id = 'No user ID set',
+	project_name = '.',
+	brd_file = 'unplaced.brd',
+	k = 2,
+	imbalance = 0.1,
+	seed = 0,
+):
+	import Swoop
+	from eagle2bookshelf2012 import load_elements, load_signals
+
+	brd = Swoop.EagleFile.from_file(brd_file)
+	elements = load_elements(brd)
+	signals = load_signals(brd, elements)
+
+	hg, names = Hypergraph.from_board(elements, signals)
+	part = partition(hg, k, imbalance=imbalance, seed=seed)
+	print('cut: ' + str(hg.cut(part)) + ' of ' + str(sum(hg.net_weights)) + ' total net weight')
+
+	parts = dict(zip(names, part))
+	write_partitions(project_name, elements, signals, parts, user_id)
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='partition v0.1')
+	run_partition(
+		user_id=str(arguments['--userid']),
+		project_name=str(arguments['--output_prfx']),
+		brd_file=str(arguments['--brd']),
+		k=int(arguments['--parts']),
+		imbalance=float(arguments['--imbalance']),
+		seed=int(arguments['--seed']),
+	)
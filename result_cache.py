@@ -0,0 +1,329 @@
+"""ResultCache.
+
+Content addressed cache of whole board conversions (eagle2bookshelf2012.run_conversion).
+
+The key is the SHA-256 of the board file, the conversion options (weights, clustering, fanout
+handling, binary output) and the tool version, which is a digest of the source of the converter
+modules, so any change to the converter invalidates old entries. The user id only appears in the
+"Created by" line of the text file headers, so it is left out of the key and that line is rewritten
+when an entry stored for another user is served.
+On a hit the stored bookshelf files are copied (or hard linked) to the requested stem name without
+loading the board or importing Swoop. On a miss the board is converted and the outputs are stored.
+
+Entries are directories under the cache directory. The least recently used entries are evicted when
+the cache holds more than max_size bytes or max_entries entries. Hit and miss counts are kept in
+stats.json, which is updated under a lock on stats.lock, the limits in config.json.
+
+Hard linked outputs share their data with the cache entry and must not be modified in place.
+
+Usage:
+  result_cache.py -h | --help
+  result_cache.py stats <CACHE_DIR>
+  result_cache.py clear <CACHE_DIR>
+  result_cache.py limit <CACHE_DIR> [--max_size <MB>] [--max_entries <N>]
+
+-h --help                      Show this message.
+--max_size MB                  Most megabytes kept in the cache.
+--max_entries N                Most conversions kept in the cache.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+
+# the modules whose source makes up the tool version
+CONVERTER_MODULES = (
+	'eagle2bookshelf2012',
+	'lazy_board',
+	'board_region',
+	'two_sided',
+	'streaming_conversion',
+	'net_weights',
+	'cluster',
+	'fanout',
+	'bookshelf_bin',
+	'result_cache',
+)
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 10000
+HASH_BLOCK = 1024 * 1024
+CREATED_BY = '# Created by : '
+HEADER_LINES = 8 # the "Created by" line is within the first lines of every text output
+BINARY_SUFFIXES = ('bsb',)
+
+_tool_version = None
+
+
+def tool_version():
+	"""Digest of the source of the converter modules."""
+	global _tool_version
+	if _tool_version is None:
+		h = hashlib.sha256()
+		directory = os.path.dirname(os.path.abspath(__file__))
+		for module in CONVERTER_MODULES:
+			with open(os.path.join(directory, module + '.py'), 'rb') as f:
+				h.update(f.read())
+		_tool_version = h.hexdigest()
+	return _tool_version
+
+
+def file_digest(fname):
+	h = hashlib.sha256()
+	with open(fname, 'rb') as f:
+		for block in iter(lambda: f.read(HASH_BLOCK), b''):
+			h.update(block)
+	return h.hexdigest()
+
+
+def output_suffixes(options):
+	"""The files run_conversion writes for these options."""
+	suffixes = ['nodes', 'nets', 'wts', 'pl']
+	if options.get('cluster'):
+		suffixes.append('clusters')
+	if options.get('fanout_threshold') is not None:
+		suffixes.append('fanout')
+	if options.get('binary'):
+		suffixes.append('bsb')
+	if options.get('region'):
+		suffixes.append('scl')
+	if options.get('sides'):
+		suffixes += [side + '.' + s for side in ('top', 'bottom') for s in ('nodes', 'nets', 'wts', 'pl')]
+	return suffixes
+
+
+class ResultCache(object):
+	def __init__(self, directory):
+		super(ResultCache, self).__init__()
+		self.directory = directory
+		if not os.path.isdir(directory):
+			os.makedirs(directory)
+
+		config = self._read_json('config.json', {})
+		self.max_size = config.get('max_size', DEFAULT_MAX_SIZE)
+		self.max_entries = config.get('max_entries', DEFAULT_MAX_ENTRIES)
+
+	def _read_json(self, name, default):
+		try:
+			with open(os.path.join(self.directory, name), 'r') as f:
+				return json.load(f)
+		except (IOError, OSError, ValueError):
+			return default
+
+	def _write_json(self, name, value):
+		fd, temp = tempfile.mkstemp(dir=self.directory)
+		with os.fdopen(fd, 'w') as f:
+			json.dump(value, f)
+		getattr(os, 'replace', os.rename)(temp, os.path.join(self.directory, name)) # atomic, readers never see a partial file
+
+	@contextlib.contextmanager
+	def _stats_lock(self):
+		"""Serialize the read-modify-write of stats.json between processes."""
+		try:
+			import fcntl
+		except ImportError: # no advisory locks on this platform
+			yield
+			return
+		with open(os.path.join(self.directory, 'stats.lock'), 'a') as f:
+			fcntl.flock(f, fcntl.LOCK_EX)
+			try:
+				yield
+			finally:
+				fcntl.flock(f, fcntl.LOCK_UN)
+
+	def set_limits(self, max_size=None, max_entries=None):
+		if max_size is not None:
+			self.max_size = max_size
+		if max_entries is not None:
+			self.max_entries = max_entries
+		self._write_json('config.json', {'max_size': self.max_size, 'max_entries': self.max_entries})
+		self.evict()
+
+	def stats(self):
+		return self._read_json('stats.json', {'hits': 0, 'misses': 0})
+
+	def _count(self, name):
+		with self._stats_lock():
+			stats = self.stats()
+			stats[name] = stats.get(name, 0) + 1
+			self._write_json('stats.json', stats)
+
+	def key(self, brd_file, options):
+		h = hashlib.sha256()
+		h.update(file_digest(brd_file).encode('ascii'))
+		h.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+		h.update(tool_version().encode('ascii'))
+		return h.hexdigest()
+
+	def entry_path(self, key):
+		return os.path.join(self.directory, key[:2], key)
+
+	def entries(self):
+		"""List of (last use time, size in bytes, path) of all entries."""
+		result = []
+		for prefix in os.listdir(self.directory):
+			prefix_path = os.path.join(self.directory, prefix)
+			if len(prefix) != 2 or not os.path.isdir(prefix_path):
+				continue
+			for key in os.listdir(prefix_path):
+				path = os.path.join(prefix_path, key)
+				size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+				result.append((os.path.getmtime(path), size, path))
+		return result
+
+	def lookup(self, key, project_name, suffixes, link=False, user_id=None):
+		"""Put the stored outputs at project_name.<suffix>. Returns False on a miss.
+
+		If user_id is given the "Created by" line of the text outputs is set to it.
+		"""
+		path = self.entry_path(key)
+		if not all(os.path.exists(os.path.join(path, 'result.' + s)) for s in suffixes):
+			self._count('misses')
+			return False
+		for s in suffixes:
+			source = os.path.join(path, 'result.' + s)
+			destination = project_name + '.' + s
+			if os.path.exists(destination):
+				os.remove(destination) # never write through an old hard link into the cache
+			if user_id is not None and s not in BINARY_SUFFIXES and created_by(source) != user_id:
+				copy_with_user_id(source, destination, user_id)
+				continue
+			if link:
+				try:
+					os.link(source, destination)
+					continue
+				except OSError: # other file system
+					pass
+			shutil.copyfile(source, destination)
+		os.utime(path, None) # most recently used
+		self._count('hits')
+		return True
+
+	def store(self, key, project_name, suffixes):
+		path = self.entry_path(key)
+		if os.path.exists(path):
+			shutil.rmtree(path)
+		parent = os.path.dirname(path)
+		if not os.path.isdir(parent):
+			os.makedirs(parent)
+		temp = tempfile.mkdtemp(dir=self.directory)
+		for s in suffixes:
+			shutil.copyfile(project_name + '.' + s, os.path.join(temp, 'result.' + s))
+		try:
+			os.rename(temp, path)
+		except OSError: # stored by another process meanwhile
+			shutil.rmtree(temp)
+		self.evict()
+
+	def evict(self):
+		"""Remove the least recently used entries until the limits hold."""
+		entries = sorted(self.entries())
+		size = sum(e[1] for e in entries)
+		count = len(entries)
+		for (used, entry_size, path) in entries:
+			if size <= self.max_size and count <= self.max_entries:
+				break
+			shutil.rmtree(path, ignore_errors=True)
+			size -= entry_size
+			count -= 1
+
+	def clear(self):
+		for (used, size, path) in self.entries():
+			shutil.rmtree(path, ignore_errors=True)
+		with self._stats_lock():
+			self._write_json('stats.json', {'hits': 0, 'misses': 0})
+
+
+def created_by(fname):
+	"""The user id in the header of a text output, None if there is none."""
+	with open(fname, 'r') as f:
+		for i, line in zip(range(HEADER_LINES), f):
+			if line.startswith(CREATED_BY):
+				return line[len(CREATED_BY):].rstrip('\n')
+	return None
+
+
+def copy_with_user_id(source, destination, user_id):
+	"""Copy a text output, replacing the user id in its header."""
+	with open(source, 'r') as src, open(destination, 'w') as dst:
+		for i, line in enumerate(src):
+			if i < HEADER_LINES and line.startswith(CREATED_BY):
+				line = CREATED_BY + user_id + '\n'
+			dst.write(line)
+
+
+def cached_conversion(cache, user_id, project_name, brd_file, link=False, **options):
+	"""run_conversion() through the cache. Returns True on a hit."""
+	suffixes = output_suffixes(options)
+	key = cache.key(brd_file, dict((k, v) for k, v in options.items() if k not in ('lazy', 'memory_budget', 'jobs'))) # same outputs either way
+	if cache.lookup(key, project_name, suffixes, link=link, user_id=user_id):
+		print('cache hit: ' + key)
+		return True
+
+	from eagle2bookshelf2012 import run_conversion
+
+	for s in suffixes:
+		if os.path.exists(project_name + '.' + s):
+			os.remove(project_name + '.' + s) # may be a hard link into the cache
+	run_conversion(user_id=user_id, project_name=project_name, brd_file=brd_file, **options)
+	cache.store(key, project_name, suffixes)
+	return False
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='result_cache v0.1')
+	cache = ResultCache(str(arguments['<CACHE_DIR>']))
+
+	if arguments['stats']:
+		stats = cache.stats()
+		entries = cache.entries()
+		lookups = stats.get('hits', 0) + stats.get('misses', 0)
+		print('entries: ' + str(len(entries)) + ' of ' + str(cache.max_entries))
+		print('size: ' + str(sum(e[1] for e in entries)) + ' of ' + str(cache.max_size) + ' bytes')
+		print('hits: ' + str(stats.get('hits', 0)) + ', misses: ' + str(stats.get('misses', 0)) + ', hit rate: ' + str(round(float(stats.get('hits', 0)) / max(lookups, 1), 3)))
+	elif arguments['clear']:
+		cache.clear()
+	elif arguments['limit']:
+		cache.set_limits(
+			max_size=int(float(arguments['--max_size']) * 1024 * 1024) if arguments['--max_size'] else None,
+			max_entries=int(arguments['--max_entries']) if arguments['--max_entries'] else None,
+		)
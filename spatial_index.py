@@ -0,0 +1,296 @@
+"""SpatialIndex.
+
+Spatial index over the placed bounding boxes of EAGLE board elements.
+
+The index is a packed R-tree. Boxes are sorted along a Hilbert curve and packed
+bottom up into nodes of NODE_CAPACITY entries, so rectangle, point and k nearest
+neighbor queries visit O(log n) nodes instead of scanning every element.
+
+Moving, inserting and removing elements is supported (bookshelf2eagle moves parts).
+Changed boxes are kept in a small side list that is scanned linearly and the tree
+is repacked once that list grows past a fraction of the index.
+
+Boxes use the same ((x_min, x_max), (y_min, y_max)) layout as de_bounding_box().
+
+Usage:
+  spatial_index.py -h | --help
+  spatial_index.py --brd <BRD> --rect <X_MIN> <Y_MIN> <X_MAX> <Y_MAX>
+  spatial_index.py --brd <BRD> --point <X> <Y>
+  spatial_index.py --brd <BRD> --nearest <NAME> [--k <K>]
+
+-h --help                      Show this message.
+-i --brd BRD                   The EAGLE .brd file to index.
+--rect                         List the elements overlapping the rectangle.
+--point                        List the elements containing the point.
+--nearest NAME                 List the elements closest to element NAME.
+--k K                          Number of neighbors for --nearest [default: 5].
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import heapq
+
+
+NODE_CAPACITY = 16
+HILBERT_ORDER = 16 # the hilbert grid is 2^16 x 2^16 cells over the indexed area
+
+
+def hilbert_distance(order, x, y):
+	"""Distance along a hilbert curve of the given order for integer cell (x, y)."""
+	d = 0
+	s = 1 << (order - 1)
+	while s > 0:
+		rx = 1 if (x & s) > 0 else 0
+		ry = 1 if (y & s) > 0 else 0
+		d += s * s * ((3 * rx) ^ ry)
+		# rotate the quadrant
+		if ry == 0:
+			if rx == 1:
+				x = s - 1 - x
+				y = s - 1 - y
+			x, y = y, x
+		s >>= 1
+	return d
+
+
+def box_distance(a, b):
+	"""Squared distance between two flat (x_min, y_min, x_max, y_max) boxes. Zero if they touch or overlap."""
+	dx = max(a[0] - b[2], b[0] - a[2], 0.0)
+	dy = max(a[1] - b[3], b[1] - a[3], 0.0)
+	return dx * dx + dy * dy
+
+
+def _overlaps(a, b):
+	return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def _mbr(boxes):
+	x_min = 9e99
+	y_min = 9e99
+	x_max = -9e99
+	y_max = -9e99
+	for b in boxes:
+		x_min = min(x_min, b[0])
+		y_min = min(y_min, b[1])
+		x_max = max(x_max, b[2])
+		y_max = max(y_max, b[3])
+	return (x_min, y_min, x_max, y_max)
+
+
+def _flat(box):
+	((x_min, x_max), (y_min, y_max)) = box
+	return (min(x_min, x_max), min(y_min, y_max), max(x_min, x_max), max(y_min, y_max))
+
+
+class _Node(object):
+	"""Packed R-tree node. Leaf entries are element names, inner entries are _Node."""
+	__slots__ = ('mbr', 'leaf', 'boxes', 'entries')
+
+	def __init__(self, leaf, boxes, entries):
+		self.mbr = _mbr(boxes)
+		self.leaf = leaf
+		self.boxes = boxes
+		self.entries = entries
+
+
+class BoardIndex(object):
+	"""Packed hilbert R-tree over named boxes with support for moving boxes."""
+	def __init__(self, boxes=None, node_capacity=NODE_CAPACITY):
+		super(BoardIndex, self).__init__()
+		self.node_capacity = node_capacity
+		self.boxes = {} # name -> flat (x_min, y_min, x_max, y_max), always current
+		self._root = None
+		self._dirty = set() # names whose box changed since the tree was packed
+		if boxes is not None:
+			for name, box in boxes.items():
+				self.boxes[name] = _flat(box)
+		self.rebuild()
+
+	@staticmethod
+	def from_elements(elements):
+		"""Build an index from a dict of ElementEntry using their placed bounding boxes."""
+		return BoardIndex(dict((n, e.placed_bbox()) for n, e in elements.items()))
+
+	def __len__(self):
+		return len(self.boxes)
+
+	def __contains__(self, name):
+		return name in self.boxes
+
+	def bbox(self, name):
+		"""Current box of name as ((x_min, x_max), (y_min, y_max))."""
+		b = self.boxes[name]
+		return ((b[0], b[2]), (b[1], b[3]))
+
+	def rebuild(self):
+		"""Repack the tree from the current boxes."""
+		self._dirty = set()
+		if not self.boxes:
+			self._root = None
+			return
+
+		(x_min, y_min, x_max, y_max) = _mbr(self.boxes.values())
+		cells = (1 << HILBERT_ORDER) - 1
+		x_scale = cells / max(x_max - x_min, 1e-12)
+		y_scale = cells / max(y_max - y_min, 1e-12)
+
+		def key(name):
+			b = self.boxes[name]
+			cx = int(((b[0] + b[2]) / 2.0 - x_min) * x_scale)
+			cy = int(((b[1] + b[3]) / 2.0 - y_min) * y_scale)
+			return (hilbert_distance(HILBERT_ORDER, cx, cy), name)
+
+		names = sorted(self.boxes, key=key)
+		cap = self.node_capacity
+
+		level = []
+		for i in range(0, len(names), cap):
+			chunk = names[i:i + cap]
+			level.append(_Node(True, [self.boxes[n] for n in chunk], chunk))
+
+		while len(level) > 1:
+			upper = []
+			for i in range(0, len(level), cap):
+				chunk = level[i:i + cap]
+				upper.append(_Node(False, [c.mbr for c in chunk], chunk))
+			level = upper
+
+		self._root = level[0]
+
+	def _touch(self, name):
+		self._dirty.add(name)
+		if len(self._dirty) > max(self.node_capacity, len(self.boxes) // 8):
+			self.rebuild()
+
+	def insert(self, name, box):
+		"""Add or replace the box for name."""
+		self.boxes[name] = _flat(box)
+		self._touch(name)
+
+	def update(self, name, box):
+		"""Move name to a new box."""
+		assert name in self.boxes, name
+		self.insert(name, box)
+
+	def update_element(self, element):
+		"""Move an ElementEntry to its current placed bounding box."""
+		self.insert(element.name, element.placed_bbox())
+
+	def remove(self, name):
+		del self.boxes[name]
+		self._touch(name)
+
+	def query_rect(self, x_min, y_min, x_max, y_max):
+		"""Names of all boxes overlapping (or touching) the rectangle."""
+		q = (min(x_min, x_max), min(y_min, y_max), max(x_min, x_max), max(y_min, y_max))
+		found = []
+		dirty = self._dirty
+		stack = [self._root] if self._root is not None else []
+		while stack:
+			node = stack.pop()
+			for box, entry in zip(node.boxes, node.entries):
+				if not _overlaps(q, box):
+					continue
+				if not node.leaf:
+					stack.append(entry)
+				elif entry not in dirty:
+					found.append(entry)
+		for name in dirty:
+			if name in self.boxes and _overlaps(q, self.boxes[name]):
+				found.append(name)
+		return found
+
+	def query_point(self, x, y):
+		"""Names of all boxes containing the point."""
+		return self.query_rect(x, y, x, y)
+
+	def nearest(self, x, y, k=1):
+		"""The k names closest to the point (x, y) as a list of (distance, name), closest first."""
+		return self._nearest((x, y, x, y), k, exclude=None)
+
+	def neighbors(self, name, k=1):
+		"""The k names closest to the box of name (gap distance), not including name itself."""
+		return self._nearest(self.boxes[name], k, exclude=name)
+
+	def _nearest(self, q, k, exclude):
+		# best first search, the heap holds both tree nodes and element names
+		heap = []
+		counter = 0
+		if self._root is not None:
+			heapq.heappush(heap, (box_distance(q, self._root.mbr), counter, False, self._root))
+		for name in self._dirty:
+			if name in self.boxes:
+				counter += 1
+				heapq.heappush(heap, (box_distance(q, self.boxes[name]), counter, True, name))
+
+		found = []
+		while heap and len(found) < k:
+			dist, _, is_name, item = heapq.heappop(heap)
+			if is_name:
+				if item != exclude:
+					found.append((dist ** 0.5, item))
+				continue
+			for box, entry in zip(item.boxes, item.entries):
+				if item.leaf and entry in self._dirty:
+					continue
+				counter += 1
+				heapq.heappush(heap, (box_distance(q, box), counter, item.leaf, entry))
+		return found
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+	import Swoop
+	from eagle2bookshelf2012 import load_elements
+
+	arguments = docopt(__doc__, version='spatial_index v0.1')
+	brd = Swoop.EagleFile.from_file(str(arguments['--brd']))
+	index = BoardIndex.from_elements(load_elements(brd))
+
+	if arguments['--rect']:
+		names = index.query_rect(
+			float(arguments['<X_MIN>']),
+			float(arguments['<Y_MIN>']),
+			float(arguments['<X_MAX>']),
+			float(arguments['<Y_MAX>']),
+		)
+		for name in sorted(names):
+			print(name)
+	elif arguments['--point']:
+		for name in sorted(index.query_point(float(arguments['<X>']), float(arguments['<Y>']))):
+			print(name)
+	else:
+		for dist, name in index.neighbors(str(arguments['--nearest']), k=int(arguments['--k'])):
+			print(name.rjust(15) + ' ' + str(dist).rjust(20))
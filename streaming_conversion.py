@@ -0,0 +1,273 @@
+"""StreamingConversion.
+
+Out of core conversion of EAGLE board files (.brd) to bookshelf, for panelized boards too large to
+hold as a Swoop tree plus the element and signal dicts plus the output strings.
+
+The board is memory mapped and indexed with lazy_board.LazyBoard.
+  pass 1  counts elements, signals and contact refs for the file headers with a regular expression
+          scan, and builds an open addressing table element name -> package in a memory mapped
+          temporary file (in memory if it fits the budget).
+  pass 2  streams the <elements> section (xml.etree iterparse, elements are discarded as they are
+          written) to the .nodes and .pl files and the <signals> section to the .nets and .wts files.
+Only the geometry of the distinct packages is held in memory. The write buffers are sized from the
+memory budget. The records are written in board order with the same formatting as
+eagle2bookshelf2012.run_conversion, so the outputs are identical apart from the creation time.
+
+Net weights, clustering, fanout handling and the binary container need the whole netlist and are
+not available in this mode.
+
+Usage:
+  streaming_conversion.py -h | --help
+  streaming_conversion.py --brd <BRD> --output_prfx <STEM_NAME> --userid <USERID> [--memory_budget <MB>] [--terminals [--terminal_packages <PKGS>]]
+
+-h --help                      Show this message.
+-i --brd BRD                   The EAGLE .brd file to convert.
+-o --output_prfx STEM_NAME     The stem name for the new files (file names without suffex). Includes directory.
+--userid USERID                Your name and contact.
+--memory_budget MB             Megabytes for buffers and the name table [default: 64].
+--terminals                    Write locked elements as fixed terminal nodes (see eagle2bookshelf2012.py).
+--terminal_packages PKGS       Also make the elements of these packages terminals. Comma separated PACKAGE or LIBRARY:PACKAGE.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import hashlib
+import mmap
+import re
+import struct
+import tempfile
+import xml.etree.ElementTree as ET
+
+
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+SLOT = struct.Struct('<QI') # name hash (0 = empty slot), package id
+ELEMENT_TAG = re.compile(br'<element\b')
+SIGNAL_TAG = re.compile(br'<signal\b')
+CONTACTREF_TAG = re.compile(br'<contactref\b')
+
+
+def name_hash(name):
+	h = struct.unpack('<Q', hashlib.md5(name.encode('utf-8')).digest()[:8])[0]
+	return h or 1
+
+
+class NameTable(object):
+	"""Open addressing hash table element name -> package id in a (memory mapped) buffer.
+
+	Names are stored as 64 bit hashes, which is enough to tell the elements of a board apart.
+	"""
+	def __init__(self, capacity, memory_budget):
+		super(NameTable, self).__init__()
+		size = 16
+		while size < 2 * capacity:
+			size *= 2
+		self.mask = size - 1
+		nbytes = size * SLOT.size
+		if nbytes <= memory_budget // 4:
+			self.file = None
+			self.buffer = bytearray(nbytes)
+		else:
+			self.file = tempfile.TemporaryFile()
+			self.file.truncate(nbytes)
+			self.buffer = mmap.mmap(self.file.fileno(), nbytes)
+
+	def close(self):
+		if self.file is not None:
+			self.buffer.close()
+			self.file.close()
+
+	def _slot(self, h):
+		i = h & self.mask
+		while True:
+			(stored, value) = SLOT.unpack_from(self.buffer, i * SLOT.size)
+			if stored == 0 or stored == h:
+				return i, stored, value
+			i = (i + 1) & self.mask
+
+	def put(self, name, value):
+		h = name_hash(name)
+		i, stored, old = self._slot(h)
+		SLOT.pack_into(self.buffer, i * SLOT.size, h, value)
+
+	def get(self, name):
+		i, stored, value = self._slot(name_hash(name))
+		if stored == 0:
+			raise KeyError(name)
+		return value
+
+
+class SectionReader(object):
+	"""File like view of a byte range of the board, for iterparse."""
+	def __init__(self, buffer, start, end):
+		super(SectionReader, self).__init__()
+		self.buffer = buffer
+		self.position = start
+		self.end = end
+
+	def read(self, size=-1):
+		if size is None or size < 0:
+			size = self.end - self.position
+		data = self.buffer[self.position:min(self.end, self.position + size)]
+		self.position += len(data)
+		return data
+
+
+def count(board, section, pattern):
+	if section not in board.sections:
+		return 0
+	(start, end) = board.sections[section]
+	return sum(1 for _ in pattern.finditer(board.buffer, start, end))
+
+
+def iter_section(board, section, tag):
+	"""Yield the <tag> children of a section one by one, freeing them after use."""
+	if section not in board.sections:
+		return
+	(start, end) = board.sections[section]
+	root = None
+	depth = 0
+	for event, node in ET.iterparse(SectionReader(board.buffer, start, end), events=('start', 'end')):
+		if event == 'start':
+			if root is None:
+				root = node
+			depth += 1
+			continue
+		depth -= 1
+		if depth == 1 and node.tag == tag:
+			yield node
+			root.remove(node)
+
+
+def run_streaming_conversion(
+	user_id = 'No user ID set',
+	project_name = '.',
+	brd_file = 'unplaced.brd',
+	memory_budget = DEFAULT_MEMORY_BUDGET,
+	terminals = False,
+	terminal_packages = (),
+):
+	from eagle2bookshelf2012 import ElementEntry, Footprint, Signal, file_header, net_str, pl_line, is_terminal
+	from lazy_board import LazyBoard, _float
+
+	buffer_size = max(64 * 1024, memory_budget // 16)
+	board = LazyBoard.from_file(brd_file)
+
+	# pass 1: header counts and the element -> package table
+	num_elements = count(board, 'elements', ELEMENT_TAG)
+	num_signals = count(board, 'signals', SIGNAL_TAG)
+	num_pins = count(board, 'signals', CONTACTREF_TAG)
+	table = NameTable(num_elements, memory_budget)
+	def fixed(n): # element node written as a fixed terminal
+		if not (terminals or terminal_packages):
+			return False
+		e = ElementEntry(n.get('name'), library=n.get('library'), package=n.get('package'))
+		e.locked = n.get('locked') == 'yes'
+		return is_terminal(e, terminal_packages)
+
+	package_ids = {}
+	packages = []
+	num_terminals = 0
+	for n in iter_section(board, 'elements', 'element'):
+		num_terminals += fixed(n)
+		key = (n.get('library'), n.get('library_urn') or '', n.get('package'))
+		if key not in package_ids:
+			package_ids[key] = len(packages)
+			packages.append(board.package_geometry(n.get('library'), n.get('package'), n.get('library_urn')))
+		table.put(n.get('name'), package_ids[key])
+
+	print('total: ' + str(num_elements) + ' elements (components/blocks/nodes), ' + str(len(packages)) + ' packages')
+	print('Total: ' + str(num_signals) + ' nets, ' + str(num_pins) + ' pins')
+
+	footprints = [Footprint(pins, bbox) for (pins, bbox) in packages]
+
+	def element_entry(name, package_id):
+		pins, ((x_min, x_max), (y_min, y_max)) = packages[package_id]
+		e = ElementEntry(name)
+		e.pins = pins
+		e.expand_bb(x_min, x_max, y_min, y_max)
+		e.footprint = footprints[package_id]
+		return e
+
+	# pass 2: stream the records
+	try:
+		with open(project_name + '.nodes', 'w', buffering=buffer_size) as nodes_file, open(project_name + '.pl', 'w', buffering=buffer_size) as pl_file:
+			nodes_file.write(file_header('nodes', user_id))
+			nodes_file.write('NumNodes : ' + str(num_elements) + '\n')
+			nodes_file.write('NumTerminals : ' + str(num_terminals) + '\n')
+			nodes_file.write('\n')
+			pl_file.write(file_header('pl', user_id))
+
+			for n in iter_section(board, 'elements', 'element'):
+				e = element_entry(n.get('name'), table.get(n.get('name')))
+				e.x_loc = _float(n, 'x')
+				e.y_loc = _float(n, 'y')
+				e.rotation = n.get('rot')
+				e.locked = n.get('locked') == 'yes'
+				terminal = fixed(n)
+				nodes_file.write(e.node_str() + (' terminal\n' if terminal else '\n'))
+				pl_file.write(pl_line(e, fixed=terminal))
+
+		with open(project_name + '.nets', 'w', buffering=buffer_size) as nets_file, open(project_name + '.wts', 'w', buffering=buffer_size) as wts_file:
+			nets_file.write(file_header('nets', user_id))
+			nets_file.write('NumNets : ' + str(num_signals) + '\n')
+			nets_file.write('NumPins : ' + str(num_pins) + '\n')
+			nets_file.write('\n')
+			wts_file.write(file_header('wts', user_id))
+
+			for n in iter_section(board, 'signals', 'signal'):
+				name = n.get('name')
+				signal = Signal(name)
+				for c_ref in n.findall('contactref'):
+					element = element_entry(c_ref.get('element'), table.get(c_ref.get('element')))
+					signal.add_pin_absolute(element=element, pin_name=c_ref.get('pad'))
+				nets_file.write(net_str(name, signal))
+				wts_file.write(name + ' ' + str(signal.weight) + '\n')
+	finally:
+		table.close()
+		board.close()
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='streaming_conversion v0.1')
+	run_streaming_conversion(
+		user_id=str(arguments['--userid']),
+		project_name=str(arguments['--output_prfx']),
+		brd_file=str(arguments['--brd']),
+		memory_budget=int(float(arguments['--memory_budget']) * 1024 * 1024),
+		terminals=arguments['--terminals'],
+		terminal_packages=sorted(p.strip() for p in str(arguments['--terminal_packages'] or '').split(',') if p.strip()),
+	)
@@ -0,0 +1,156 @@
+"""TwoSided.
+
+Splits an EAGLE board (.brd) into a top side and a bottom side bookshelf (DAC 2012 contest flavor)
+problem, so each side can be placed on its own.
+
+Elements on the bottom side are the mirrored ones (MR0, MR90, ...). Their bounding boxes and
+lower left corners are computed with the mirror applied and their orientation is written as
+FN, FW, FS or FE. Elements with through hole pads occupy both sides: they go into both problems
+as fixed terminals, which couples the two placements. The other side elements a signal of a side
+connects to are fixed terminals of that side too, so the nets keep all their pins.
+
+The problems are written to <STEM_NAME>.top.* and <STEM_NAME>.bottom.*. Back-annotate both .pl
+files at once with bookshelf2eagle.py --pl <STEM_NAME>.top.pl --pl <STEM_NAME>.bottom.pl.
+
+Usage:
+  two_sided.py -h | --help
+  two_sided.py --brd <BRD> --output_prfx <STEM_NAME> --userid <USERID>
+
+-h --help                      Show this message.
+-i --brd BRD                   The EAGLE .brd file.
+-o --output_prfx STEM_NAME     The stem name for the new files (file names without suffex). Includes directory.
+--userid USERID                Your name and contact.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+SIDES = ('top', 'bottom')
+
+
+def through_hole_packages(board):
+	"""(library, package) of the packages of board with through hole pads."""
+	import lazy_board
+
+	packages = set()
+	if isinstance(board, lazy_board.LazyBoard):
+		for n in board.element_nodes():
+			key = (n.get('library'), n.get('package'))
+			if key not in packages and board.get_package(n.get('library'), n.get('package'), n.get('library_urn')).find('pad') is not None:
+				packages.add(key)
+	else:
+		import Swoop
+		for n in Swoop.From(board).get_elements():
+			key = (n.get_library(), n.get_package())
+			if key not in packages and Swoop.From(board).get_library(key[0]).get_package(key[1]).get_pads():
+				packages.add(key)
+	return packages
+
+
+def element_side(e, through_hole=()):
+	"""'top', 'bottom' or 'both' for element e. through_hole is a set of (library, package)."""
+	from eagle2bookshelf2012 import is_mirrored
+
+	if e.side is not None:
+		return e.side
+	if (e.library, e.package) in through_hole:
+		return 'both'
+	return 'bottom' if is_mirrored(e.rotation) else 'top'
+
+
+def split_sides(elements, signals, sides):
+	"""{side: (elements, signals, terminals)} of the top and bottom problems. sides maps element name -> side."""
+	problems = {}
+	for side in SIDES:
+		member_set = set(n for n in elements if sides[n] == side)
+
+		sub_signals = {}
+		for n, s in signals.items():
+			if any(pin.name in member_set for pin in s.pins):
+				sub_signals[n] = s
+
+		terminals = set(n for n in elements if sides[n] == 'both')
+		for s in sub_signals.values():
+			for pin in s.pins:
+				if pin.name not in member_set:
+					terminals.add(pin.name)
+
+		sub_elements = {}
+		for n in elements: # board order
+			if n in member_set or n in terminals:
+				sub_elements[n] = elements[n]
+
+		problems[side] = (sub_elements, sub_signals, terminals)
+	return problems
+
+
+def sides_outputs(board, project_name, elements, signals, user_id, terminals=()):
+	"""(file name, contents) of the <project_name>.top.* and .bottom.* problems. terminals stay fixed in both."""
+	from eagle2bookshelf2012 import bookshelf_outputs
+
+	through_hole = through_hole_packages(board)
+	sides = dict((n, element_side(e, through_hole)) for n, e in elements.items())
+
+	outputs = []
+	for side, (sub_elements, sub_signals, sub_terminals) in sorted(split_sides(elements, signals, sides).items()):
+		fixed = sub_terminals | set(n for n in sub_elements if n in terminals)
+		print(side + ': ' + str(len(sub_elements) - len(sub_terminals)) + ' elements, ' + str(len(sub_terminals)) + ' terminals, ' + str(len(sub_signals)) + ' nets')
+		outputs += bookshelf_outputs(project_name + '.' + side, sub_elements, sub_signals, user_id, terminals=fixed)
+	return outputs
+
+
+def run_two_sided(
+	user_id = 'No user ID set',
+	project_name = '.',
+	brd_file = 'unplaced.brd',
+):
+	import Swoop
+	from eagle2bookshelf2012 import load_elements, load_signals, write_outputs
+
+	brd = Swoop.EagleFile.from_file(brd_file)
+	elements = load_elements(brd)
+	signals = load_signals(brd, elements)
+	write_outputs(sides_outputs(brd, project_name, elements, signals, user_id))
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='two_sided v0.1')
+	run_two_sided(
+		user_id=str(arguments['--userid']),
+		project_name=str(arguments['--output_prfx']),
+		brd_file=str(arguments['--brd']),
+	)
@@ -0,0 +1,232 @@
+"""VerifyRoundtrip.
+
+This program checks that converting an EAGLE board (.brd) to bookshelf and back annotating the
+unchanged placement (.brd -> .nodes/.nets/.wts/.pl -> .brd) leaves every element where it was.
+
+For every board the maximum and mean deviation of the element origins and the number of changed
+rotations are reported per rotation class (R0, R90, ...). Boards are checked in parallel.
+
+The Swoop conversion and back annotation are the reference for the fast paths:
+  --lazy   the lazy_board conversion must write the same bookshelf files (header dates aside),
+  --patch  the byte patching back annotation must put every element where the Swoop one does.
+The exit status is 1 if any deviation is above the tolerance or a fast path differs.
+
+Usage:
+  verify_roundtrip.py -h | --help
+  verify_roundtrip.py [--jobs <N>] [--tolerance <TOL>] [--lazy] [--patch] <BRD>...
+
+-h --help                      Show this message.
+-j --jobs N                    Number of worker processes [default: 4].
+-t --tolerance TOL             Largest allowed deviation in board units [default: 1e-6].
+--lazy                         Also compare the --lazy conversion with the Swoop conversion.
+--patch                        Also compare the --patch back annotation with the Swoop back annotation.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import functools
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+
+
+BOOKSHELF_SUFFIXES = ('nodes', 'nets', 'wts', 'pl')
+
+
+class RotationStats(object):
+	"""Deviation of the back annotated elements of one rotation class."""
+	def __init__(self, rotation):
+		super(RotationStats, self).__init__()
+		self.rotation = rotation
+		self.deviation = array('d')
+		self.rotation_changes = 0
+		self.worst = None
+		self.largest = 0.0 # deviation of worst
+
+	def add(self, name, deviation, rotation_changed):
+		if not self.deviation or deviation > self.largest:
+			self.worst = name
+			self.largest = deviation
+		self.deviation.append(deviation)
+		if rotation_changed:
+			self.rotation_changes += 1
+
+	def max(self):
+		return self.largest
+
+	def mean(self):
+		return sum(self.deviation) / len(self.deviation) if self.deviation else 0.0
+
+	def __str__(self):
+		return (
+			str(self.rotation).rjust(8) + ' ' + str(len(self.deviation)).rjust(6) + ' '
+			+ ('%.6g' % self.max()).rjust(12) + ' ' + ('%.6g' % self.mean()).rjust(12) + ' '
+			+ str(self.rotation_changes).rjust(6) + ' ' + str(self.worst or '').rjust(12)
+		)
+
+
+def element_positions(brd_file):
+	"""Dict element name -> (x, y, rotation) of the elements of a board.
+
+	Reads the board with Swoop, like update_placements writes it; the lazy_board path is not used.
+	"""
+	import Swoop
+
+	brd = Swoop.EagleFile.from_file(brd_file)
+	positions = {}
+	for n in (Swoop.From(brd).
+		get_elements()
+	):
+		positions[n.get_name()] = (n.get_x(), n.get_y(), n.get_rot() or 'R0')
+	return positions
+
+
+def compare_positions(original, annotated):
+	"""Per rotation class statistics of the deviation between two element_positions() dicts."""
+	stats = {}
+	for name in sorted(original):
+		(x, y, rotation) = original[name]
+		s = stats.setdefault(rotation, RotationStats(rotation))
+		if name not in annotated:
+			s.add(name, float('inf'), True)
+			continue
+		(new_x, new_y, new_rotation) = annotated[name]
+		s.add(name, max(abs(new_x - x), abs(new_y - y)), new_rotation != rotation)
+	return stats
+
+
+def bookshelf_differences(reference_stem, stem, suffixes=BOOKSHELF_SUFFIXES):
+	"""First differing line of every bookshelf file of stem against reference_stem, the "Created" header lines aside."""
+	differences = []
+	for suffix in suffixes:
+		with open(reference_stem + '.' + suffix, 'r') as f:
+			expected = [l for l in f if not l.startswith('# Created')]
+		with open(stem + '.' + suffix, 'r') as f:
+			actual = [l for l in f if not l.startswith('# Created')]
+		for i, (a, b) in enumerate(zip(expected, actual)):
+			if a != b:
+				differences.append('.' + suffix + ' line ' + str(i + 1) + ': ' + repr(a.rstrip()) + ' != ' + repr(b.rstrip()))
+				break
+		else:
+			if len(expected) != len(actual):
+				differences.append('.' + suffix + ': ' + str(len(expected)) + ' != ' + str(len(actual)) + ' lines')
+	return differences
+
+
+def verify_board(brd_file, lazy=False, patch=False):
+	"""Round trip one board through bookshelf.
+
+	Returns (brd_file, stats, lazy differences, error string or None). stats maps 'swoop' to the
+	deviation from the original board and, with patch, 'patch' to the deviation of the patched board
+	from the Swoop back annotation. The lazy differences are those of bookshelf_differences().
+	"""
+	from eagle2bookshelf2012 import run_conversion
+	from bookshelf2eagle import update_placements
+
+	work = tempfile.mkdtemp(prefix='roundtrip')
+	try:
+		stem = os.path.join(work, 'board')
+		run_conversion(user_id='verify_roundtrip', project_name=stem, brd_file=brd_file)
+		update_placements(brd_file=brd_file, pl_file=stem + '.pl', out_file=stem + '.brd')
+		annotated = element_positions(stem + '.brd')
+		stats = {'swoop': compare_positions(element_positions(brd_file), annotated)}
+
+		differences = []
+		if lazy:
+			lazy_stem = os.path.join(work, 'lazy')
+			run_conversion(user_id='verify_roundtrip', project_name=lazy_stem, brd_file=brd_file, lazy=True)
+			differences = bookshelf_differences(stem, lazy_stem)
+
+		if patch:
+			update_placements(brd_file=brd_file, pl_file=stem + '.pl', out_file=stem + '.patch.brd', patch=True)
+			stats['patch'] = compare_positions(annotated, element_positions(stem + '.patch.brd'))
+
+		return (brd_file, stats, differences, None)
+	except Exception as e:
+		return (brd_file, None, None, repr(e))
+	finally:
+		shutil.rmtree(work, ignore_errors=True)
+
+
+def verify_corpus(brd_files, jobs=4, lazy=False, patch=False):
+	"""verify_board() over many boards in parallel, results in the order of brd_files."""
+	verify = functools.partial(verify_board, lazy=lazy, patch=patch)
+	if jobs <= 1 or len(brd_files) <= 1:
+		return [verify(b) for b in brd_files]
+	pool = multiprocessing.Pool(min(jobs, len(brd_files)))
+	try:
+		return pool.map(verify, brd_files)
+	finally:
+		pool.close()
+		pool.join()
+
+
+if __name__ == '__main__':
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='verify_roundtrip v0.1')
+	tolerance = float(arguments['--tolerance'])
+
+	failed = False
+	results = verify_corpus(
+		[str(b) for b in arguments['<BRD>']],
+		jobs=int(arguments['--jobs']),
+		lazy=arguments['--lazy'],
+		patch=arguments['--patch'],
+	)
+	for brd_file, stats, differences, error in results:
+		print(brd_file)
+		if error is not None:
+			print('\terror: ' + error)
+			failed = True
+			continue
+		for mode, title in (('swoop', 'round trip'), ('patch', 'patch against swoop back annotation')):
+			if mode not in stats:
+				continue
+			print(title)
+			print('rotation'.rjust(8) + ' ' + 'count'.rjust(6) + ' ' + 'max'.rjust(12) + ' ' + 'mean'.rjust(12) + ' ' + 'rot'.rjust(6) + ' ' + 'worst'.rjust(12))
+			for rotation in sorted(stats[mode]):
+				s = stats[mode][rotation]
+				print(s)
+				if s.max() > tolerance or s.rotation_changes:
+					failed = True
+		for d in differences:
+			print('\tlazy conversion differs: ' + d)
+			failed = True
+
+	sys.exit(1 if failed else 0)
@@ -0,0 +1,355 @@
+"""Wirelength.
+
+Wirelength estimates of the nets of a placed bookshelf problem: half perimeter (HPWL), rectilinear
+minimum spanning tree (RMST) and rectilinear Steiner minimal tree (RSMT). HPWL badly underestimates
+the wiring of high degree nets; the RSMT estimate is what a router needs at least.
+
+Pin positions come from the .pl lower left corners, the node sizes and the pin offsets of the .nets
+file (from the node center, turned with the orientation).
+  degree <= 3        the RSMT is the HPWL.
+  degree <= 4        exact RSMT from a lookup table: for each order of the pins in y (with the pins
+                     sorted in x) the table holds the gap coefficient vectors of the Steiner trees on
+                     the Hanan grid that can be optimal, and the length is the smallest dot product
+                     with the x and y gaps of the net. The table is filled the first time an order
+                     is seen.
+  larger degrees     RMST from candidate edges found with four sorted sweeps (the nearest neighbour
+                     of every pin in each octant) and Kruskal, O(n log n). The RSMT estimate merges
+                     pairs of tree edges at a pin through the median point of the three pins.
+Small nets use Prim on all pin pairs instead of the sweeps.
+The nets are split over --jobs worker processes.
+
+Usage:
+  wirelength.py -h | --help
+  wirelength.py <STEM_NAME> [--pl <PL>] [--jobs <N>] [--per_net <FILE>]
+
+-h --help                      Show this message.
+--pl PL                        The placement to evaluate instead of <STEM_NAME>.pl (.pl, or a binary .bsb).
+-j --jobs N                    Worker processes [default: 1].
+--per_net FILE                 Write the degree and the three estimates of every net as tab separated values.
+"""
+
+from __future__ import print_function
+
+LICENCE = """
+BSD 3-Clause License
+
+Copyright (c) 2015-2018, The Regents of the University of California
+All rights reserved.
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are met:
+
+* Redistributions of source code must retain the above copyright notice, this
+  list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright notice,
+  this list of conditions and the following disclaimer in the documentation
+  and/or other materials provided with the distribution.
+
+* Neither the name of the copyright holder nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import bisect
+import itertools
+import multiprocessing
+
+
+LUT_DEGREE = 4
+PRIM_DEGREE = 16 # larger nets use the sweeps
+ORIENT_ROTATION = {'N': 'R0', 'W': 'R90', 'S': 'R180', 'E': 'R270', 'FN': 'MR0', 'FW': 'MR90', 'FS': 'MR180', 'FE': 'MR270'}
+
+_lut = {} # order of the pins in y -> Pareto minimal gap coefficient vectors
+
+
+def _prufer_edges(sequence, m):
+	"""Edges of the tree on m nodes with this Prufer sequence."""
+	degree = [1] * m
+	for i in sequence:
+		degree[i] += 1
+	edges = []
+	for i in sequence:
+		leaf = min(j for j in range(m) if degree[j] == 1)
+		edges.append((leaf, i))
+		degree[leaf] -= 1
+		degree[i] -= 1
+	edges.append(tuple(j for j in range(m) if degree[j] == 1))
+	return edges
+
+
+def _steiner_sequences(n, k):
+	"""Prufer sequences of the trees on n pins plus k Steiner points (nodes n ..) where each Steiner point has degree 3 or more."""
+	m = n + k
+	required = [n + s for s in range(k) for _ in range(2)]
+	sequences = set()
+	for free in itertools.product(range(m), repeat=m - 2 - len(required)):
+		sequences.update(itertools.permutations(required + list(free)))
+	return sequences
+
+
+def _steiner_vectors(order):
+	"""Pareto minimal (x gaps + y gaps) coefficient vectors of the Steiner trees of the pins (i, order[i]) on the Hanan grid."""
+	n = len(order)
+	pins = [(i, order[i]) for i in range(n)]
+	others = [(i, j) for i in range(n) for j in range(n) if order[i] != j]
+	vectors = set()
+	for k in range(n - 1): # an RSMT needs at most n - 2 Steiner points
+		sequences = _steiner_sequences(n, k)
+		for steiner in itertools.combinations(others, k):
+			nodes = pins + list(steiner)
+			for sequence in sequences:
+				vector = [0] * (2 * (n - 1))
+				for (a, b) in _prufer_edges(sequence, n + k):
+					(xa, ya), (xb, yb) = nodes[a], nodes[b]
+					for g in range(min(xa, xb), max(xa, xb)):
+						vector[g] += 1
+					for g in range(min(ya, yb), max(ya, yb)):
+						vector[n - 1 + g] += 1
+				vectors.add(tuple(vector))
+	return [v for v in vectors if not any(w != v and all(a <= b for a, b in zip(w, v)) for w in vectors)]
+
+
+def hpwl(xs, ys):
+	if len(xs) < 2:
+		return 0.0
+	return (max(xs) - min(xs)) + (max(ys) - min(ys))
+
+
+def lut_rsmt(xs, ys):
+	"""Exact RSMT length of a net of at most LUT_DEGREE pins."""
+	n = len(xs)
+	by_x = sorted(range(n), key=lambda i: (xs[i], ys[i]))
+	by_y = sorted(range(n), key=lambda i: (ys[i], xs[i]))
+	rank = [0] * n
+	for r, i in enumerate(by_y):
+		rank[i] = r
+	order = tuple(rank[i] for i in by_x)
+	if order not in _lut:
+		_lut[order] = _steiner_vectors(order)
+	gaps = [xs[by_x[g + 1]] - xs[by_x[g]] for g in range(n - 1)] + [ys[by_y[g + 1]] - ys[by_y[g]] for g in range(n - 1)]
+	return min(sum(c * g for c, g in zip(vector, gaps)) for vector in _lut[order])
+
+
+def prim_edges(xs, ys):
+	"""RMST edges (length, i, j) from all pin pairs, O(n^2)."""
+	n = len(xs)
+	distance = [abs(xs[i] - xs[0]) + abs(ys[i] - ys[0]) for i in range(n)]
+	parent = [0] * n
+	done = [False] * n
+	done[0] = True
+	edges = []
+	for _ in range(n - 1):
+		j = min((i for i in range(n) if not done[i]), key=distance.__getitem__)
+		done[j] = True
+		edges.append((distance[j], parent[j], j))
+		for i in range(n):
+			if not done[i]:
+				d = abs(xs[i] - xs[j]) + abs(ys[i] - ys[j])
+				if d < distance[i]:
+					distance[i] = d
+					parent[i] = j
+	return edges
+
+
+def sweep_edges(xs, ys):
+	"""Candidate RMST edges (length, i, j): the nearest neighbour of every pin in each octant, from four sorted sweeps."""
+	n = len(xs)
+	px = list(xs)
+	py = list(ys)
+	edges = []
+	for k in range(4):
+		keys = [] # -y of the active pins, ascending
+		active = []
+		for i in sorted(range(n), key=lambda i: px[i] + py[i]):
+			at = bisect.bisect_left(keys, -py[i])
+			end = at
+			while end < len(keys):
+				j = active[end]
+				if py[i] - py[j] > px[i] - px[j]:
+					break
+				edges.append((abs(xs[i] - xs[j]) + abs(ys[i] - ys[j]), i, j))
+				end += 1
+			del keys[at:end]
+			del active[at:end]
+			if at < len(keys) and keys[at] == -py[i]:
+				active[at] = i
+			else:
+				keys.insert(at, -py[i])
+				active.insert(at, i)
+		if k & 1:
+			px = [-x for x in px]
+		else:
+			px, py = py, px
+	return edges
+
+
+def mst_edges(xs, ys):
+	"""RMST edges (length, i, j) of a net."""
+	n = len(xs)
+	if n <= PRIM_DEGREE:
+		return prim_edges(xs, ys)
+	parent = list(range(n))
+	def find(i):
+		while parent[i] != i:
+			parent[i] = parent[parent[i]]
+			i = parent[i]
+		return i
+	edges = []
+	for (d, i, j) in sorted(sweep_edges(xs, ys)):
+		(a, b) = (find(i), find(j))
+		if a != b:
+			parent[a] = b
+			edges.append((d, i, j))
+	return edges
+
+
+def steiner_gain(xs, ys, edges):
+	"""Length saved by joining pairs of tree edges at a pin through the median of the three pins, each edge used once."""
+	neighbours = {}
+	for (d, i, j) in edges:
+		neighbours.setdefault(i, []).append(j)
+		neighbours.setdefault(j, []).append(i)
+	candidates = []
+	for v, others in neighbours.items():
+		for (a, b) in itertools.combinations(others, 2):
+			mx = sorted((xs[v], xs[a], xs[b]))[1]
+			my = sorted((ys[v], ys[a], ys[b]))[1]
+			gain = abs(xs[v] - mx) + abs(ys[v] - my)
+			if gain > 0:
+				candidates.append((gain, v, a, b))
+	candidates.sort(reverse=True)
+	used = set()
+	total = 0.0
+	for (gain, v, a, b) in candidates:
+		(ea, eb) = ((min(v, a), max(v, a)), (min(v, b), max(v, b)))
+		if ea not in used and eb not in used:
+			used.add(ea)
+			used.add(eb)
+			total += gain
+	return total
+
+
+def estimate(xs, ys):
+	"""(HPWL, RMST, RSMT) of the pins of one net."""
+	n = len(xs)
+	h = hpwl(xs, ys)
+	if n <= 2:
+		return (h, h, h)
+	edges = mst_edges(xs, ys)
+	rmst = sum(e[0] for e in edges)
+	if n == 3:
+		return (h, rmst, h)
+	if n <= LUT_DEGREE:
+		return (h, rmst, lut_rsmt(xs, ys))
+	return (h, rmst, rmst - steiner_gain(xs, ys, edges))
+
+
+def rsmt(xs, ys):
+	"""RSMT estimate of the pins of one net."""
+	return estimate(xs, ys)[2]
+
+
+def _estimate_chunk(nets):
+	return [estimate(xs, ys) for (xs, ys) in nets]
+
+
+def estimate_nets(nets, jobs=1):
+	"""(HPWL, RMST, RSMT) of every net of nets [(xs, ys)], in jobs worker processes if jobs > 1."""
+	nets = list(nets)
+	if jobs <= 1 or len(nets) < 2:
+		return _estimate_chunk(nets)
+	# the pin count of nets varies a lot, deal them out round robin so the chunks cost about the same
+	count = min(len(nets), 4 * jobs)
+	pool = multiprocessing.Pool(min(jobs, count))
+	try:
+		results = pool.map(_estimate_chunk, [nets[c::count] for c in range(count)])
+	finally:
+		pool.close()
+		pool.join()
+	estimates = [None] * len(nets)
+	for c, chunk in enumerate(results):
+		estimates[c::count] = chunk
+	return estimates
+
+
+def net_points(data):
+	"""[(xs, ys)] pin positions of every net of a placed bookshelf_bin.BookshelfData."""
+	from bookshelf_bin import ORIENTATIONS
+	from eagle2bookshelf2012 import ORIENTATIONS as TRANSFORMS
+
+	transforms = [TRANSFORMS[ORIENT_ROTATION[o]] for o in ORIENTATIONS]
+	centers = []
+	for i in range(len(data.node_names)):
+		(w, h) = (data.node_width[i], data.node_height[i])
+		if transforms[data.pl_orient[i]][0]:
+			(w, h) = (h, w)
+		centers.append((data.pl_x[i] + w / 2.0, data.pl_y[i] + h / 2.0))
+
+	nets = []
+	for k in range(len(data.net_names)):
+		xs = []
+		ys = []
+		for j in range(data.net_start[k], data.net_start[k + 1]):
+			i = data.pin_node[j]
+			(swap, sx, sy) = transforms[data.pl_orient[i]]
+			(dx, dy) = (data.pin_y[j], data.pin_x[j]) if swap else (data.pin_x[j], data.pin_y[j])
+			xs.append(centers[i][0] + sx * dx)
+			ys.append(centers[i][1] + sy * dy)
+		nets.append((xs, ys))
+	return nets
+
+
+def load_placed(project_name, pl_file=None):
+	"""BookshelfData of <project_name>.* with the placement of pl_file (default <project_name>.pl)."""
+	from bookshelf_reader import read_design, read_pl
+	import bookshelf_bin
+
+	data = read_design(project_name)
+	if pl_file is not None:
+		if pl_file.endswith('.bsb'):
+			placed = bookshelf_bin.load(pl_file, copy=True)
+			assert placed.node_names == data.node_names, pl_file + ' is not a placement of ' + project_name
+			(data.has_placement, data.pl_x, data.pl_y, data.pl_orient, data.pl_fixed) = (True, placed.pl_x, placed.pl_y, placed.pl_orient, placed.pl_fixed)
+		else:
+			read_pl(pl_file, data)
+	assert data.has_placement, 'no placement for ' + project_name
+	return data
+
+
+if __name__ == '__main__':
+	import time
+	from docopt import docopt
+
+	arguments = docopt(__doc__, version='wirelength v0.1')
+	project_name = str(arguments['<STEM_NAME>'])
+	data = load_placed(project_name, str(arguments['--pl']) if arguments['--pl'] else None)
+
+	start = time.time()
+	estimates = estimate_nets(net_points(data), jobs=int(arguments['--jobs']))
+	seconds = time.time() - start
+
+	totals = [sum(w * e[k] for w, e in zip(data.net_weight, estimates)) for k in range(3)]
+	print('nets: ' + str(len(estimates)) + ', pins: ' + str(data.num_pins()))
+	for name, total in zip(('hpwl', 'rmst', 'rsmt'), totals):
+		print(name + ': ' + str(round(total, 4)))
+	print('rsmt / hpwl: ' + str(round(totals[2] / max(totals[0], 1e-12), 4)))
+	print(str(round(seconds, 3)) + ' s')
+
+	if arguments['--per_net']:
+		with open(str(arguments['--per_net']), 'w') as f:
+			f.write('net\tdegree\thpwl\trmst\trsmt\n')
+			for k, e in enumerate(estimates):
+				degree = data.net_start[k + 1] - data.net_start[k]
+				f.write(data.net_names[k] + '\t' + str(degree) + '\t' + '\t'.join(repr(v) for v in e) + '\n')
@@ -43,9 +43,6 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 
-import lxml
-from lxml import etree
-from docopt import docopt
 import datetime
 
 
@@ -73,6 +70,7 @@ class Pose(object):
 
 	@staticmethod # all these classes should have a static method like this to initialize
 	def from_etree(root): # this type of initializer might have to take dicts from the rest of the design for other classes (like package info)
+		from lxml import etree
 		assert root.tag == 'POSE'
 		x = root.get('x')
 		y = root.get('y')
@@ -136,6 +134,8 @@ class Rectangle(object):
 
 
 def run_conversion(xml_file, project_name):
+	from lxml import etree
+
 	with open(xml_file, 'r') as f:
 		s = f.read()
 
@@ -295,9 +295,16 @@ def run_conversion(xml_file, project_name):
 		file.write(pl_header + pl_str)
 
 
-if __name__ == '__main__':
-	arguments = docopt(__doc__, version='xml2bookshelf v0.1')
+def main(argv=None):
+	from docopt import docopt
+
+	arguments = docopt(__doc__, argv=argv, version='xml2bookshelf v0.1')
 	run_conversion(
 		xml_file=str(arguments['<XML>']), 
 		project_name=str(arguments['<PROJECT_NAME>'])
-	)
\ No newline at end of file
+	)
+
+
+if __name__ == '__main__':
+	import conversion_daemon
+	conversion_daemon.run_cli('xml2bookshelf', main)
\ No newline at end of file